@@ -320,4 +320,11 @@ class StudentTutorialGroup(Base):
     studentModulesID: Mapped[int] = mapped_column(ForeignKey("studentmodules.studentModulesID"))
     enrollment: Mapped[StudentModules] = relationship(back_populates="tutorial_assignments")
     tutorialGroupID: Mapped[int] = mapped_column(ForeignKey("tutorialgroups.tutorialGroupsID"))
-    group: Mapped[TutorialsGroup] = relationship(back_populates="student_assignments")
\ No newline at end of file
+    group: Mapped[TutorialsGroup] = relationship(back_populates="student_assignments")
+
+class ProcessedSnapshot(Base): # Camera snapshots already applied (Idempotency-Key of /attendance/auto)
+    __tablename__ = "processed_snapshots"
+
+    idempotencyKey: Mapped[str] = mapped_column(String(128), primary_key=True)
+    response: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    processedAt: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now())
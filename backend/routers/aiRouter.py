@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Header, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, text
 from database.db_config import get_db
@@ -13,6 +13,10 @@ from PIL import Image
 import cv2
 import asyncio
 import re
+import threading
+import time
+import base64
+import hashlib
 from database.db import studentAngles
 from sqlalchemy.dialects.postgresql import insert
 
@@ -120,11 +124,12 @@ def _studentangles_create_record(db: Session, *, student_uuid: str, angle: str,
         return False
 
 try:
-    from database.db import Student, EntLeave, AttdCheck
+    from database.db import Student, EntLeave, AttdCheck, ProcessedSnapshot
 except Exception:
     Student = None
     EntLeave = None
     AttdCheck = None
+    ProcessedSnapshot = None
 
 router = APIRouter()
 
@@ -132,6 +137,9 @@ class Detection(BaseModel):
     student_num: str
     accuracy: float = Field(..., ge=0.0, le=1.0)
     cnn: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    # camera-side track aggregation: frames the student was seen in, agreeing recognitions
+    frames: Optional[int] = Field(default=None, ge=0)
+    votes: Optional[int] = Field(default=None, ge=0)
 
 class AttendanceSnapshot(BaseModel):
     lesson_id: int
@@ -259,6 +267,63 @@ class AutoAttendanceSnapshot(BaseModel):
     location: Optional[LocationInfo] = None
 
 
+# ============================
+# IDEMPOTENCY (camera spool replays)
+# ============================
+# Camera clients spool snapshots and retry them after network drops, sending the
+# same Idempotency-Key each time. The key is stored in processed_snapshots in the
+# same transaction as the attendance writes, so a replayed key (from any worker,
+# or after a restart) returns the first response instead of being processed again.
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_PRUNE_EVERY_SECONDS = 3600
+
+_IDEMPOTENCY_LAST_PRUNE = 0.0
+
+def _idempotency_claim(db: Session, key: str) -> Optional[Dict[str, Any]]:
+    """
+    Claims the key in processed_snapshots inside the caller's transaction.
+    Returns None when the key is new (the caller processes the snapshot and
+    commits the key together with its writes), or the stored response when the
+    key was already applied. A concurrent request with the same key waits on the
+    primary key until the first one commits or rolls back. Raises 409 when the
+    key is taken but its stored response can't be read.
+    """
+    for _ in range(3):
+        claimed = db.execute(
+            insert(ProcessedSnapshot)
+            .values(idempotencyKey=key)
+            .on_conflict_do_nothing(index_elements=["idempotencyKey"])
+            .returning(ProcessedSnapshot.idempotencyKey)
+        ).first()
+        if claimed is not None:
+            return None
+        db.rollback()
+        row = db.query(ProcessedSnapshot).filter(ProcessedSnapshot.idempotencyKey == key).first()
+        if row is None:
+            continue    # pruned since the conflict: claim it again
+        if row.response:
+            return dict(row.response)
+        break
+    raise HTTPException(
+        status_code=409,
+        detail=f"Idempotency-Key {key} was already used but its result is not available",
+    )
+
+def _idempotency_prune(db: Session) -> None:
+    global _IDEMPOTENCY_LAST_PRUNE
+    now = time.time()
+    if now - _IDEMPOTENCY_LAST_PRUNE < IDEMPOTENCY_PRUNE_EVERY_SECONDS:
+        return
+    _IDEMPOTENCY_LAST_PRUNE = now
+    try:
+        cutoff = datetime.now() - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        db.query(ProcessedSnapshot).filter(ProcessedSnapshot.processedAt < cutoff).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print("[AI attendance/auto] idempotency prune failed:", repr(e))
+
+
 def _find_student_active_lesson_id(
     db: Session,
     *,
@@ -319,26 +384,37 @@ def _find_student_active_lesson_id(
 @router.get("/attendance/today-lessons")
 def attendance_today_lessons(
     db: Session = Depends(get_db),
-    max_lesson_hours: int = Query(6, description="Ignore lessons longer than this (prevents bad test data hijacking active lesson)")
+    max_lesson_hours: int = Query(6, description="Ignore lessons longer than this (prevents bad test data hijacking active lesson)"),
+    building: Optional[str] = Query(None, description="Only lessons in this building (camera clients)"),
+    room: Optional[str] = Query(None, description="Only lessons in this room (camera clients)"),
 ):
     now = datetime.now()
     day_start = datetime(now.year, now.month, now.day)
     day_end = day_start + timedelta(days=1)
 
+    sql = """
+        SELECT "lessonID", "startDateTime", "endDateTime"
+        FROM public.lessons
+        WHERE "startDateTime" >= :ds
+          AND "startDateTime" < :de
+          AND ("endDateTime" - "startDateTime") <= (:max_hours || ' hours')::interval
+    """
+    params: Dict[str, Any] = {"ds": day_start, "de": day_end, "max_hours": int(max_lesson_hours)}
+
+    # only enforce if provided
+    building = (building or "").strip() or None
+    room = (room or "").strip() or None
+    if building:
+        sql += ' AND "building" = :b'
+        params["b"] = building
+    if room:
+        sql += ' AND "room" = :r'
+        params["r"] = room
+
+    sql += ' ORDER BY "startDateTime" ASC'
+
     try:
-        rows = db.execute(
-            text(
-                """
-                SELECT "lessonID", "startDateTime", "endDateTime"
-                FROM public.lessons
-                WHERE "startDateTime" >= :ds
-                  AND "startDateTime" < :de
-                  AND ("endDateTime" - "startDateTime") <= (:max_hours || ' hours')::interval
-                ORDER BY "startDateTime" ASC
-                """
-            ),
-            {"ds": day_start, "de": day_end, "max_hours": int(max_lesson_hours)},
-        ).fetchall()
+        rows = db.execute(text(sql), params).fetchall()
 
         lessons = []
         for r in rows:
@@ -355,14 +431,224 @@ def attendance_today_lessons(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================
+# ROSTER GALLERY (per-room candidate set for camera clients)
+# ============================
+# Camera clients only need to tell apart the students who can be in their room
+# right now. The campus gallery (gallery.npz from temp_MS/train_gallery.py) is
+# loaded here once, and each request gets the rows of the students enrolled in
+# the active / next lesson of that room.
+FACE_GALLERY_PATH = os.getenv("FACE_GALLERY_PATH", "gallery.npz")
+FACE_GALLERY_STORAGE_PATH = os.getenv("FACE_GALLERY_STORAGE_PATH", "models/gallery.npz")
+FACE_GALLERY_RECHECK_SECONDS = int(os.getenv("FACE_GALLERY_RECHECK_SECONDS", "300"))
+ROSTER_WINDOW_MINUTES = int(os.getenv("ROSTER_WINDOW_MINUTES", "30"))
+
+_FACE_GALLERY_LOCK = threading.Lock()
+_FACE_GALLERY: Dict[str, Any] = {"version": None, "data": None, "checked_ts": 0.0}
+
+def _load_face_gallery() -> Optional[Dict[str, Any]]:
+    """
+    Returns the campus gallery (local FACE_GALLERY_PATH, else the bucket copy),
+    re-checked for a new version every FACE_GALLERY_RECHECK_SECONDS.
+    """
+    now = time.time()
+    with _FACE_GALLERY_LOCK:
+        if _FACE_GALLERY["data"] is not None and now - _FACE_GALLERY["checked_ts"] < FACE_GALLERY_RECHECK_SECONDS:
+            return _FACE_GALLERY["data"]
+        _FACE_GALLERY["checked_ts"] = now
+
+        raw = None
+        try:
+            if os.path.exists(FACE_GALLERY_PATH):
+                with open(FACE_GALLERY_PATH, "rb") as f:
+                    raw = f.read()
+            elif supabase is not None:
+                raw = supabase.storage.from_(SUPABASE_BUCKET).download(FACE_GALLERY_STORAGE_PATH)
+        except Exception as e:
+            print("[AI roster] gallery load failed:", repr(e))
+
+        if not raw:
+            return _FACE_GALLERY["data"]
+
+        version = hashlib.sha1(raw).hexdigest()[:16]
+        if version == _FACE_GALLERY["version"]:
+            return _FACE_GALLERY["data"]
+
+        try:
+            with np.load(io.BytesIO(raw), allow_pickle=False) as z:
+                label_names = [str(x) for x in z["label_names"]]
+                data = {
+                    "matrix": np.ascontiguousarray(z["matrix"], dtype=np.float32),
+                    "row_labels": np.asarray(z["row_labels"], dtype=np.int64),
+                    "label_names": label_names,
+                    "threshold": float(z["threshold"]),
+                    "margin": float(z["margin"]),
+                    "mode": str(z["mode"]),
+                    # embedder signature (temp_MS/embedding.py); older galleries don't carry one
+                    "embedder": (str(z["embedder"]) or None) if "embedder" in z.files else None,
+                    "version": version,
+                }
+        except Exception as e:
+            print("[AI roster] gallery parse failed:", repr(e))
+            return _FACE_GALLERY["data"]
+
+        # student number -> gallery label index
+        data["label_index"] = {_normalize_student_num(n): i for i, n in enumerate(label_names)}
+        _FACE_GALLERY["data"] = data
+        _FACE_GALLERY["version"] = version
+        print(f"[AI roster] gallery {version}: {len(label_names)} students, {data['matrix'].shape[0]} rows")
+        return data
+
+def _room_roster(
+    db: Session,
+    *,
+    at_time: datetime,
+    window_minutes: int,
+    building: Optional[str] = None,
+    room: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Lessons in the room that are active at at_time or start within window_minutes,
+    and the student numbers enrolled in them (same rules as _find_student_active_lesson_id).
+    """
+    sql = """
+        SELECT l."lessonID", l."startDateTime", l."endDateTime", s."studentNum"
+        FROM public.lessons l
+        JOIN public.lecmods lm
+          ON lm."lecModID" = l."lecModID"
+        JOIN public.studentmodules sm
+          ON sm."modulesID" = lm."moduleID"
+        JOIN public.students s
+          ON s."studentID" = sm."studentID"
+        LEFT JOIN public.studenttutorialgroups stg
+          ON stg."studentModulesID" = sm."studentModulesID"
+        WHERE l."endDateTime" >= :t
+          AND l."startDateTime" <= :t_end
+    """
+    params: Dict[str, Any] = {"t": at_time, "t_end": at_time + timedelta(minutes=window_minutes)}
+
+    if building:
+        sql += ' AND l."building" = :b'
+        params["b"] = building
+    if room:
+        sql += ' AND l."room" = :r'
+        params["r"] = room
+
+    sql += """
+          AND (
+                l."tutorialGroupID" IS NULL
+             OR stg."tutorialGroupID" = l."tutorialGroupID"
+          )
+    """
+
+    rows = db.execute(text(sql), params).fetchall()
+
+    lessons: Dict[int, Dict[str, Any]] = {}
+    student_nums = set()
+    for lid, start, end, sn in rows:
+        lessons.setdefault(int(lid), {
+            "lesson_id": int(lid),
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None,
+        })
+        if sn:
+            student_nums.add(_normalize_student_num(str(sn)))
+
+    return sorted(lessons.values(), key=lambda L: L["start"] or ""), sorted(student_nums)
+
+
+@router.get("/attendance/roster-gallery")
+def attendance_roster_gallery(
+    response: Response,
+    building: Optional[str] = Query(None),
+    room: Optional[str] = Query(None),
+    at: Optional[datetime] = Query(None, description="Defaults to now"),
+    window_minutes: int = Query(ROSTER_WINDOW_MINUTES, ge=0, le=24 * 60),
+    if_none_match: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db),
+):
+    """
+    Compact face gallery for one room: embeddings of the students enrolled in the
+    active or next lesson. Embeddings are base64 float32 (rows x dim, row-major);
+    row_labels index into label_names. `embedder` is the signature of the model
+    the embeddings came from; cameras using another one must not match against
+    them. Send the returned ETag as If-None-Match to get 304 while the roster and
+    the gallery are unchanged.
+    """
+    gallery = _load_face_gallery()
+    if gallery is None:
+        raise HTTPException(status_code=503, detail="Face gallery not available on the server")
+
+    building = (building or "").strip() or None
+    room = (room or "").strip() or None
+    at_time = at or datetime.now()
+
+    try:
+        lessons, student_nums = _room_roster(
+            db, at_time=at_time, window_minutes=window_minutes, building=building, room=room
+        )
+    except Exception as e:
+        print("[AI roster] ERROR:", repr(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    label_index = gallery["label_index"]
+    known = [sn for sn in student_nums if sn in label_index]
+    missing = [sn for sn in student_nums if sn not in label_index]
+
+    etag_src = "|".join([gallery["version"], gallery["embedder"] or "", ",".join(str(L["lesson_id"]) for L in lessons), ",".join(known)])
+    etag = '"' + hashlib.sha1(etag_src.encode("utf-8")).hexdigest()[:20] + '"'
+    response.headers["ETag"] = etag
+    if if_none_match and if_none_match.strip() == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # gallery rows of the roster students, labels re-indexed 0..k-1
+    old_idx = np.array([label_index[sn] for sn in known], dtype=np.int64)
+    remap = np.full(len(gallery["label_names"]), -1, dtype=np.int64)
+    remap[old_idx] = np.arange(len(old_idx))
+    new_labels = remap[gallery["row_labels"]]
+    rows = new_labels >= 0
+
+    matrix = np.ascontiguousarray(gallery["matrix"][rows], dtype="<f4")
+
+    return {
+        "ok": True,
+        "version": etag.strip('"'),
+        "gallery_version": gallery["version"],
+        "building": building,
+        "room": room,
+        "at": at_time.isoformat(),
+        "lessons": lessons,
+        "threshold": gallery["threshold"],
+        "margin": gallery["margin"],
+        "mode": gallery["mode"],
+        "embedder": gallery["embedder"],
+        "label_names": [gallery["label_names"][i] for i in old_idx],
+        "row_labels": new_labels[rows].astype(int).tolist(),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "embeddings": base64.b64encode(matrix.tobytes()).decode("ascii"),
+        "missing_embeddings": missing,
+    }
+
+
 @router.post("/attendance/auto")
-def post_attendance_auto(payload: AutoAttendanceSnapshot, db: Session = Depends(get_db)):
-    if Student is None or EntLeave is None or AttdCheck is None:
+def post_attendance_auto(
+    payload: AutoAttendanceSnapshot,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    if Student is None or EntLeave is None or AttdCheck is None or ProcessedSnapshot is None:
         raise HTTPException(
             status_code=500,
-            detail="Model import failed (Student/EntLeave/AttdCheck). Fix database.db imports.",
+            detail="Model import failed (Student/EntLeave/AttdCheck/ProcessedSnapshot). Fix database.db imports.",
         )
 
+    idempotency_key = (idempotency_key or "").strip()[:128] or None
+    if idempotency_key:
+        _idempotency_prune(db)
+        applied = _idempotency_claim(db, idempotency_key)
+        if applied is not None:
+            return {**applied, "replayed": True}
+
     created_logs = 0
     marked_present = 0
     updated_present = 0
@@ -465,6 +751,24 @@ def post_attendance_auto(payload: AutoAttendanceSnapshot, db: Session = Depends(
 
                 updated_present += 1
 
+        resp = {
+            "ok": True,
+            "lesson_id": resolved_lesson_id,
+            "captured_at": payload.captured_at.isoformat(),
+            "logs_created": created_logs,
+            "marked_present_count": marked_present,
+            "updated_present_count": updated_present,
+            "unknown_students": unknown_students,
+            "not_in_lesson": not_in_lesson,
+            # optional debug:
+            "location_used": {"building": building, "room": room},
+        }
+        if idempotency_key:
+            # same transaction as the attendance writes: the key is applied only if they are
+            db.query(ProcessedSnapshot).filter(
+                ProcessedSnapshot.idempotencyKey == idempotency_key
+            ).update({"response": resp}, synchronize_session=False)
+
         db.commit()
 
     except Exception as e:
@@ -472,18 +776,7 @@ def post_attendance_auto(payload: AutoAttendanceSnapshot, db: Session = Depends(
         print("[AI attendance/auto] ERROR:", repr(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-    return {
-        "ok": True,
-        "lesson_id": resolved_lesson_id,
-        "captured_at": payload.captured_at.isoformat(),
-        "logs_created": created_logs,
-        "marked_present_count": marked_present,
-        "updated_present_count": updated_present,
-        "unknown_students": unknown_students,
-        "not_in_lesson": not_in_lesson,
-        # optional debug:
-        "location_used": {"building": building, "room": room},
-    }
+    return resp
 
 
 # =========================================================
@@ -0,0 +1,221 @@
+# activity.py
+# Schedule-aware idle mode for room recognisers.
+# - ActivityScheduler: "active" while a lesson in this room is running or about to
+#   start (or shortly after it ended), or for a while after motion; "idle" otherwise
+# - MotionDetector: cheap frame differencing on a small blurred grey image, used
+#   while idle instead of face detection + recognition
+# - DetectionScheduler: while active, decides per frame whether HOG detection
+#   runs, from motion near tracked faces / entrances (fast) down to a ceiling
+#   interval when the scene is static
+# Time spent in each state is accumulated for the stats line / metrics endpoint.
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cv2
+
+ACTIVE = "active"
+IDLE = "idle"
+
+
+class MotionDetector:
+    def __init__(self, width: int = 160, pixel_thresh: int = 25, min_area: float = 0.01):
+        self.width = width
+        self.pixel_thresh = pixel_thresh
+        self.min_area = min_area      # fraction of pixels that must change
+        self._prev = None
+        self.mask = None              # changed pixels of the last update (small image)
+        self.last_score = 0.0
+
+    def update(self, frame_bgr) -> bool:
+        """
+        Returns True if this frame differs enough from the previous checked frame.
+        """
+        H, W = frame_bgr.shape[:2]
+        scale = self.width / float(W) if W > self.width else 1.0
+        small = cv2.resize(frame_bgr, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame_bgr
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        prev, self._prev = self._prev, gray
+        if prev is None or prev.shape != gray.shape:
+            return False
+
+        diff = cv2.absdiff(prev, gray)
+        self.mask = cv2.threshold(diff, self.pixel_thresh, 255, cv2.THRESH_BINARY)[1]
+        self.last_score = cv2.countNonZero(self.mask) / float(diff.size)
+        return self.last_score >= self.min_area
+
+    def score_in(self, box, frame_w: int, frame_h: int) -> float:
+        """
+        Fraction of changed pixels inside a full-res (x1, y1, x2, y2) box.
+        """
+        if self.mask is None:
+            return 0.0
+        h, w = self.mask.shape[:2]
+        sx, sy = w / float(frame_w), h / float(frame_h)
+        x1, y1 = max(0, int(box[0] * sx)), max(0, int(box[1] * sy))
+        x2, y2 = min(w, int(box[2] * sx) + 1), min(h, int(box[3] * sy) + 1)
+        if x2 <= x1 or y2 <= y1:
+            return 0.0
+        region = self.mask[y1:y2, x1:x2]
+        return cv2.countNonZero(region) / float(region.size)
+
+    def reset(self):
+        self._prev = None
+        self.mask = None
+
+
+class ActivityScheduler:
+    """
+    Thread-safe: the main loop calls update() with the current lesson list, the
+    detect stage reports motion and reads `active`.
+    lessons: list of {"start": datetime, "end": datetime, ...} (from today-lessons).
+    lessons=None means the schedule is unknown (backend unreachable): stay active.
+    """
+
+    def __init__(self, warmup_minutes: float = 10, cooldown_minutes: float = 5, motion_hold_seconds: float = 120):
+        self.warmup = timedelta(minutes=warmup_minutes)
+        self.cooldown = timedelta(minutes=cooldown_minutes)
+        self.motion_hold_seconds = motion_hold_seconds
+
+        self._lock = threading.Lock()
+        self.state = ACTIVE
+        self.reason = "startup"
+        self._since_ts = time.time()
+        self._seconds = {ACTIVE: 0.0, IDLE: 0.0}
+        self.last_motion_ts = 0.0
+        self.transitions = 0
+
+    @property
+    def active(self) -> bool:
+        return self.state == ACTIVE
+
+    def lesson_window(self, now_dt: datetime, lessons):
+        """
+        Returns the lesson that keeps the pipeline up (running, starting within
+        warmup, or ended within cooldown), or None.
+        """
+        for L in lessons or []:
+            if L["start"] - self.warmup <= now_dt <= L["end"] + self.cooldown:
+                return L
+        return None
+
+    def motion(self, ts: float = None):
+        """
+        Motion seen while idle: wake up right away instead of at the next update().
+        """
+        now_ts = ts or time.time()
+        self.last_motion_ts = now_ts
+        with self._lock:
+            if self.state == IDLE:
+                self._seconds[IDLE] += now_ts - self._since_ts
+                self._since_ts = now_ts
+                self.state, self.reason = ACTIVE, "motion"
+                self.transitions += 1
+                print("[IDLE] ACTIVE (motion)")
+
+    def update(self, now_dt: datetime = None, lessons=None, now_ts: float = None) -> str:
+        now_dt = now_dt or datetime.now()
+        now_ts = now_ts or time.time()
+
+        if lessons is None:
+            state, reason = ACTIVE, "schedule unknown"
+        elif self.lesson_window(now_dt, lessons) is not None:
+            state, reason = ACTIVE, "lesson"
+        elif now_ts - self.last_motion_ts < self.motion_hold_seconds:
+            state, reason = ACTIVE, "motion"
+        else:
+            state, reason = IDLE, "no lesson"
+
+        with self._lock:
+            self._seconds[self.state] += now_ts - self._since_ts
+            self._since_ts = now_ts
+            self.reason = reason
+            if state != self.state:
+                self.state = state
+                self.transitions += 1
+                print(f"[IDLE] {state.upper()} ({reason})")
+        return state
+
+    def seconds_in(self, state: str) -> float:
+        with self._lock:
+            extra = (time.time() - self._since_ts) if state == self.state else 0.0
+            return self._seconds[state] + extra
+
+    def summary(self) -> str:
+        return (f"state={self.state}({self.reason}) active={self.seconds_in(ACTIVE)/60:.0f}m "
+                f"idle={self.seconds_in(IDLE)/60:.0f}m")
+
+
+class DetectionScheduler:
+    """
+    Adaptive detection interval for the detect stage.
+    - motion near a tracked face or in an entrance region: detect at target_fps
+    - motion elsewhere: detect at half that rate
+    - static scene: the interval doubles after every detection, up to max_staleness
+    entrances: list of (x1, y1, x2, y2) frame fractions (doors, aisles), or None.
+    """
+
+    def __init__(self, target_fps: float = 5.0, max_staleness: float = 2.0, entrances=None,
+                 face_margin: float = 0.5, region_area: float = 0.02, motion: MotionDetector = None):
+        self.min_gap = 1.0 / max(0.1, target_fps)
+        self.max_staleness = max(self.min_gap, max_staleness)
+        self.entrances = list(entrances or [])
+        self.face_margin = face_margin      # grow face boxes by this fraction of their size
+        self.region_area = region_area      # changed fraction that counts as motion in a region
+        self.motion = motion or MotionDetector()
+
+        self.gap = self.min_gap
+        self.last_detect_ts = 0.0
+        self.reason = "startup"
+        self.frames = 0
+        self.detections = 0
+
+    def _near_faces(self, boxes, W, H) -> bool:
+        for x1, y1, x2, y2 in boxes:
+            mx, my = (x2 - x1) * self.face_margin, (y2 - y1) * self.face_margin
+            if self.motion.score_in((x1 - mx, y1 - my, x2 + mx, y2 + my), W, H) >= self.region_area:
+                return True
+        return False
+
+    def _at_entrance(self, W, H) -> bool:
+        for ex1, ey1, ex2, ey2 in self.entrances:
+            if self.motion.score_in((ex1 * W, ey1 * H, ex2 * W, ey2 * H), W, H) >= self.region_area:
+                return True
+        return False
+
+    def should_detect(self, frame_bgr, ts: float, track_boxes=()) -> bool:
+        """
+        Call once per frame (before tracker.update/predict) with the current track boxes.
+        """
+        self.frames += 1
+        H, W = frame_bgr.shape[:2]
+        moving = self.motion.update(frame_bgr)
+
+        if self._near_faces(track_boxes, W, H) or self._at_entrance(W, H):
+            self.gap, self.reason = self.min_gap, "faces/entrance"
+        elif moving:
+            self.gap, self.reason = min(self.max_staleness, self.min_gap * 2.0), "motion"
+        else:
+            self.reason = "static"
+
+        if ts - self.last_detect_ts < self.gap:
+            return False
+
+        self.last_detect_ts = ts
+        self.detections += 1
+        if self.reason == "static":
+            # back off until something moves again
+            self.gap = min(self.max_staleness, self.gap * 2.0)
+        return True
+
+    def force(self):
+        """
+        Detect on the next frame (e.g. after waking from idle).
+        """
+        self.last_detect_ts = 0.0
+        self.gap = self.min_gap
+
+    @property
+    def detect_ratio(self) -> float:
+        return self.detections / float(self.frames) if self.frames else 0.0
@@ -1,16 +1,111 @@
 # antispoof.py
+# EfficientNet-B0 REAL/SPOOF classifier on ONNX Runtime.
+# The model variant (FP32 or an INT8 build from quantize_antispoof.py) is picked
+# at import: the fastest one in antispoof_variants.json that passes the accuracy
+# gate below, FP32 otherwise. Session options come from env vars (ANTISPOOF_*).
+import json
+import os
 import onnxruntime as ort
 import numpy as np
 import cv2
 
+from preprocess import batch_nchw, to_nchw
+
 MODEL_PATH = "antispoof_best.onnx"
 INPUT_SIZE = 112
 TEMPERATURE = 2.5   # <<< VERY IMPORTANT (tuned for replay)
+MAX_BATCH = 64      # initial size of the per-thread batch tensor (grows if needed)
+
+# ==============================
+# VARIANT SELECTION
+# ==============================
+VARIANTS_FILE = "antispoof_variants.json"       # written by quantize_antispoof.py
+ANTISPOOF_VARIANT = os.getenv("ANTISPOOF_VARIANT", "auto").strip()   # auto | fp32 | int8_dynamic | int8_static
+# accuracy gate vs FP32 on antispoof_dataset (evaluate_antispoof.py metrics)
+MAX_AUC_DROP = float(os.getenv("ANTISPOOF_MAX_AUC_DROP", "0.005"))
+MAX_ACC_DROP = float(os.getenv("ANTISPOOF_MAX_ACC_DROP", "0.01"))
+
+# ==============================
+# SESSION OPTIONS
+# ==============================
+GRAPH_OPT = os.getenv("ANTISPOOF_GRAPH_OPT", "all").strip()          # disabled | basic | extended | all
+INTRA_OP_THREADS = int(os.getenv("ANTISPOOF_INTRA_OP_THREADS", "0"))  # 0 = ONNX Runtime default (all cores)
+INTER_OP_THREADS = int(os.getenv("ANTISPOOF_INTER_OP_THREADS", "0"))  # only used in parallel mode
+EXECUTION_MODE = os.getenv("ANTISPOOF_EXECUTION_MODE", "sequential").strip()   # sequential | parallel
+
+_GRAPH_OPT_LEVELS = {
+    "disabled": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+_EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def session_options(graph_opt=GRAPH_OPT, intra_op_threads=INTRA_OP_THREADS,
+                    inter_op_threads=INTER_OP_THREADS, execution_mode=EXECUTION_MODE):
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = _GRAPH_OPT_LEVELS[graph_opt]
+    opts.execution_mode = _EXECUTION_MODES[execution_mode]
+    if intra_op_threads:
+        opts.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        opts.inter_op_num_threads = inter_op_threads
+    return opts
+
+
+def make_session(model_path, **options):
+    return ort.InferenceSession(model_path, sess_options=session_options(**options),
+                                providers=["CPUExecutionProvider"])
+
+
+def passes_gate(variant: dict, baseline: dict) -> bool:
+    """
+    variant / baseline: entries of antispoof_variants.json ({"auc", "accuracy", ...}).
+    """
+    if variant.get("auc") is None or baseline.get("auc") is None:
+        return False
+    return (baseline["auc"] - variant["auc"] <= MAX_AUC_DROP
+            and baseline["accuracy"] - variant["accuracy"] <= MAX_ACC_DROP)
+
+
+def select_model(variants_file=VARIANTS_FILE, choice=ANTISPOOF_VARIANT):
+    """
+    Returns (variant name, model path). Falls back to FP32 when the report is
+    missing, a forced variant's file is missing, or nothing passes the gate.
+    """
+    fp32 = ("fp32", MODEL_PATH)
+    try:
+        with open(variants_file, "r", encoding="utf-8") as f:
+            variants = json.load(f).get("variants", {})
+    except (OSError, ValueError):
+        variants = {}
 
-sess = ort.InferenceSession(
-    MODEL_PATH,
-    providers=["CPUExecutionProvider"]
-)
+    if choice != "auto":
+        path = variants.get(choice, {}).get("path") or (MODEL_PATH if choice == "fp32" else None)
+        if path and os.path.exists(path):
+            return choice, path
+        print(f"[ANTISPOOF] Variant {choice!r} not available, using fp32")
+        return fp32
+
+    baseline = variants.get("fp32")
+    if not baseline:
+        return fp32
+    ok = [(v.get("latency_ms", float("inf")), name, v["path"]) for name, v in variants.items()
+          if name != "fp32" and os.path.exists(v.get("path", "")) and passes_gate(v, baseline)]
+    if not ok or min(ok)[0] >= baseline.get("latency_ms", float("inf")):
+        return fp32
+    _, name, path = min(ok)
+    return name, path
+
+
+MODEL_VARIANT, ACTIVE_MODEL_PATH = select_model()
+sess = make_session(ACTIVE_MODEL_PATH)
+print(f"[ANTISPOOF] Using {MODEL_VARIANT} model ({ACTIVE_MODEL_PATH}), graph_opt={GRAPH_OPT}, "
+      f"threads={INTRA_OP_THREADS or 'auto'}, mode={EXECUTION_MODE}")
 
 def preprocess(img_bgr):
     img = cv2.resize(img_bgr, (INPUT_SIZE, INPUT_SIZE))
@@ -23,12 +118,12 @@ def softmax(x):
     e = np.exp(x - np.max(x))
     return e / e.sum()
 
-def is_real_face_raw(img_bgr):
+def is_real_face_raw(img_bgr, session=None):
     if img_bgr is None or img_bgr.size == 0:
         return 0.0
 
     x = preprocess(img_bgr)
-    logits = sess.run(None, {"input": x})[0][0]
+    logits = (session or sess).run(None, {"input": x})[0][0]
 
     # Temperature scaling
     logits = logits / TEMPERATURE
@@ -37,3 +132,47 @@ def is_real_face_raw(img_bgr):
     prob_real = float(probs[0])   # class 0 = REAL
 
     return prob_real
+
+def is_real_face(img_bgr, thresh=0.5, session=None):
+    """
+    Returns (is_real, prob_real). Used by the evaluation / calibration scripts.
+    """
+    prob_real = is_real_face_raw(img_bgr, session)
+    return prob_real >= thresh, prob_real
+
+
+# ==============================
+# BATCHED INFERENCE
+# ==============================
+# antispoof_best.onnx is exported with a dynamic batch axis, so all faces of a
+# frame can go through one sess.run. Each thread reuses its own NCHW float32
+# tensor and resize buffer from preprocess.BUFFERS (embed workers run in parallel).
+def preprocess_into(img_bgr, out):
+    """
+    Same as preprocess(), but writes the CHW float32 result into out (3, H, W)
+    without temporaries.
+    """
+    return to_nchw(img_bgr, out, scale=1.0 / 255.0)
+
+def softmax_batch(x):
+    e = np.exp(x - np.max(x, axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+def is_real_face_batch(crops, session=None):
+    """
+    crops: list of BGR face crops (any size). session: default = the selected model.
+    Returns float32 array of REAL probabilities, one per crop (0.0 for empty crops).
+    """
+    scores = np.zeros(len(crops), dtype=np.float32)
+    valid = [i for i, c in enumerate(crops) if c is not None and c.size > 0]
+    if not valid:
+        return scores
+
+    x = batch_nchw("antispoof", [crops[i] for i in valid], INPUT_SIZE, scale=1.0 / 255.0, min_batch=MAX_BATCH)
+
+    logits = (session or sess).run(None, {"input": x})[0]
+
+    # Temperature scaling
+    probs = softmax_batch(logits / TEMPERATURE)
+    scores[valid] = probs[:, 0]   # class 0 = REAL
+    return scores
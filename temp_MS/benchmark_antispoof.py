@@ -0,0 +1,104 @@
+# benchmark_antispoof.py
+# Micro-benchmark: per-face is_real_face_raw() vs one is_real_face_batch() call
+# for 1, 8, 32 and 64 faces. Uses real crops from calibration_samples/ or
+# antispoof_dataset/ when present, otherwise random noise crops.
+# Also reports Python-side preprocessing allocations per call (tracemalloc):
+# the per-face path allocates per crop, the batch path reuses preprocess.BUFFERS.
+import glob
+import time
+import tracemalloc
+import numpy as np
+import cv2
+from antispoof import is_real_face_raw, is_real_face_batch, preprocess, INPUT_SIZE
+from preprocess import batch_nchw
+
+BATCH_SIZES = [1, 8, 32, 64]
+REPEATS = 20
+WARMUP = 3
+
+SAMPLE_GLOBS = [
+    "calibration_samples/*.jpg",
+    "antispoof_dataset/real/*.*",
+    "antispoof_dataset/spoof/*.*",
+]
+
+
+def load_crops(n):
+    files = []
+    for pattern in SAMPLE_GLOBS:
+        files.extend(glob.glob(pattern))
+
+    crops = []
+    for f in files:
+        img = cv2.imread(f)
+        if img is not None:
+            crops.append(img)
+        if len(crops) >= n:
+            break
+
+    if not crops:
+        print("No sample images found, using random 160x160 crops.")
+        rng = np.random.default_rng(0)
+        crops = [rng.integers(0, 255, (160, 160, 3), dtype=np.uint8) for _ in range(n)]
+
+    # repeat to reach n
+    while len(crops) < n:
+        crops.extend(crops[: n - len(crops)])
+    return crops[:n]
+
+
+def time_it(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+def alloc_kb(fn, repeats=5):
+    """
+    Peak KB allocated over `repeats` calls, via tracemalloc.
+    """
+    fn()  # buffers warmed up
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    for _ in range(repeats):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024.0 - before / 1024.0
+
+
+def main():
+    crops_all = load_crops(max(BATCH_SIZES))
+
+    print(f"{'faces':>5} | {'per-face ms':>11} | {'batch ms':>9} | {'speedup':>7} | {'max |diff|':>10}")
+    print("-" * 56)
+
+    for n in BATCH_SIZES:
+        crops = crops_all[:n]
+
+        for _ in range(WARMUP):
+            [is_real_face_raw(c) for c in crops]
+            is_real_face_batch(crops)
+
+        single_ms = time_it(lambda: [is_real_face_raw(c) for c in crops], REPEATS)
+        batch_ms = time_it(lambda: is_real_face_batch(crops), REPEATS)
+
+        ref = np.array([is_real_face_raw(c) for c in crops], dtype=np.float32)
+        diff = float(np.max(np.abs(ref - is_real_face_batch(crops))))
+
+        print(f"{n:>5} | {single_ms:>11.2f} | {batch_ms:>9.2f} | {single_ms / max(batch_ms, 1e-6):>6.2f}x | {diff:>10.2e}")
+
+    # preprocessing only (no inference): per-crop temporaries vs the reused buffers
+    crops = crops_all[:max(BATCH_SIZES)]
+    old_kb = alloc_kb(lambda: [preprocess(c) for c in crops])
+    new_kb = alloc_kb(lambda: batch_nchw("bench", crops, INPUT_SIZE))
+    print(f"\nPreprocess {len(crops)} crops, peak Python allocations: "
+          f"per-crop {old_kb:.0f} KB, pooled buffers {new_kb:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# benchmark_classifier.py
+# Training time vs gallery size: SVC(kernel="linear", probability=True) as in
+# train_classifier.py vs the prototype classifier (prototypes.py).
+# For each student count it reports
+#   - SVC full retrain (skipped above --svc-max students, it grows super-linearly)
+#   - prototype full build (every student) and probability calibration
+#   - prototype update for one enrolment (set_student) and one removal
+#   - held-out top-1 accuracy of both
+# Uses the embedding store (embedding_store.py); with --synthetic (or when the
+# store has too few students) clustered random 128-d embeddings stand in.
+#
+# Usage: python benchmark_classifier.py [--students 10 25 50 100 200] [--images 200] [--synthetic]
+import argparse
+import time
+import numpy as np
+from sklearn.model_selection import train_test_split
+from sklearn.svm import SVC
+
+from embedding_store import EMBEDDING_STORE_DIR, load_embeddings
+from prototypes import PrototypeClassifier
+
+STUDENT_COUNTS = [10, 25, 50, 100, 200]
+IMAGES_PER_STUDENT = 200
+SVC_MAX_STUDENTS = 100
+DIM = 128
+
+
+def synthetic(students, images, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(students, DIM)).astype(np.float32)
+    X = np.repeat(centres, images, axis=0) + rng.normal(scale=0.35, size=(students * images, DIM)).astype(np.float32)
+    names = np.repeat(np.array([f"s{i:04d}" for i in range(students)]), images)
+    return X, names
+
+
+def store_subset(store, students):
+    labels = store.labels[:students]
+    keep = np.isin(store.names, labels)
+    return np.asarray(store.embeddings[keep], dtype=np.float32), store.names[keep]
+
+
+def seconds(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t0, out
+
+
+def bench(X, names, svc_max):
+    X_train, X_test, y_train, y_test = train_test_split(X, names, test_size=0.2, stratify=names, random_state=42)
+    students = len(set(names))
+
+    svc_s, svc_acc = None, None
+    if students <= svc_max:
+        svc_s, clf = seconds(lambda: SVC(kernel="linear", probability=True).fit(X_train, y_train))
+        svc_acc = float(np.mean(clf.predict(X_test) == y_test))
+
+    model = PrototypeClassifier()
+    build_s, _ = seconds(lambda: model.sync(X_train, y_train))
+    calib_s, _ = seconds(lambda: model.calibrate(X_test, y_test))
+    proto_acc = float(np.mean(model.predict(X_test)[0] == y_test))
+
+    # one enrolment (re-enrol the last student) and one removal, scoring matrix rebuild included
+    last = y_train[-1]
+    rows = X_train[y_train == last]
+    model.scorer()
+    add_s, _ = seconds(lambda: (model.set_student(last, rows), model.scorer()))
+    remove_s, _ = seconds(lambda: (model.remove_student(last), model.scorer()))
+
+    return {
+        "students": students, "rows": len(X_train), "svc_s": svc_s, "svc_acc": svc_acc,
+        "build_s": build_s, "calib_s": calib_s, "add_ms": add_s * 1000.0, "remove_ms": remove_s * 1000.0,
+        "proto_acc": proto_acc,
+    }
+
+
+def fmt(v, spec):
+    return "-" if v is None else format(v, spec)
+
+
+def main():
+    p = argparse.ArgumentParser(description="SVC vs prototype classifier training time")
+    p.add_argument("--students", type=int, nargs="+", default=STUDENT_COUNTS)
+    p.add_argument("--images", type=int, default=IMAGES_PER_STUDENT, help="images per student (synthetic)")
+    p.add_argument("--svc-max", type=int, default=SVC_MAX_STUDENTS)
+    p.add_argument("--synthetic", action="store_true")
+    args = p.parse_args()
+
+    store = None
+    if not args.synthetic:
+        try:
+            store = load_embeddings(EMBEDDING_STORE_DIR)
+        except FileNotFoundError as e:
+            print(f"{e}; using synthetic embeddings")
+    if store is not None and len(store.labels) < max(args.students):
+        print(f"Store has {len(store.labels)} students; larger sizes use synthetic embeddings")
+
+    print(f"\n{'students':>8} | {'rows':>6} | {'SVC s':>7} | {'proto build s':>13} | {'calib s':>7} | "
+          f"{'add 1 ms':>8} | {'remove ms':>9} | {'SVC acc':>7} | {'proto acc':>9}")
+    print("-" * 100)
+    for n in args.students:
+        if store is not None and len(store.labels) >= n:
+            X, names = store_subset(store, n)
+        else:
+            X, names = synthetic(n, args.images)
+        r = bench(X, names, args.svc_max)
+        print(f"{r['students']:>8} | {r['rows']:>6} | {fmt(r['svc_s'], '.2f'):>7} | {r['build_s']:>13.2f} | "
+              f"{r['calib_s']:>7.3f} | {r['add_ms']:>8.1f} | {r['remove_ms']:>9.1f} | "
+              f"{fmt(r['svc_acc'], '.4f'):>7} | {r['proto_acc']:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmark_detection.py
+# Detection time vs scale: runs dlib HOG on the same frames at several
+# DETECT_SCALE values and reports ms per frame, faces found and the saving
+# relative to full resolution. Tiled configurations (TiledDetector, far rows at
+# a higher resolution) are timed on the same frames for large rooms.
+#
+# Usage: python benchmark_detection.py [source]
+#   source = camera index (default 0), video file, or a folder of images
+import sys
+import time
+import numpy as np
+import dlib
+
+from detection import detect_faces, TiledDetector
+from frame_source import iter_frames
+
+SOURCE = 0
+MAX_FRAMES = 60
+SCALES = [1.0, 0.75, 0.5, 0.35, 0.25]
+DETECT_ROI = None   # same format as recognise_live_1.1.py
+# (rows, cols, near scale, far rows, far scale), see recognition.DETECT_TILED
+TILED = [(2, 3, 0.5, 1, 1.0), (3, 4, 0.5, 1, 1.0), (3, 4, 0.5, 2, 1.0)]
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else SOURCE
+    frames = list(iter_frames(source, limit=MAX_FRAMES))
+    if not frames:
+        print(f"No frames read from source: {source}")
+        return
+
+    H, W = frames[0].shape[:2]
+    print(f"Frames: {len(frames)} at {W}x{H}  ROI: {DETECT_ROI}")
+
+    detector = dlib.get_frontal_face_detector()
+    detect_faces(detector, frames[0])  # warm-up
+
+    rows = []
+    for scale in SCALES:
+        times = []
+        faces = 0
+        for frame in frames:
+            t0 = time.perf_counter()
+            boxes = detect_faces(detector, frame, scale, DETECT_ROI)
+            times.append((time.perf_counter() - t0) * 1000.0)
+            faces += len(boxes)
+        rows.append((f"{scale:.2f}", float(np.mean(times)), float(np.percentile(times, 95)), faces / len(frames)))
+
+    for n_rows, n_cols, scale, far_rows, far_scale in TILED:
+        tiled = TiledDetector(detector, n_rows, n_cols, scale=scale, far_rows=far_rows, far_scale=far_scale,
+                              roi=DETECT_ROI)
+        tiled.detect(frames[0])  # warm-up (starts the worker processes)
+        times = []
+        faces = 0
+        for frame in frames:
+            t0 = time.perf_counter()
+            boxes = tiled.detect(frame)
+            times.append((time.perf_counter() - t0) * 1000.0)
+            faces += len(boxes)
+        tiled.close()
+        name = f"{n_rows}x{n_cols} {far_rows}@{far_scale:g}/{scale:g}"
+        rows.append((name, float(np.mean(times)), float(np.percentile(times, 95)), faces / len(frames)))
+
+    base_ms = rows[0][1] if SCALES[0] == 1.0 else max(r[1] for r in rows)
+
+    print(f"\n{'scale / tiles':>15} | {'mean ms':>8} | {'p95 ms':>8} | {'faces/frame':>11} | {'saving':>7}")
+    print("-" * 63)
+    for name, mean_ms, p95_ms, fpf in rows:
+        saving = (1.0 - mean_ms / base_ms) * 100.0 if base_ms > 0 else 0.0
+        print(f"{name:>15} | {mean_ms:>8.2f} | {p95_ms:>8.2f} | {fpf:>11.2f} | {saving:>6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# benchmark_embedding.py
+# CPU comparison of the embedding backends (embedding.py): for 1, 8, 32 and 64
+# faces, one embed_batch() per face vs one embed_batch() for all of them, per
+# backend, plus chips/s. Chips are cut from dataset/ images with each backend's
+# own geometry; random chips are used when no faces are found.
+# The ONNX backend is skipped if ONNX_EMBED_MODEL (face_embedder.onnx) is missing.
+#
+# Usage: python benchmark_embedding.py [source] [--threads N]
+#   source = folder of images (default dataset), video file or camera index
+import argparse
+import time
+import numpy as np
+import cv2
+import dlib
+
+from embedding import DlibEmbedder, OnnxEmbedder, ONNX_EMBED_MODEL
+from frame_source import iter_frames
+
+SOURCE = "dataset"
+MAX_IMAGES = 64
+BATCH_SIZES = [1, 8, 32, 64]
+REPEATS = 10
+WARMUP = 2
+SHAPE_PREDICTOR_PATH = "shape_predictor_5_face_landmarks.dat"
+
+
+def load_chips(embedder, frames, n):
+    detector = dlib.get_frontal_face_detector()
+    sp = dlib.shape_predictor(SHAPE_PREDICTOR_PATH)
+
+    chips = []
+    for bgr in frames:
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        rects = detector(rgb, 1)
+        if len(rects) == 0:
+            continue
+        rect = max(rects, key=lambda r: r.width() * r.height())
+        chips.append(embedder.face_chip(rgb, sp(rgb, rect)))
+        if len(chips) >= n:
+            break
+
+    if not chips:
+        print("No faces found, using random chips.")
+        rng = np.random.default_rng(0)
+        size = embedder.chip_size
+        chips = [rng.integers(0, 255, (size, size, 3), dtype=np.uint8) for _ in range(n)]
+
+    # repeat to reach n
+    while len(chips) < n:
+        chips.extend(chips[: n - len(chips)])
+    return chips[:n]
+
+
+def time_it(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+def bench(embedder, frames):
+    chips_all = load_chips(embedder, frames, max(BATCH_SIZES))
+
+    print(f"\n== {embedder.signature} ({embedder.dim}-d, {embedder.chip_size}px chips) ==")
+    print(f"{'faces':>5} | {'per-face ms':>11} | {'batch ms':>9} | {'speedup':>7} | {'chips/s':>8} | {'max |diff|':>10}")
+    print("-" * 67)
+
+    for n in BATCH_SIZES:
+        chips = chips_all[:n]
+
+        for _ in range(WARMUP):
+            [embedder.embed_batch([c]) for c in chips]
+            embedder.embed_batch(chips)
+
+        single_ms = time_it(lambda: [embedder.embed_batch([c]) for c in chips], REPEATS)
+        batch_ms = time_it(lambda: embedder.embed_batch(chips), REPEATS)
+
+        ref = np.vstack([embedder.embed_batch([c]) for c in chips])
+        diff = float(np.max(np.abs(ref - embedder.embed_batch(chips))))
+
+        print(f"{n:>5} | {single_ms:>11.2f} | {batch_ms:>9.2f} | {single_ms / max(batch_ms, 1e-6):>6.2f}x | "
+              f"{n * 1000.0 / max(batch_ms, 1e-6):>8.1f} | {diff:>10.2e}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Embedding backend benchmark (CPU)")
+    p.add_argument("source", nargs="?", default=SOURCE)
+    p.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = default)")
+    p.add_argument("--onnx-model", default=ONNX_EMBED_MODEL)
+    args = p.parse_args()
+
+    frames = list(iter_frames(args.source, limit=MAX_IMAGES))
+    print(f"Images: {len(frames)} from {args.source}")
+
+    bench(DlibEmbedder(), frames)
+    try:
+        onnx = OnnxEmbedder(args.onnx_model, threads=args.threads)
+    except Exception as e:
+        print(f"\nSkipping ONNX backend: {e}")
+        return
+    bench(onnx, frames)
+
+
+if __name__ == "__main__":
+    main()
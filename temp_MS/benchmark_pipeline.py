@@ -0,0 +1,284 @@
+# benchmark_pipeline.py
+# Deterministic replay benchmark for the recognition pipeline.
+# Feeds a recorded video or a folder of frames through the same
+# detection -> antispoof -> chip -> embed -> classify path as recognise_live_1.1.py
+# (recognition.py), single-threaded and without real-time pacing, and writes a
+# JSON report: throughput, p50/p95/p99 per stage, peak RSS and identity accuracy.
+#
+# Ground truth:
+#   - folder source: the first sub-folder under the source is the label,
+#     e.g. dataset/8220967_Din/img_1.jpg -> "8220967_Din" (same layout as training)
+#   - video source: --label <name> if the clip shows one known student
+#
+# Usage:
+#   python benchmark_pipeline.py dataset
+#   python benchmark_pipeline.py clip.mp4 --label 8220967_Din --detect-every 3 --scale 0.5
+#   python benchmark_pipeline.py dataset --chip-size 150 --jitters 1 --out report_150.json
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import recognition
+from recognition import detect_boxes, recognise_faces, extract_student_num
+from frame_context import FrameContext
+from frame_source import open_source, ImageFolderCapture
+from metrics import METRICS
+from tracker import FaceTracker
+from activity import DetectionScheduler
+
+# synthetic clock so tracker reverify intervals don't depend on machine speed
+REPLAY_FPS = 30.0
+DEFAULT_REPORT = "benchmark_report.json"
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, or None if it can't be read.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return round(peak / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024.0 * 1024.0), 1)
+    except ImportError:
+        return None
+
+
+def percentiles_ms(values):
+    if not values:
+        return None
+    arr = np.asarray(values, dtype=np.float64) * 1000.0
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+    }
+
+
+def folder_label(cap, root):
+    path = cap.current_path
+    if not path:
+        return None
+    rel = os.path.relpath(path, root)
+    parts = rel.split(os.sep)
+    return parts[0] if len(parts) > 1 else None
+
+
+def apply_overrides(args):
+    """
+    Overrides recognition.py settings for this run (they are read on every call).
+    """
+    if args.chip_size is not None:
+        recognition.CHIP_SIZE = args.chip_size
+    if args.jitters is not None:
+        recognition.JITTERS = args.jitters
+    if args.scale is not None:
+        recognition.DETECT_SCALE = args.scale
+    if args.roi is not None:
+        recognition.DETECT_ROI = tuple(args.roi)
+    return {
+        "matcher": recognition.MATCHER,
+        "embedder": recognition.embedder.signature,
+        "chip_size": recognition.CHIP_SIZE or recognition.embedder.chip_size,
+        "jitters": recognition.JITTERS,
+        "detect_scale": recognition.DETECT_SCALE,
+        "detect_roi": recognition.DETECT_ROI,
+        "antispoof": recognition.HAS_ANTISPOOF,
+        "detect_every": args.detect_every,
+        "adaptive": args.adaptive,
+        "tracking": args.track,
+        "correlation": args.correlation,
+        "vote": f"{args.vote_min_agree}/{args.vote_window}",
+    }
+
+
+def run(args):
+    is_folder = os.path.isdir(str(args.source))
+    if args.track is None:
+        # consecutive folder images are unrelated shots, a video is one scene
+        args.track = not is_folder
+    if not args.track:
+        args.detect_every = 1
+        args.adaptive = False
+    config = apply_overrides(args)
+
+    cap = open_source(args.source)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open source: {args.source}")
+
+    tracker = (FaceTracker(use_correlation=args.correlation, vote_window=args.vote_window,
+                           vote_min_agree=args.vote_min_agree) if args.track else None)
+    detect_sched = DetectionScheduler() if args.adaptive else None
+    detections = 0
+
+    counts = {"labelled_frames": 0, "correct": 0, "wrong": 0, "unknown": 0, "no_face": 0}
+    per_label = {}
+    frames = 0
+    faces = 0
+    recognitions = 0
+    frame_times = []
+
+    METRICS.reset()
+    METRICS.keep_samples = True
+    warmed_up = False
+
+    t_start = time.perf_counter()
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if args.limit and frames >= args.limit:
+            break
+
+        if not warmed_up:
+            # first call pays for lazy model / ONNX session setup, keep it out of the numbers
+            recognise_faces(FrameContext(frame), detect_boxes(FrameContext(frame)))
+            METRICS.reset()
+            t_start = time.perf_counter()
+            warmed_up = True
+
+        t0 = time.perf_counter()
+        ts = frames / REPLAY_FPS
+        ctx = FrameContext(frame)
+
+        if tracker is None:
+            boxes = detect_boxes(ctx)
+            detections += 1
+            results = recognise_faces(ctx, boxes)
+            recognitions += len(boxes)
+        else:
+            if detect_sched is not None:
+                do_detect = detect_sched.should_detect(frame, ts, [t.box for t in tracker.tracks()])
+            else:
+                do_detect = frames % args.detect_every == 0
+            if do_detect:
+                detections += 1
+                tracks = tracker.update(detect_boxes(ctx), frame, ts)
+            else:
+                tracks = tracker.predict(frame, ts)
+            live = [t for t in tracks if t.misses == 0]
+            todo = [t for t in live if tracker.needs_recognition(t, ts)]
+            if todo:
+                for t, res in zip(todo, recognise_faces(ctx, [t.box for t in todo])):
+                    tracker.set_result(t.id, res, t.box, ts)
+                recognitions += len(todo)
+            results = [t.result for t in live if t.result is not None]
+
+        frame_times.append(time.perf_counter() - t0)
+        frames += 1
+        faces += len(results)
+
+        # ---------- ACCURACY ----------
+        label = folder_label(cap, args.source) if isinstance(cap, ImageFolderCapture) else args.label
+        if label is None:
+            continue
+        counts["labelled_frames"] += 1
+        row = per_label.setdefault(label, {"frames": 0, "correct": 0})
+        row["frames"] += 1
+
+        truth = extract_student_num(label)
+        accepted = [r for r in results if r.get("student_num")]
+        if not results:
+            counts["no_face"] += 1
+        elif any(r["student_num"] == truth for r in accepted):
+            counts["correct"] += 1
+            row["correct"] += 1
+        elif accepted:
+            counts["wrong"] += 1
+        else:
+            counts["unknown"] += 1
+
+    elapsed = time.perf_counter() - t_start
+    cap.release()
+    METRICS.keep_samples = False
+
+    stages = {stage: percentiles_ms(v) for stage, v in sorted(METRICS.samples().items())}
+    stages["frame"] = percentiles_ms(frame_times)
+
+    labelled = counts["labelled_frames"]
+    accuracy = dict(counts)
+    if labelled:
+        accuracy["accuracy"] = round(counts["correct"] / labelled, 4)
+        accuracy["false_accept_rate"] = round(counts["wrong"] / labelled, 4)
+        accuracy["per_label"] = {
+            k: round(v["correct"] / v["frames"], 4) for k, v in sorted(per_label.items())
+        }
+
+    return {
+        "source": str(args.source),
+        "config": config,
+        "frames": frames,
+        "faces": faces,
+        "detections": detections,
+        "recognitions": recognitions,
+        "seconds": round(elapsed, 3),
+        "throughput_fps": round(frames / elapsed, 2) if elapsed > 0 else None,
+        "faces_per_second": round(faces / elapsed, 2) if elapsed > 0 else None,
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+        "identity": accuracy,
+    }
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Replay benchmark for the recognition pipeline")
+    p.add_argument("source", help="video file or folder of frames (label = first sub-folder)")
+    p.add_argument("--label", help="ground-truth label for a single-person video")
+    p.add_argument("--limit", type=int, default=0, help="stop after N frames (0 = all)")
+    p.add_argument("--out", default=DEFAULT_REPORT, help="JSON report path")
+    p.add_argument("--chip-size", type=int, help="cut chips at this size, resized to the embedder's (recognition.CHIP_SIZE)")
+    p.add_argument("--jitters", type=int, help="override recognition.JITTERS")
+    p.add_argument("--scale", type=float, help="override recognition.DETECT_SCALE")
+    p.add_argument("--roi", type=float, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                   help="override recognition.DETECT_ROI (fractions of the frame)")
+    p.add_argument("--detect-every", type=int, default=3, help="detect every N frames (tracking only)")
+    p.add_argument("--track", dest="track", action="store_true", default=None,
+                   help="use the face tracker (default for videos)")
+    p.add_argument("--no-track", dest="track", action="store_false",
+                   help="detect + recognise every face on every frame (default for folders)")
+    p.add_argument("--correlation", action="store_true", help="move tracks with the OpenCV correlation tracker")
+    p.add_argument("--vote-window", type=int, default=1, help="identity voting: recognitions per track considered")
+    p.add_argument("--vote-min-agree", type=int, default=1, help="identity voting: agreeing votes needed to commit")
+    p.add_argument("--adaptive", action="store_true",
+                   help="motion-gated detection interval (activity.DetectionScheduler) instead of --detect-every")
+    args = p.parse_args()
+    args.detect_every = max(1, args.detect_every)
+    return args
+
+
+def main():
+    args = parse_args()
+    report = run(args)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nFrames: {report['frames']}  faces: {report['faces']}  "
+          f"throughput: {report['throughput_fps']} fps  peak RSS: {report['peak_rss_mb']} MB")
+    print(f"{'stage':>10} | {'count':>6} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    print("-" * 52)
+    for stage, row in report["stages"].items():
+        if row:
+            print(f"{stage:>10} | {row['count']:>6} | {row['p50_ms']:>8.2f} | {row['p95_ms']:>8.2f} | {row['p99_ms']:>8.2f}")
+    ident = report["identity"]
+    if ident.get("labelled_frames"):
+        print(f"\nIdentity accuracy: {ident['accuracy']*100:.1f}%  "
+              f"false accepts: {ident['false_accept_rate']*100:.1f}%  "
+              f"({ident['labelled_frames']} labelled frames)")
+    print(f"\nReport written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmark_training.py
+# Wall-clock scaling of the training embedding pool (train_pool.py) on
+# dataset/ images: the same images embedded with 1, 2, 4 and 8 worker
+# processes (capped at the CPU count). Reports model load time, embedding
+# time, images/s, speedup over 1 worker, and checks that every run returns
+# the same statuses and embeddings in the same order.
+#
+# Usage: python benchmark_training.py [--images 200] [--workers 1 2 4 8]
+import argparse
+import os
+import time
+import numpy as np
+
+from train_pool import STATUS_OK, TrainEmbedPool
+
+DATASET_DIR = "dataset"
+MAX_IMAGES = 200
+WORKER_COUNTS = [1, 2, 4, 8]
+JITTERS = 1              # same as train_embeddings1.1.py
+
+
+def dataset_jobs(limit):
+    jobs = []
+    for student in sorted(os.listdir(DATASET_DIR)):
+        folder = os.path.join(DATASET_DIR, student)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith((".jpg", ".jpeg", ".png")):
+                jobs.append((f"{student}/{name}", os.path.join(folder, name)))
+    return jobs[:limit]
+
+
+def run(workers, jobs):
+    t0 = time.perf_counter()
+    pool = TrainEmbedPool(workers, jitters=JITTERS)
+    load_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with pool:
+        results = list(pool.map_paths(jobs))
+    embed_s = time.perf_counter() - t0
+    return load_s, embed_s, results
+
+
+def same_results(a, b):
+    for (tag_a, emb_a, st_a), (tag_b, emb_b, st_b) in zip(a, b):
+        if tag_a != tag_b or st_a != st_b:
+            return False
+        if st_a == STATUS_OK and not np.allclose(emb_a, emb_b, atol=1e-5):
+            return False
+    return len(a) == len(b)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Training embedding pool scaling benchmark")
+    p.add_argument("--images", type=int, default=MAX_IMAGES)
+    p.add_argument("--workers", type=int, nargs="+", default=WORKER_COUNTS)
+    args = p.parse_args()
+
+    jobs = dataset_jobs(args.images)
+    if not jobs:
+        print(f"No images in {DATASET_DIR}/")
+        return
+
+    cpus = os.cpu_count() or 1
+    counts = sorted({w for w in args.workers if w <= cpus}) or [1]
+    skipped = [w for w in args.workers if w > cpus]
+    print(f"{len(jobs)} images, {cpus} CPUs" + (f" (skipping {skipped} workers)" if skipped else ""))
+
+    print(f"\n{'workers':>7} | {'load s':>6} | {'embed s':>7} | {'img/s':>6} | {'speedup':>7} | {'ok':>4} | same")
+    print("-" * 60)
+    base_s, base_results = None, None
+    for w in counts:
+        load_s, embed_s, results = run(w, jobs)
+        if base_s is None:
+            base_s, base_results = embed_s, results
+        ok = sum(1 for _, _, st in results if st == STATUS_OK)
+        print(f"{w:>7} | {load_s:>6.2f} | {embed_s:>7.2f} | {len(jobs) / embed_s:>6.1f} | "
+              f"{base_s / embed_s:>6.2f}x | {ok:>4} | {'yes' if same_results(base_results, results) else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
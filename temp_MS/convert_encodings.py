@@ -0,0 +1,67 @@
+# convert_encodings.py
+# One-time conversion of a pickled encodings.pkl ({"embeddings", "names",
+# "embedder"}) into the embedding store (embedding_store.py). Only run it on
+# an encodings.pkl you produced yourself: unpickling executes code.
+# Afterwards it compares load time and peak Python memory (tracemalloc) of the
+# pickle vs the memory-mapped store, loaded the way train_classifier.py uses them.
+#
+# Usage: python convert_encodings.py [encodings.pkl] [--out embeddings]
+import argparse
+import pickle
+import time
+import tracemalloc
+
+import numpy as np
+
+from embedding_store import EMBEDDING_STORE_DIR, load_embeddings, save_embeddings
+
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn()
+    ms = (time.perf_counter() - t0) * 1000.0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ms, peak / (1024.0 * 1024.0)
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        data = pickle.load(f)
+    return np.array(data["names"]), np.array(data["embeddings"], dtype=np.float32)
+
+
+def load_store(path):
+    store = load_embeddings(path)
+    return store.names, store.embeddings
+
+
+def main():
+    p = argparse.ArgumentParser(description="Convert encodings.pkl to the embedding store")
+    p.add_argument("src", nargs="?", default="encodings.pkl")
+    p.add_argument("--out", default=EMBEDDING_STORE_DIR)
+    args = p.parse_args()
+
+    with open(args.src, "rb") as f:
+        data = pickle.load(f)
+
+    names = [str(n) for n in data["names"]]
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    save_embeddings(embeddings, names, data.get("embedder"), args.out, source=["encodings.pkl"] * len(names))
+
+    store = load_embeddings(args.out)
+    if not np.array_equal(np.asarray(store.embeddings), embeddings.reshape(len(names), -1)) \
+            or list(store.names) != names:
+        raise RuntimeError("Converted store doesn't match the pickle")
+    print(f"Converted {args.src} -> {args.out}/ ({len(store)} rows x {store.dim} dims, "
+          f"{len(store.labels)} labels, embedder {store.embedder})")
+
+    pkl_ms, pkl_mb = measure(lambda: load_pickle(args.src))
+    store_ms, store_mb = measure(lambda: load_store(args.out))
+    print(f"Load {args.src}: {pkl_ms:.1f} ms, peak {pkl_mb:.1f} MB | "
+          f"{args.out}/ (mmap): {store_ms:.1f} ms, peak {store_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
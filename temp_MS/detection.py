@@ -0,0 +1,260 @@
+# detection.py
+# Face detection on a reduced image:
+# - optional region of interest (seating area) cropped from the frame first
+# - ROI is downscaled by `scale` before dlib HOG runs (HOG cost ~ pixel count)
+# - boxes are mapped back to full-resolution frame coordinates, so chips and
+#   antispoof crops are still cut from the full-res frame
+# - TiledDetector: overlapping tiles (far rows at a higher resolution) detected
+#   in parallel and merged with NMS, for rooms where back-row faces are small
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from pipeline import worker_process_context
+
+# dlib's frontal HOG detector uses an 80x80 sliding window
+HOG_WINDOW = 80
+
+
+def roi_pixels(roi, W, H):
+    """
+    roi: None (whole frame) or (x1, y1, x2, y2) as fractions 0..1 of the frame.
+    Returns pixel coordinates (x1, y1, x2, y2).
+    """
+    if not roi:
+        return 0, 0, W, H
+    x1, y1, x2, y2 = roi
+    px1, py1 = int(max(0.0, x1) * W), int(max(0.0, y1) * H)
+    px2, py2 = int(min(1.0, x2) * W), int(min(1.0, y2) * H)
+    if px2 - px1 < 2 or py2 - py1 < 2:
+        return 0, 0, W, H
+    return px1, py1, px2, py2
+
+
+def min_safe_scale(min_face_px: float) -> float:
+    """
+    Smallest scale at which a face of min_face_px (full-res) is still >= the HOG window.
+    """
+    if min_face_px <= 0:
+        return 1.0
+    return min(1.0, HOG_WINDOW / float(min_face_px))
+
+
+def min_safe_face_px(scale: float) -> float:
+    """
+    Smallest full-res face width HOG can still find at this scale.
+    """
+    return HOG_WINDOW / float(scale)
+
+
+def prepare_detection_image(frame_bgr, scale: float = 1.0, roi=None, gray=None):
+    """
+    Crops the ROI, resizes and converts to grey in that order (cheapest first).
+    If a full-frame grey image is already available (gray=...), it is reused.
+    Returns (gray_small, (offset_x, offset_y), scale).
+    """
+    H, W = frame_bgr.shape[:2]
+    x1, y1, x2, y2 = roi_pixels(roi, W, H)
+
+    if gray is not None:
+        region = gray[y1:y2, x1:x2]
+        if scale != 1.0:
+            region = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # dlib needs a contiguous image; an ROI slice of the grey frame is a strided view
+        return np.ascontiguousarray(region), (x1, y1), scale
+
+    region = frame_bgr[y1:y2, x1:x2]
+
+    if scale != 1.0:
+        region = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+    return gray, (x1, y1), scale
+
+
+def detect_faces(detector, frame_bgr, scale: float = 1.0, roi=None, upsample: int = 0, gray=None):
+    """
+    Runs detector on the reduced image and returns full-resolution boxes
+    as a list of (x1, y1, x2, y2) ints.
+    """
+    gray, (ox, oy), scale = prepare_detection_image(frame_bgr, scale, roi, gray)
+    rects = detector(gray, upsample)
+    inv = 1.0 / scale
+    return [
+        (int(r.left() * inv) + ox, int(r.top() * inv) + oy,
+         int(r.right() * inv) + ox, int(r.bottom() * inv) + oy)
+        for r in rects
+    ]
+
+
+# ==============================
+# TILED DETECTION
+# ==============================
+def make_tiles(W: int, H: int, rows: int, cols: int, overlap: float = 0.2, roi=None):
+    """
+    Splits the ROI (whole frame if None) into rows x cols tiles that overlap by
+    `overlap` of a tile's size, so a face cut by one tile border is whole in
+    the neighbouring tile. Returns [(row, (x1, y1, x2, y2)), ...] in pixels, top row first.
+    """
+    rx1, ry1, rx2, ry2 = roi_pixels(roi, W, H)
+    tw, th = (rx2 - rx1) / float(cols), (ry2 - ry1) / float(rows)
+    mx, my = tw * overlap / 2.0, th * overlap / 2.0
+    tiles = []
+    for r in range(rows):
+        for c in range(cols):
+            x1 = max(rx1, int(rx1 + c * tw - mx))
+            y1 = max(ry1, int(ry1 + r * th - my))
+            x2 = min(rx2, int(rx1 + (c + 1) * tw + mx))
+            y2 = min(ry2, int(ry1 + (r + 1) * th + my))
+            tiles.append((r, (x1, y1, x2, y2)))
+    return tiles
+
+
+def nms(boxes, scores, iou_thresh: float = 0.4, contain_thresh: float = 0.7):
+    """
+    Greedy NMS over (x1, y1, x2, y2) boxes, highest score first. A box is also
+    dropped when most of it lies inside a kept box (a face clipped at a tile
+    edge next to the same face found whole in the neighbouring tile).
+    """
+    if not boxes:
+        return []
+    b = np.asarray(boxes, dtype=np.float32)
+    areas = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    order = np.argsort(-np.asarray(scores, dtype=np.float32))
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        iw = np.clip(np.minimum(b[i, 2], b[rest, 2]) - np.maximum(b[i, 0], b[rest, 0]), 0, None)
+        ih = np.clip(np.minimum(b[i, 3], b[rest, 3]) - np.maximum(b[i, 1], b[rest, 1]), 0, None)
+        inter = iw * ih
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-6)
+        contain = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[(iou <= iou_thresh) & (contain <= contain_thresh)]
+    return [tuple(int(v) for v in boxes[i]) for i in keep]
+
+
+def _run_detector(detector, gray, upsample: int):
+    """
+    Returns [(left, top, right, bottom, score), ...] in the coordinates of gray.
+    """
+    rects, scores, _ = detector.run(gray, upsample, 0.0)
+    return [(r.left(), r.top(), r.right(), r.bottom(), float(s)) for r, s in zip(rects, scores)]
+
+
+# detector of a tile worker process (dlib objects can't be pickled)
+_proc_detector = None
+
+def _proc_init():
+    global _proc_detector
+    import dlib
+    _proc_detector = dlib.get_frontal_face_detector()
+
+def _proc_detect(gray, upsample: int):
+    return _run_detector(_proc_detector, gray, upsample)
+
+def _proc_ping():
+    return True
+
+
+class TiledDetector:
+    """
+    Detection over overlapping tiles, in parallel.
+    - the top `far_rows` tile rows (back of the room) run at far_scale, the
+      others at scale; faces there are smaller, HOG needs them >= 80px
+    - executor "process": a pool of worker processes with their own dlib
+      detector (HOG holds the GIL), started with forkserver / spawn
+      (pipeline.worker_process_context); "thread": tile threads, each with its
+      own detector (`detector` is only used on the main thread)
+    Returns full-resolution boxes like detect_faces().
+    start() creates the pool up front, close() shuts it down.
+    """
+
+    def __init__(self, detector, rows: int = 2, cols: int = 3, overlap: float = 0.2,
+                 scale: float = 0.5, far_rows: int = 1, far_scale: float = 1.0,
+                 roi=None, upsample: int = 0, workers: int = 0, executor: str = "process"):
+        self.detector = detector
+        self.rows, self.cols = rows, cols
+        self.overlap = overlap
+        self.scale = scale
+        self.far_rows = far_rows
+        self.far_scale = far_scale
+        self.roi = roi
+        self.upsample = upsample
+        self.workers = workers or min(rows * cols, os.cpu_count() or 1)
+        self.executor = executor
+        self._pool = None
+        self._local = threading.local()
+
+    def _tile_scale(self, row: int) -> float:
+        return self.far_scale if row < self.far_rows else self.scale
+
+    def start(self):
+        """
+        Creates the pool now and, for processes, waits until every worker has its detector.
+        """
+        if self._pool is None:
+            if self.executor == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=worker_process_context(),
+                                                 initializer=_proc_init)
+                for f in [self._pool.submit(_proc_ping) for _ in range(self.workers)]:
+                    f.result()
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tile")
+        return self
+
+    def _thread_detector(self):
+        # dlib's HOG detector keeps scratch state per call: one copy per tile thread
+        if threading.current_thread() is threading.main_thread():
+            return self.detector
+        det = getattr(self._local, "detector", None)
+        if det is None:
+            import dlib
+            det = self._local.detector = dlib.get_frontal_face_detector()
+        return det
+
+    def _thread_detect(self, gray, upsample: int):
+        return _run_detector(self._thread_detector(), gray, upsample)
+
+    def _get_pool(self):
+        if self._pool is None:
+            # single-threaded callers (benchmarks) may skip start()
+            self.start()
+        return self._pool
+
+    def detect(self, frame_bgr, gray=None):
+        H, W = frame_bgr.shape[:2]
+        if gray is None:
+            gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+
+        jobs = []
+        for row, (x1, y1, x2, y2) in make_tiles(W, H, self.rows, self.cols, self.overlap, self.roi):
+            s = self._tile_scale(row)
+            tile = gray[y1:y2, x1:x2]
+            if s != 1.0:
+                tile = cv2.resize(tile, None, fx=s, fy=s, interpolation=cv2.INTER_AREA if s < 1.0 else cv2.INTER_LINEAR)
+            jobs.append(((x1, y1), s, np.ascontiguousarray(tile)))
+
+        pool = self._get_pool()
+        if self.executor == "process":
+            futures = [pool.submit(_proc_detect, tile, self.upsample) for _, _, tile in jobs]
+        else:
+            futures = [pool.submit(self._thread_detect, tile, self.upsample) for _, _, tile in jobs]
+
+        boxes, scores = [], []
+        for ((ox, oy), s, _), fut in zip(jobs, futures):
+            inv = 1.0 / s
+            for l, t, r, b, score in fut.result():
+                boxes.append((int(l * inv) + ox, int(t * inv) + oy, int(r * inv) + ox, int(b * inv) + oy))
+                scores.append(score)
+        return nms(boxes, scores)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,169 @@
+# embed_pool.py
+# Process pool for landmarks + embeddings, fed through shared memory.
+# dlib's ResNet holds the GIL for most of a descriptor, so embed threads don't
+# scale across cores; worker processes do, but pickling 1080p frames to them
+# would copy every frame twice.
+# - FrameRing: fixed slots of camera-sized BGR frames in multiprocessing.shared_memory.
+#   The detect stage copies a frame into a free slot once (only frames with faces
+#   to recognise); workers read it in place, so there are no per-face copies.
+# - EmbedPool: worker processes, each loading the shape predictor + embedder
+#   (embedding.py) once, take (slot, boxes) jobs and return small float32
+#   embeddings. The slot goes back to the ring when recognise_job is done.
+#   Each worker runs single-threaded (the pool already fills the cores).
+#   Workers are started with forkserver / spawn (pipeline.worker_process_context),
+#   never forked from the recogniser, whose ONNX Runtime sessions own threads.
+#   warm_up() starts them and waits until their models are loaded.
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from pipeline import worker_process_context
+
+SHAPE_PREDICTOR_PATH = "shape_predictor_5_face_landmarks.dat"
+
+
+class FrameRing:
+    """
+    Thread-safe slot allocator over one shared-memory block (parent process).
+    """
+
+    def __init__(self, slots: int, shape, dtype=np.uint8):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=frame_bytes * slots)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        self._free = list(range(slots))
+        self._cond = threading.Condition()
+        self.waits = 0              # frames that found no free slot
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def fits(self, frame) -> bool:
+        return frame.shape == self.shape and frame.dtype == self.dtype
+
+    def put(self, frame, timeout: float = 0.0):
+        """
+        Copies frame into a free slot and returns the slot index, or None if
+        every slot is still in use after timeout.
+        """
+        with self._cond:
+            if not self._free and timeout > 0:
+                self._cond.wait(timeout)
+            if not self._free:
+                self.waits += 1
+                return None
+            slot = self._free.pop()
+        np.copyto(self.frames[slot], frame)
+        return slot
+
+    def release(self, slot):
+        if slot is None:
+            return
+        with self._cond:
+            if slot not in self._free:
+                self._free.append(slot)
+                self._cond.notify()
+
+    def free(self) -> int:
+        with self._cond:
+            return len(self._free)
+
+    def close(self):
+        # drop our numpy view first, SharedMemory.close() fails while it is exported
+        self.frames = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# ==============================
+# WORKER PROCESS
+# ==============================
+_w = {}
+
+def _worker_init(shm_name, slots, shape, dtype, backend):
+    # one thread per worker: N workers x a default thread pool each would oversubscribe the CPU
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = "1"
+    import cv2
+    import dlib
+    from embedding import EMBED_BACKEND, make_embedder
+
+    cv2.setNumThreads(1)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _w["shm"] = shm   # keep the mapping alive
+    _w["frames"] = np.ndarray((slots,) + tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf)
+    _w["sp"] = dlib.shape_predictor(SHAPE_PREDICTOR_PATH)
+    kwargs = {"threads": 1} if (backend or EMBED_BACKEND).lower() == "onnx" else {}
+    _w["embedder"] = make_embedder(backend, **kwargs)
+
+
+def _worker_embed(slot, boxes, jitters, cut_size):
+    """
+    Landmarks -> chips -> one embed_batch for one frame slot.
+    Returns one float32 array (or None where it failed) per box.
+    """
+    import cv2
+    import dlib
+
+    sp, embedder = _w["sp"], _w["embedder"]
+    rgb = cv2.cvtColor(_w["frames"][slot], cv2.COLOR_BGR2RGB)
+    shapes = dlib.full_object_detections()
+    for box in boxes:
+        shapes.append(sp(rgb, dlib.rectangle(*box)))
+    chips = embedder.face_chips(rgb, shapes, cut_size=cut_size)
+    try:
+        return list(embedder.embed_batch(chips, jitters))
+    except Exception:
+        out = []
+        for chip in chips:
+            try:
+                out.append(embedder.embed_batch([chip], jitters)[0])
+            except Exception:
+                out.append(None)
+        return out
+
+
+def _worker_ping():
+    return True
+
+
+class EmbedPool:
+    """
+    Parent side: owns the FrameRing and the worker processes.
+    embed(slot, boxes) blocks the calling embed thread (GIL released) until a
+    worker returns the embeddings.
+    """
+
+    def __init__(self, workers: int, slots: int, frame_shape, backend: str = None):
+        self.ring = FrameRing(slots, frame_shape)
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=worker_process_context(), initializer=_worker_init,
+            initargs=(self.ring.name, slots, self.ring.shape, self.ring.dtype.str, backend),
+        )
+
+    def warm_up(self):
+        """
+        Starts every worker and waits for its models to load.
+        """
+        for f in [self.executor.submit(_worker_ping) for _ in range(self.workers)]:
+            f.result()
+
+    def embed(self, slot: int, boxes, jitters: int = 0, cut_size: int = None):
+        boxes = [tuple(int(v) for v in b) for b in boxes]
+        return self.executor.submit(_worker_embed, slot, boxes, jitters, cut_size).result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.ring.close()
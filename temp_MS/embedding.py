@@ -0,0 +1,171 @@
+# embedding.py
+# Face embedding backends shared by training (train_embeddings*.py) and live
+# recognition (recognition.py), so both always cut and embed chips the same way.
+# - DlibEmbedder: dlib_face_recognition_resnet_model_v1 (128-d, the original model)
+# - OnnxEmbedder: any ONNX face embedding model with a dynamic batch axis,
+#   run through ONNX Runtime with intra-op threading
+# Every backend pins its own chip geometry (size + padding around the 5-point
+# alignment). `signature` names model + geometry; it is stored in the embedding store
+# (embedding_store.py) and model_version.json, and recognition.py refuses a matcher trained with a
+# different one (embeddings from different backends are not comparable).
+#
+# Usage:
+#   emb = make_embedder()                    # EMBED_BACKEND below
+#   chips = emb.face_chips(rgb, shapes)      # shapes: dlib.full_object_detections
+#   X = emb.embed_batch(chips)               # float32 (N, emb.dim)
+import os
+import threading
+
+import cv2
+import dlib
+import numpy as np
+
+from preprocess import batch_nchw
+
+# ==============================
+# SETTINGS
+# ==============================
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "dlib").strip()   # "dlib" or "onnx"
+
+DLIB_REC_MODEL_PATH = "dlib_face_recognition_resnet_model_v1.dat"
+DLIB_CHIP_SIZE = 150           # the ResNet's fixed input size
+DLIB_CHIP_PADDING = 0.25
+
+ONNX_EMBED_MODEL = os.getenv("ONNX_EMBED_MODEL", "face_embedder.onnx")
+ONNX_CHIP_SIZE = 112           # ArcFace-style 112x112 RGB input
+ONNX_CHIP_PADDING = 0.0
+ONNX_MEAN = 127.5              # x = (rgb - mean) / std
+ONNX_STD = 128.0
+ONNX_THREADS = 0               # intra-op threads per session, 0 = ONNX Runtime default (all cores)
+MAX_BATCH = 64                 # initial size of the per-thread input tensor (grows if needed)
+
+
+class EmbeddingBackend:
+    """
+    Subclasses set name / chip_size / chip_padding / dim and implement embed_batch().
+    """
+    name = "base"
+    chip_size = 150
+    chip_padding = 0.25
+    dim = 128
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}:{self.chip_size}:{self.chip_padding:g}"
+
+    def face_chips(self, rgb, shapes, cut_size: int = None):
+        """
+        Aligned RGB chips for a dlib.full_object_detections of one image.
+        cut_size (experiments only): cut smaller chips and resize them up to chip_size.
+        """
+        if len(shapes) == 0:
+            return []
+        size = cut_size or self.chip_size
+        chips = dlib.get_face_chips(rgb, shapes, size=size, padding=self.chip_padding)
+        if size != self.chip_size:
+            chips = [cv2.resize(c, (self.chip_size, self.chip_size), interpolation=cv2.INTER_LINEAR)
+                     for c in chips]
+        return chips
+
+    def face_chip(self, rgb, shape):
+        return dlib.get_face_chip(rgb, shape, size=self.chip_size, padding=self.chip_padding)
+
+    def embed_batch(self, chips, jitters: int = None):
+        """
+        chips: list of chip_size x chip_size RGB uint8 chips.
+        Returns float32 (N, dim). Raises if the batch fails.
+        """
+        raise NotImplementedError
+
+
+class DlibEmbedder(EmbeddingBackend):
+    name = "dlib_resnet_v1"
+    dim = 128
+
+    def __init__(self, model_path: str = DLIB_REC_MODEL_PATH, jitters: int = 0):
+        self.model_path = model_path
+        self.chip_size = DLIB_CHIP_SIZE
+        self.chip_padding = DLIB_CHIP_PADDING
+        self.jitters = jitters
+        # the ResNet keeps per-call scratch buffers: one copy per thread
+        self._main = dlib.face_recognition_model_v1(model_path)
+        self._local = threading.local()
+
+    def _model(self):
+        if threading.current_thread() is threading.main_thread():
+            return self._main
+        model = getattr(self._local, "model", None)
+        if model is None:
+            model = self._local.model = dlib.face_recognition_model_v1(self.model_path)
+        return model
+
+    def embed_batch(self, chips, jitters: int = None):
+        if not chips:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        jitters = self.jitters if jitters is None else jitters
+        descs = self._model().compute_face_descriptor(list(chips), jitters)
+        return np.asarray([np.asarray(d) for d in descs], dtype=np.float32).reshape(len(chips), self.dim)
+
+
+class OnnxEmbedder(EmbeddingBackend):
+    """
+    NCHW float32 input, one embedding row per chip. Outputs are L2-normalised
+    (gallery / SVC both expect comparable norms). A model exported with a fixed
+    batch of 1 still works, one sess.run per chip.
+    """
+    name = "onnx"
+
+    def __init__(self, model_path: str = ONNX_EMBED_MODEL, chip_size: int = ONNX_CHIP_SIZE,
+                 chip_padding: float = ONNX_CHIP_PADDING, mean: float = ONNX_MEAN, std: float = ONNX_STD,
+                 threads: int = ONNX_THREADS, normalize: bool = True):
+        import onnxruntime as ort
+
+        if not os.path.exists(model_path):
+            raise RuntimeError(f"ONNX embedding model not found: {model_path}")
+        self.model_path = model_path
+        self.name = f"onnx_{os.path.splitext(os.path.basename(model_path))[0]}"
+        self.chip_size = chip_size
+        self.chip_padding = chip_padding
+        self.mean = mean
+        self.std = std
+        self.normalize = normalize
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            opts.intra_op_num_threads = threads
+        # sess.run is thread-safe: one session shared by all embed workers
+        self.sess = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+
+        inp = self.sess.get_inputs()[0]
+        self.input_name = inp.name
+        self.batched = not isinstance(inp.shape[0], int) or inp.shape[0] != 1
+        self.dim = int(self.sess.get_outputs()[0].shape[-1])
+
+    def embed_batch(self, chips, jitters: int = None):
+        if not chips:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # chips are RGB already; (x - mean) / std folded into scale + offset
+        x = batch_nchw(("embed", self.model_path), chips, self.chip_size, scale=1.0 / self.std,
+                       offset=-self.mean / self.std, swap_rb=False, min_batch=MAX_BATCH)
+
+        if self.batched:
+            out = self.sess.run(None, {self.input_name: x})[0]
+        else:
+            out = np.concatenate([self.sess.run(None, {self.input_name: x[j:j + 1]})[0]
+                                  for j in range(len(chips))])
+        out = np.asarray(out, dtype=np.float32).reshape(len(chips), -1)
+        if self.normalize:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+def make_embedder(backend: str = None, **kwargs) -> EmbeddingBackend:
+    backend = (backend or EMBED_BACKEND).lower()
+    if backend == "dlib":
+        return DlibEmbedder(**kwargs)
+    if backend == "onnx":
+        kwargs.pop("jitters", None)
+        return OnnxEmbedder(**kwargs)
+    raise ValueError(f"Unknown embedding backend: {backend!r} (expected 'dlib' or 'onnx')")
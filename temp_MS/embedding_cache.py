@@ -0,0 +1,122 @@
+# embedding_cache.py
+# Persistent per-image embedding store for the training scripts
+# (train_embeddings_supabase.py, train_embeddings1.1.py), so a retrain only
+# embeds images that are new or changed since the last run.
+# - Keyed by image path (storage path or path relative to the dataset folder)
+# - Each entry remembers the object version it was computed from: etag /
+#   updated_at for Supabase objects, mtime + size for local files. A different
+#   version means the image was replaced and is embedded again.
+# - Images without a usable face are cached too (embedding None), so they are
+#   not downloaded again on every run until they change.
+# - Paths that are gone from the listing are dropped (prune).
+# - The whole cache is discarded when the embedder signature changes
+#   (embeddings from different backends / settings are not comparable).
+# Saved as one .npz, written atomically: "embeddings" float32 (N, D) and
+# "index", a JSON string {format, signature, entries: {path: [version, row | null]}}.
+# Loaded with allow_pickle=False, like the embedding store (embedding_store.py).
+#
+# Usage:
+#   cache = EmbeddingCache.load("embedding_cache.npz", embedder.signature)
+#   todo = cache.stale(items)                  # items: (path, version) pairs
+#   cache.put(path, version, emb)              # emb None = no face
+#   cache.prune(current_paths); cache.save()
+import json
+import os
+
+import numpy as np
+
+from model_artifacts import atomic_write
+
+CACHE_FORMAT = 2
+
+
+def local_version(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, signature: str, entries: dict = None):
+        self.path = path
+        self.signature = signature
+        self.entries = entries if entries is not None else {}   # path -> (version, embedding | None)
+        self.added = 0
+        self.removed = 0
+
+    @classmethod
+    def load(cls, path: str, signature: str, rebuild: bool = False):
+        """
+        Cache from path, or an empty one if the file is missing, unreadable,
+        from another embedder, or rebuild is set.
+        """
+        if rebuild or not os.path.exists(path):
+            return cls(path, signature)
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                index = json.loads(str(z["index"]))
+                if index.get("format") != CACHE_FORMAT or index.get("signature") != signature:
+                    print(f"Embedding cache {path} was built with {index.get('signature')!r}, "
+                          f"now {signature!r}: re-embedding everything")
+                    return cls(path, signature)
+                X = np.asarray(z["embeddings"], dtype=np.float32)
+            entries = {}
+            for key, (version, row) in (index.get("entries") or {}).items():
+                entries[key] = (version, None if row is None else X[int(row)])
+        except Exception as e:
+            print(f"[WARN] Embedding cache {path} unreadable ({e}), starting empty")
+            return cls(path, signature)
+        return cls(path, signature, entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, path: str, version: str):
+        """
+        (hit, embedding). hit is False when path is unknown or was computed from another version.
+        """
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != version:
+            return False, None
+        return True, entry[1]
+
+    def stale(self, items):
+        """
+        The (path, version) pairs that have to be embedded (each path once).
+        """
+        todo, seen = [], set()
+        for path, version in items:
+            if path in seen:
+                continue
+            seen.add(path)
+            if not self.get(path, version)[0]:
+                todo.append((path, version))
+        return todo
+
+    def put(self, path: str, version: str, embedding):
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+        self.entries[path] = (version, embedding)
+        self.added += 1
+
+    def prune(self, paths):
+        """
+        Drops every entry whose path is not in paths (deleted images).
+        """
+        keep = set(paths)
+        gone = [p for p in self.entries if p not in keep]
+        for p in gone:
+            del self.entries[p]
+        self.removed += len(gone)
+        return len(gone)
+
+    def save(self):
+        rows, index = [], {}
+        for key, (version, emb) in self.entries.items():
+            if emb is None:
+                index[key] = [version, None]
+            else:
+                index[key] = [version, len(rows)]
+                rows.append(np.asarray(emb, dtype=np.float32).ravel())
+        X = np.vstack(rows) if rows else np.zeros((0, 0), np.float32)
+        meta = json.dumps({"format": CACHE_FORMAT, "signature": self.signature, "entries": index})
+        atomic_write(self.path, lambda f: np.savez(f, embeddings=X, index=np.array(meta)))
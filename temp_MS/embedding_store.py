@@ -0,0 +1,129 @@
+# embedding_store.py
+# Columnar on-disk embedding store written by the training scripts and read by
+# train_classifier.py / train_gallery.py / evaluate_gallery.py (replaces
+# encodings.pkl, a pickled list of separate arrays).
+# EMBEDDING_STORE_DIR/
+#   embeddings.npy   float32 (N, D), C-contiguous, memory-mapped on load
+#   labels.npy       int32 (N,) index into meta.json "labels"
+#   rows.json        per-row provenance, columnar: {"source": [...], "path": [...], "angle": [...]}
+#   meta.json        format, embedder signature, label table, N, D (written last)
+# No pickle anywhere: loading never executes code from the file.
+# Old encodings.pkl files: python convert_encodings.py (one time).
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from model_artifacts import atomic_write
+
+EMBEDDING_STORE_DIR = "embeddings"
+STORE_FORMAT = 1
+PROVENANCE_FIELDS = ("source", "path", "angle")
+
+
+class EmbeddingStore:
+    def __init__(self, embeddings, label_idx, labels, embedder: str = None, provenance: dict = None,
+                 path: str = None):
+        self.embeddings = embeddings        # (N, D) float32, np.memmap when loaded
+        self.label_idx = label_idx          # (N,) int32
+        self.labels = np.asarray(labels)    # label table
+        self.embedder = embedder
+        self.path = path
+        self._provenance = provenance
+
+    def __len__(self):
+        return len(self.label_idx)
+
+    @property
+    def dim(self) -> int:
+        return int(self.embeddings.shape[1])
+
+    @property
+    def names(self):
+        """
+        (N,) label name per row, the old encodings.pkl "names".
+        """
+        return self.labels[self.label_idx]
+
+    def provenance(self) -> dict:
+        """
+        {"source": [...], "path": [...], "angle": [...]}, one entry per row (read on first use).
+        """
+        if self._provenance is None:
+            rows_file = os.path.join(self.path, "rows.json") if self.path else None
+            if rows_file and os.path.exists(rows_file):
+                with open(rows_file, "r", encoding="utf-8") as f:
+                    self._provenance = json.load(f)
+            else:
+                self._provenance = {k: [""] * len(self) for k in PROVENANCE_FIELDS}
+        return self._provenance
+
+    # ----------------------------
+    # save / load
+    # ----------------------------
+    @classmethod
+    def from_rows(cls, embeddings, names, embedder: str = None, **provenance):
+        """
+        embeddings: list / array of D-dim rows; names: label per row;
+        provenance: optional source= / path= / angle= lists, one entry per row.
+        """
+        X = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32).reshape(len(names), -1))
+        labels, label_idx = np.unique(np.asarray(names).astype(str), return_inverse=True)
+        prov = {}
+        for k in PROVENANCE_FIELDS:
+            col = provenance.get(k)
+            prov[k] = ["" if v is None else str(v) for v in col] if col is not None else [""] * len(names)
+            if len(prov[k]) != len(names):
+                raise ValueError(f"provenance {k!r} has {len(prov[k])} entries for {len(names)} rows")
+        return cls(X, label_idx.astype(np.int32), labels, embedder, prov)
+
+    def save(self, path: str = EMBEDDING_STORE_DIR):
+        """
+        Every file is written atomically and meta.json goes last, so a reader sees
+        either the old store or the complete new one (load() checks the row counts).
+        """
+        os.makedirs(path, exist_ok=True)
+        atomic_write(os.path.join(path, "embeddings.npy"),
+                     lambda f: np.save(f, np.ascontiguousarray(self.embeddings, dtype=np.float32)))
+        atomic_write(os.path.join(path, "labels.npy"),
+                     lambda f: np.save(f, np.asarray(self.label_idx, dtype=np.int32)))
+        atomic_write(os.path.join(path, "rows.json"), lambda f: json.dump(self.provenance(), f), mode="w")
+        meta = {
+            "format": STORE_FORMAT,
+            "embedder": self.embedder,
+            "count": len(self),
+            "dim": self.dim,
+            "labels": [str(x) for x in self.labels],
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        atomic_write(os.path.join(path, "meta.json"), lambda f: json.dump(meta, f, indent=2), mode="w")
+        self.path = path
+
+    @classmethod
+    def load(cls, path: str = EMBEDDING_STORE_DIR, mmap: bool = True):
+        meta_file = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_file):
+            hint = " (run convert_encodings.py to convert encodings.pkl)" if os.path.exists("encodings.pkl") else ""
+            raise FileNotFoundError(f"No embedding store in {path}/{hint}")
+        with open(meta_file, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != STORE_FORMAT:
+            raise RuntimeError(f"{path}: unsupported embedding store format {meta.get('format')}")
+
+        X = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+        label_idx = np.load(os.path.join(path, "labels.npy"), allow_pickle=False)
+        if X.shape[0] != meta["count"] or len(label_idx) != meta["count"]:
+            raise RuntimeError(f"{path}: row counts don't match meta.json (store written while reading?)")
+        return cls(X, label_idx, meta["labels"], meta.get("embedder"), path=path)
+
+
+def save_embeddings(embeddings, names, embedder: str = None, store_dir: str = EMBEDDING_STORE_DIR, **provenance):
+    # not `path`: that is a provenance column (path=[...])
+    store = EmbeddingStore.from_rows(embeddings, names, embedder, **provenance)
+    store.save(store_dir)
+    return store
+
+
+def load_embeddings(path: str = EMBEDDING_STORE_DIR, mmap: bool = True) -> EmbeddingStore:
+    return EmbeddingStore.load(path, mmap)
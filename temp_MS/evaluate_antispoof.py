@@ -1,4 +1,6 @@
 # evaluate_antispoof.py
+# Confusion matrix + AUC on antispoof_dataset/{real,spoof}. evaluate() is also
+# used by quantize_antispoof.py to score the INT8 variants against FP32.
 import glob
 import numpy as np
 import cv2
@@ -7,26 +9,43 @@ from sklearn.metrics import confusion_matrix, roc_auc_score
 
 DATASET = "antispoof_dataset"
 
-real_files = glob.glob(f"{DATASET}/real/*.*")
-spoof_files = glob.glob(f"{DATASET}/spoof/*.*")
 
-y_true = []
-y_scores = []
+def evaluate(session=None, dataset=DATASET, thresh=0.5):
+    """
+    session: an onnxruntime session (default: the model antispoof.py selected).
+    Returns {"confusion_matrix", "auc", "accuracy", "samples"}.
+    """
+    real_files = glob.glob(f"{dataset}/real/*.*")
+    spoof_files = glob.glob(f"{dataset}/spoof/*.*")
 
-for f in real_files:
-    img = cv2.imread(f)
-    real, s = is_real_face(img)
-    y_true.append(1)
-    y_scores.append(s)
+    y_true = []
+    y_scores = []
 
-for f in spoof_files:
-    img = cv2.imread(f)
-    real, s = is_real_face(img)
-    y_true.append(0)
-    y_scores.append(s)
+    for label, files in ((1, real_files), (0, spoof_files)):
+        for f in files:
+            img = cv2.imread(f)
+            if img is None:
+                continue
+            real, s = is_real_face(img, thresh, session)
+            y_true.append(label)
+            y_scores.append(s)
 
-preds = [1 if s >= 0.5 else 0 for s in y_scores]
+    preds = [1 if s >= thresh else 0 for s in y_scores]
+    auc = roc_auc_score(y_true, y_scores) if len(set(y_true)) == 2 else None
+    return {
+        "confusion_matrix": confusion_matrix(y_true, preds, labels=[0, 1]).tolist(),
+        "auc": None if auc is None else round(float(auc), 5),
+        "accuracy": round(float(np.mean(np.array(preds) == np.array(y_true))), 5) if y_true else None,
+        "samples": len(y_true),
+    }
 
-print("Confusion Matrix:")
-print(confusion_matrix(y_true, preds))
-print("AUC:", roc_auc_score(y_true, y_scores))
+
+def main():
+    report = evaluate()
+    print("Confusion Matrix:")
+    print(np.array(report["confusion_matrix"]))
+    print("AUC:", report["auc"])
+
+
+if __name__ == "__main__":
+    main()
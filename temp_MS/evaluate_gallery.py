@@ -0,0 +1,94 @@
+# evaluate_gallery.py
+# Accuracy + latency parity check: cosine gallery matcher vs the linear SVC,
+# both trained on the same split of the embedding store as train_classifier.py.
+# Exits with status 1 if the gallery is less accurate than the SVC by more
+# than ACCURACY_TOLERANCE.
+import sys
+import time
+import numpy as np
+from sklearn.svm import SVC
+from sklearn.preprocessing import LabelEncoder
+from sklearn.model_selection import train_test_split
+
+from embedding_store import EMBEDDING_STORE_DIR, load_embeddings
+from gallery import GalleryMatcher
+
+ACCURACY_TOLERANCE = 0.01
+BATCH_SIZES = [1, 8, 32, 64]
+REPEATS = 20
+
+
+def time_ms(fn, repeats=REPEATS):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+def main():
+    store = load_embeddings(EMBEDDING_STORE_DIR)
+
+    names = store.names
+    embeddings = store.embeddings
+    print(f"Embeddings: {len(embeddings)}  Students: {len(set(names))}")
+
+    encoder = LabelEncoder()
+    y = encoder.fit_transform(names)
+    X_train, X_test, y_train, y_test = train_test_split(
+        embeddings, y, test_size=0.2, stratify=y, random_state=42
+    )
+    names_train = encoder.classes_[y_train]
+    names_test = encoder.classes_[y_test]
+
+    # ---------- training time ----------
+    t0 = time.perf_counter()
+    clf = SVC(kernel="linear", probability=True)
+    clf.fit(X_train, y_train)
+    svc_train_s = time.perf_counter() - t0
+
+    results = {}
+    for mode in ("centroid", "all"):
+        t0 = time.perf_counter()
+        g = GalleryMatcher.build(X_train, names_train, mode=mode)
+        results[mode] = (g, time.perf_counter() - t0)
+
+    # ---------- accuracy ----------
+    svc_pred = encoder.classes_[np.argmax(clf.predict_proba(X_test), axis=1)]
+    svc_acc = float(np.mean(svc_pred == names_test))
+
+    print("\n=== ACCURACY (closed set) ===")
+    print(f"svc       : {svc_acc:.4f}  (train {svc_train_s:.2f}s)")
+
+    failed = False
+    for mode, (g, build_s) in results.items():
+        pred, _, _ = g.predict(X_test)
+        acc = float(np.mean(pred == names_test))
+        agree = float(np.mean(pred == svc_pred))
+        ok = acc >= svc_acc - ACCURACY_TOLERANCE
+        failed |= not ok
+        print(f"{mode:<10}: {acc:.4f}  (build {build_s:.3f}s, agrees with svc {agree*100:.1f}%) "
+              f"{'PASS' if ok else 'FAIL'}")
+
+    # ---------- latency ----------
+    print("\n=== LATENCY (median ms per batch) ===")
+    print(f"{'faces':>5} | {'svc+encoder':>11} | {'centroid':>9} | {'all':>9}")
+    for n in BATCH_SIZES:
+        q = X_test[np.arange(n) % len(X_test)]
+
+        def svc_per_face():
+            for emb in q:
+                probs = clf.predict_proba([emb])[0]
+                encoder.inverse_transform([int(np.argmax(probs))])
+
+        svc_ms = time_ms(svc_per_face)
+        cen_ms = time_ms(lambda: results["centroid"][0].predict(q))
+        all_ms = time_ms(lambda: results["all"][0].predict(q))
+        print(f"{n:>5} | {svc_ms:>11.2f} | {cen_ms:>9.3f} | {all_ms:>9.3f}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
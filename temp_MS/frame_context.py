@@ -0,0 +1,41 @@
+# frame_context.py
+# Per-frame preprocessing context: the BGR frame is converted to RGB / grey
+# at most once per frame, and every stage (detection, antispoof crops, chips)
+# shares the same arrays instead of converting the full frame per face.
+import threading
+import cv2
+
+
+class FrameContext:
+    def __init__(self, frame_bgr):
+        self.bgr = frame_bgr
+        self._rgb = None
+        self._gray = None
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.bgr.shape
+
+    @property
+    def rgb(self):
+        if self._rgb is None:
+            with self._lock:
+                if self._rgb is None:
+                    self._rgb = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+        return self._rgb
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            with self._lock:
+                if self._gray is None:
+                    self._gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def crop(self, box):
+        """
+        BGR view (no copy) of a clamped (x1, y1, x2, y2) box.
+        """
+        x1, y1, x2, y2 = box
+        return self.bgr[y1:y2, x1:x2]
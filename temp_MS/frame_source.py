@@ -0,0 +1,92 @@
+# frame_source.py
+# Frame readers shared by the live recogniser, benchmarks and replay tools.
+# A source can be:
+#   - a camera index (0, "0")
+#   - a video file or stream URL (rtsp://..., http://...)
+#   - a directory of images (read recursively, sorted by path)
+import os
+import cv2
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_image_files(folder: str):
+    out = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTS):
+                out.append(os.path.join(root, name))
+    out.sort()
+    return out
+
+
+class ImageFolderCapture:
+    """
+    Minimal cv2.VideoCapture look-alike over a directory of images.
+    """
+
+    def __init__(self, folder: str):
+        self.files = list_image_files(folder)
+        self.pos = 0
+
+    def isOpened(self):
+        return self.pos < len(self.files)
+
+    def read(self):
+        while self.pos < len(self.files):
+            path = self.files[self.pos]
+            self.pos += 1
+            img = cv2.imread(path)
+            if img is not None:
+                return True, img
+        return False, None
+
+    @property
+    def current_path(self):
+        return self.files[self.pos - 1] if self.pos > 0 else None
+
+    def get(self, prop):
+        return 0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.pos = len(self.files)
+
+
+def open_source(source, width: int = None, height: int = None):
+    """
+    Returns a cv2.VideoCapture (or ImageFolderCapture) for the given source.
+    width/height are only applied to cameras.
+    """
+    if isinstance(source, str) and source.strip().isdigit():
+        source = int(source.strip())
+
+    if isinstance(source, str) and os.path.isdir(source):
+        return ImageFolderCapture(source)
+
+    cap = cv2.VideoCapture(source)
+    if isinstance(source, int) and width and height:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return cap
+
+
+def iter_frames(source, limit: int = None):
+    """
+    Yields frames from a source until it ends or `limit` frames were read.
+    """
+    cap = open_source(source)
+    count = 0
+    try:
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+            count += 1
+            if limit and count >= limit:
+                break
+    finally:
+        cap.release()
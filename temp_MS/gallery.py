@@ -0,0 +1,165 @@
+# gallery.py
+# Vectorised cosine-similarity gallery matcher (alternative to the pickled SVC).
+# - Holds L2-normalised embeddings (or one centroid per student) in one contiguous float32 matrix
+# - Scores a whole batch of query faces with a single matmul
+# - Top-k labels come straight from a precomputed label array (no LabelEncoder)
+# - Open-set: a calibrated similarity threshold (+ optional top1/top2 margin) rejects unknown faces
+# Saved as gallery.npz (plain numpy arrays, no pickle), with the embedder signature
+# it was built from so consumers (roster galleries) can refuse other embeddings.
+
+import os
+
+import numpy as np
+
+GALLERY_FILE = "gallery.npz"
+
+
+def l2_normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    if x.ndim == 1:
+        x = x[None, :]
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+class GalleryMatcher:
+    def __init__(self, matrix, row_labels, label_names, threshold: float = 0.0, margin: float = 0.0,
+                 mode: str = "centroid", embedder: str = None):
+        # rows are kept sorted by label so per-label max is a single reduceat
+        order = np.argsort(row_labels, kind="stable")
+        self.matrix = np.ascontiguousarray(l2_normalize(matrix)[order], dtype=np.float32)
+        self.row_labels = np.asarray(row_labels, dtype=np.int32)[order]
+        self.label_names = np.asarray(label_names)
+        self.threshold = float(threshold)
+        self.margin = float(margin)
+        self.mode = mode
+        self.embedder = embedder
+
+        self._one_row_per_label = len(self.row_labels) == len(self.label_names)
+        self._offsets = np.searchsorted(self.row_labels, np.arange(len(self.label_names)))
+
+    # ----------------------------
+    # build / save / load
+    # ----------------------------
+    @classmethod
+    def build(cls, embeddings, names, mode: str = "centroid", threshold: float = 0.0, margin: float = 0.0,
+              embedder: str = None):
+        """
+        mode="centroid": one L2-normalised mean embedding per student (smallest, fastest)
+        mode="all":      every enrolment embedding, score = best match per student
+        """
+        names = np.asarray(names)
+        label_names, row_labels = np.unique(names, return_inverse=True)
+        X = l2_normalize(np.asarray(embeddings, dtype=np.float32))
+
+        if mode == "centroid":
+            D = X.shape[1]
+            centroids = np.zeros((len(label_names), D), dtype=np.float32)
+            np.add.at(centroids, row_labels, X)
+            return cls(centroids, np.arange(len(label_names)), label_names, threshold, margin, mode, embedder)
+
+        if mode == "all":
+            return cls(X, row_labels, label_names, threshold, margin, mode, embedder)
+
+        raise ValueError(f"Unknown gallery mode: {mode}")
+
+    def save(self, path: str = GALLERY_FILE):
+        # temp file + rename so a hot-reloading recogniser never reads a partial file
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            self._savez(f)
+        os.replace(tmp, path)
+
+    def _savez(self, f):
+        np.savez(
+            f,
+            matrix=self.matrix,
+            row_labels=self.row_labels,
+            label_names=self.label_names.astype(str),
+            threshold=np.float32(self.threshold),
+            margin=np.float32(self.margin),
+            mode=np.array(self.mode),
+            embedder=np.array(self.embedder or ""),
+        )
+
+    @classmethod
+    def load(cls, path: str = GALLERY_FILE):
+        with np.load(path, allow_pickle=False) as z:
+            return cls(
+                z["matrix"], z["row_labels"], z["label_names"],
+                threshold=float(z["threshold"]), margin=float(z["margin"]), mode=str(z["mode"]),
+                embedder=(str(z["embedder"]) or None) if "embedder" in z.files else None,
+            )
+
+    # ----------------------------
+    # matching
+    # ----------------------------
+    def label_scores(self, queries):
+        """
+        Returns (N, L) cosine similarity of each query to each student.
+        """
+        q = l2_normalize(queries)
+        sims = q @ self.matrix.T
+        if self._one_row_per_label:
+            return sims
+        return np.maximum.reduceat(sims, self._offsets, axis=1)
+
+    def match(self, queries, k: int = 1):
+        """
+        Returns (top_idx, top_scores), both (N, k), best first.
+        """
+        scores = self.label_scores(queries)
+        k = max(1, min(k, scores.shape[1]))
+        if k < scores.shape[1]:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1)
+        top_idx = np.take_along_axis(part, order, axis=1)
+        top_scores = np.take_along_axis(part_scores, order, axis=1)
+        return top_idx, top_scores
+
+    def predict(self, queries):
+        """
+        Returns (names, scores, accepted) for a batch of query embeddings.
+        accepted is False when the best score is under the threshold or too
+        close to the runner-up (open-set rejection).
+        """
+        top_idx, top_scores = self.match(queries, k=2)
+        best = top_scores[:, 0]
+        accepted = best >= self.threshold
+        if self.margin > 0 and top_scores.shape[1] > 1:
+            accepted &= (best - top_scores[:, 1]) >= self.margin
+        return self.label_names[top_idx[:, 0]], best, accepted
+
+    # ----------------------------
+    # calibration
+    # ----------------------------
+    def calibrate(self, embeddings, names, target_far: float = 0.01):
+        """
+        Picks the threshold so that at most target_far of held-out faces are
+        accepted as the wrong student. Returns a small report dict.
+        """
+        names = np.asarray(names)
+        name_to_idx = {n: i for i, n in enumerate(self.label_names)}
+        keep = np.array([n in name_to_idx for n in names])
+        if not keep.any():
+            raise ValueError("No calibration samples belong to gallery students")
+
+        scores = self.label_scores(np.asarray(embeddings)[keep])
+        true_idx = np.array([name_to_idx[n] for n in names[keep]])
+        rows = np.arange(len(true_idx))
+
+        genuine = scores[rows, true_idx].copy()
+        scores[rows, true_idx] = -np.inf
+        impostor = scores.max(axis=1) if scores.shape[1] > 1 else np.full(len(rows), -1.0)
+
+        self.threshold = float(np.quantile(impostor, 1.0 - target_far))
+        return {
+            "threshold": self.threshold,
+            "target_far": target_far,
+            "far": float(np.mean(impostor >= self.threshold)),
+            "tar": float(np.mean(genuine >= self.threshold)),
+            "samples": int(len(rows)),
+        }
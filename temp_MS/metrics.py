@@ -0,0 +1,194 @@
+# metrics.py
+# In-process metrics for the camera clients, served over a small local HTTP endpoint.
+# - Per-stage latency histograms (capture, detect, landmark, embed, antispoof, classify, post)
+# - Gauges read on scrape from callbacks (FPS, dropped frames, snapshot queue depth, ...)
+# - GET /metrics       -> Prometheus text format
+# - GET /metrics.json  -> the same values as JSON (for quick curl checks / simple dashboards)
+#
+# Stages record into the module-level METRICS registry, so recognition.py, the
+# uploader and the pipeline threads don't need a metrics object passed around.
+
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "attendance"
+
+# seconds; covers a 1 ms ONNX call up to a slow HTTP post
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, name: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot = +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = []
+        running = 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return {
+            "count": count,
+            "sum": total,
+            "mean": (total / count) if count else 0.0,
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], cumulative)),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._hists = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+        # raw samples per stage, only kept when a benchmark asks for exact percentiles
+        self.keep_samples = False
+        self._samples = {}
+
+    def histogram(self, stage: str) -> Histogram:
+        with self._lock:
+            h = self._hists.get(stage)
+            if h is None:
+                h = self._hists[stage] = Histogram(stage)
+            return h
+
+    def observe(self, stage: str, seconds: float):
+        self.histogram(stage).observe(seconds)
+        if self.keep_samples:
+            with self._lock:
+                self._samples.setdefault(stage, []).append(seconds)
+
+    def samples(self) -> dict:
+        with self._lock:
+            return {stage: list(v) for stage, v in self._samples.items()}
+
+    def reset(self):
+        with self._lock:
+            self._hists = {}
+            self._samples = {}
+
+    @contextmanager
+    def timer(self, stage: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def gauge(self, name: str, fn, help_text: str = ""):
+        """
+        Registers a callback evaluated on every scrape. fn() returns a number or None.
+        """
+        with self._lock:
+            self._gauges[name] = (fn, help_text)
+
+    def _gauge_values(self):
+        with self._lock:
+            gauges = list(self._gauges.items())
+        out = {}
+        for name, (fn, help_text) in gauges:
+            try:
+                value = fn()
+            except Exception:
+                value = None
+            out[name] = (value, help_text)
+        return out
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            hists = list(self._hists.values())
+        return {
+            "ts": time.time(),
+            "latency_seconds": {h.name: h.snapshot() for h in hists},
+            "gauges": {name: value for name, (value, _) in self._gauge_values().items()},
+        }
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            hists = list(self._hists.values())
+        lines = [
+            f"# HELP {PREFIX}_stage_latency_seconds Per-stage processing latency",
+            f"# TYPE {PREFIX}_stage_latency_seconds histogram",
+        ]
+        for h in hists:
+            snap = h.snapshot()
+            for le, count in snap["buckets"].items():
+                lines.append(f'{PREFIX}_stage_latency_seconds_bucket{{stage="{h.name}",le="{le}"}} {count}')
+            lines.append(f'{PREFIX}_stage_latency_seconds_sum{{stage="{h.name}"}} {snap["sum"]:.6f}')
+            lines.append(f'{PREFIX}_stage_latency_seconds_count{{stage="{h.name}"}} {snap["count"]}')
+
+        for name, (value, help_text) in self._gauge_values().items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            if help_text:
+                lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            lines.append(f"{PREFIX}_{name} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = METRICS
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.registry.prometheus_text().encode("utf-8")
+            ctype = "text/plain; version=0.0.4; charset=utf-8"
+        elif path in ("/metrics.json", "/"):
+            body = json.dumps(self.registry.as_dict()).encode("utf-8")
+            ctype = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        # scrapes every few seconds would flood the console
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1", registry: Metrics = METRICS):
+    """
+    Serves the registry on http://host:port/metrics in a daemon thread.
+    Returns the server (call .shutdown() to stop), or None if port is 0 / busy.
+    """
+    if not port:
+        return None
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        print(f"[METRICS] Could not bind {host}:{port} ({e}), metrics endpoint disabled")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"[METRICS] Serving http://{host}:{port}/metrics")
+    return server
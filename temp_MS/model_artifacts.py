@@ -0,0 +1,170 @@
+# model_artifacts.py
+# Versioned face-matcher artifacts and hot reload.
+# - Training scripts write classifier.pkl / labels.pkl / gallery.npz / prototypes.npz
+#   atomically (temp file + os.replace) and then bump their matcher's entry in
+#   model_version.json: {"matchers": {"svc": {...}, "gallery": {...}, ...}}, each
+#   with its own version, files and embedder, so training one matcher never
+#   changes what the others' recognisers see
+# - ModelWatcher polls its matcher's entry (or the artifact mtimes if there is
+#   no entry yet), loads the new version on its own thread and hands it over in
+#   one assignment, so recognisers pick up new students without a restart
+import json
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+
+MANIFEST_FILE = "model_version.json"
+RELOAD_POLL_SECONDS = 10.0
+SETTLE_SECONDS = 2.0       # artifacts without a manifest must be unchanged this long before loading
+
+
+def atomic_write(path: str, write_fn, mode: str = "wb"):
+    """
+    Writes via a temp file in the same directory and renames it over path,
+    so a reader never sees a half-written artifact.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, mode) as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def atomic_pickle_dump(obj, path: str):
+    atomic_write(path, lambda f: pickle.dump(obj, f))
+
+
+def _read_manifests(path: str) -> dict:
+    """
+    {matcher: entry} from path. A single-matcher manifest from before per-matcher
+    entries counts as that matcher's entry.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if "matchers" in data:
+        return dict(data["matchers"])
+    return {data["matcher"]: data} if data.get("matcher") else {}
+
+
+def read_manifest(matcher: str, path: str = MANIFEST_FILE):
+    """
+    The manifest entry of one matcher ("svc", "gallery", "prototype"), or None.
+    """
+    return _read_manifests(path).get(matcher)
+
+
+def write_manifest(matcher: str, files, path: str = MANIFEST_FILE, **extra) -> dict:
+    """
+    Bumps this matcher's version after its artifacts were written. Call it last.
+    Entries of the other matchers are kept as they are.
+    """
+    manifests = _read_manifests(path)
+    prev = manifests.get(matcher) or {}
+    manifest = {
+        "version": int(prev.get("version", 0)) + 1,
+        "matcher": matcher,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "files": list(files),
+        **{k: v for k, v in extra.items() if v is not None},
+    }
+    manifests[matcher] = manifest
+    atomic_write(path, lambda f: json.dump({"matchers": manifests}, f, indent=2), mode="w")
+    return manifest
+
+
+def files_signature(files):
+    sig = []
+    for p in files:
+        try:
+            st = os.stat(p)
+            sig.append((p, st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append((p, None, None))
+    return tuple(sig)
+
+
+class ModelWatcher(threading.Thread):
+    """
+    Background reloader.
+    load_fn() builds the new model object (slow, runs on this thread);
+    swap_fn(model) installs it (fast, one reference assignment in the caller).
+    The model in use stays active until swap_fn returns, and also if loading fails.
+    """
+
+    def __init__(self, matcher: str, files, load_fn, swap_fn, manifest: str = MANIFEST_FILE,
+                 poll_seconds: float = RELOAD_POLL_SECONDS, on_reload=None):
+        super().__init__(name="model-watcher", daemon=True)
+        self.matcher = matcher
+        self.files = list(files)
+        self.load_fn = load_fn
+        self.swap_fn = swap_fn
+        self.manifest = manifest
+        self.poll_seconds = poll_seconds
+        self.on_reload = on_reload
+        self._stop_event = threading.Event()
+
+        self._seen = self._current_key()
+        self._pending_key = None
+        self._pending_since = 0.0
+
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload_seconds = None
+        self.last_error = None
+
+    def _current_key(self):
+        m = read_manifest(self.matcher, self.manifest)
+        if m is not None:
+            return ("manifest", m.get("version"))
+        return ("files", files_signature(self.files))
+
+    def run(self):
+        while not self._stop_event.wait(self.poll_seconds):
+            key = self._current_key()
+            if key == self._seen:
+                self._pending_key = None
+                continue
+
+            # a manifest is only written after the artifacts, no need to wait;
+            # bare files may still be mid-copy, so wait until they stop changing
+            if key[0] == "files":
+                if key != self._pending_key:
+                    self._pending_key, self._pending_since = key, time.time()
+                    continue
+                if time.time() - self._pending_since < SETTLE_SECONDS:
+                    continue
+
+            self._reload(key)
+
+    def _reload(self, key):
+        t0 = time.perf_counter()
+        try:
+            model = self.load_fn()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"[MODEL] Reload failed, keeping current model ({self.last_error})")
+            # retry on the next change only
+            self._seen = key
+            return
+
+        self.swap_fn(model)
+        self._seen = key
+        self._pending_key = None
+        self.reloads += 1
+        self.last_error = None
+        self.last_reload_seconds = time.perf_counter() - t0
+        print(f"[MODEL] Reloaded in {self.last_reload_seconds:.2f}s")
+        if self.on_reload is not None:
+            self.on_reload(model, self.last_reload_seconds)
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,326 @@
+# pipeline.py
+# Threading helpers for the live recogniser:
+# - DropOldestQueue: bounded queue that throws away the oldest item when full
+# - StageStats: per-stage FPS + queue depth counters
+# - LatestFrameGrabber: capture thread that only keeps the newest camera frame
+# - StageThread: small worker thread that pulls from one queue and pushes to another
+# - FairQueue: per-source bounded queues drained round-robin (multi-camera batching)
+# - worker_process_context: start method for the worker process pools
+
+import multiprocessing
+import threading
+import time
+from collections import deque
+
+from metrics import METRICS
+
+
+class DropOldestQueue:
+    """
+    Bounded FIFO queue with drop-oldest semantics.
+    put() never blocks: if the queue is full the oldest item is discarded,
+    so consumers always work on the freshest data.
+    """
+
+    def __init__(self, maxsize: int = 2, on_drop=None):
+        self.maxsize = max(1, int(maxsize))
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self.on_drop = on_drop      # called with each discarded item (e.g. to free its frame slot)
+
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            if self._closed:
+                dropped = item
+            else:
+                if len(self._items) >= self.maxsize:
+                    dropped = self._items.popleft()
+                    self.dropped += 1
+                self._items.append(item)
+                self._cond.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout: float = None):
+        """
+        Returns the next item, or None on timeout / when closed and empty.
+        """
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+class StageStats:
+    """
+    Thread-safe counters for one pipeline stage.
+    FPS is measured over a sliding window of WINDOW_SECONDS.
+    """
+
+    WINDOW_SECONDS = 5.0
+
+    def __init__(self, name: str, queue: DropOldestQueue = None):
+        self.name = name
+        self.queue = queue
+        self.processed = 0
+        self._first_ts = None
+        self._ticks = deque()
+        self._lock = threading.Lock()
+
+    def tick(self, n: int = 1):
+        now = time.time()
+        with self._lock:
+            if self._first_ts is None:
+                self._first_ts = now
+            self.processed += n
+            self._ticks.append((now, n))
+            self._trim(now)
+
+    def _trim(self, now):
+        while self._ticks and now - self._ticks[0][0] > self.WINDOW_SECONDS:
+            self._ticks.popleft()
+
+    def fps(self) -> float:
+        now = time.time()
+        with self._lock:
+            self._trim(now)
+            if not self._ticks:
+                return 0.0
+            total = sum(n for _, n in self._ticks)
+            # during the first few seconds the window is not full yet
+            span = min(self.WINDOW_SECONDS, max(now - self._first_ts, 1e-3))
+            return total / span
+
+    def snapshot(self) -> dict:
+        return {
+            "stage": self.name,
+            "fps": round(self.fps(), 2),
+            "processed": self.processed,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "dropped": self.queue.dropped if self.queue is not None else 0,
+        }
+
+
+def format_stats(stats: list) -> str:
+    parts = []
+    for s in stats:
+        snap = s.snapshot()
+        part = f"{snap['stage']}={snap['fps']:.1f}fps"
+        if s.queue is not None:
+            part += f" q={snap['queue_depth']} drop={snap['dropped']}"
+        parts.append(part)
+    return " | ".join(parts)
+
+
+class LatestFrameGrabber(threading.Thread):
+    """
+    Reads frames from a cv2.VideoCapture as fast as the camera delivers them
+    and keeps only the newest one. Consumers call wait_frame(last_seq) to get
+    a frame newer than the one they already processed, so a slow consumer
+    never sees stale frames piled up in the camera buffer.
+    """
+
+    def __init__(self, cap, name: str = "capture", pace_fps: float = 0.0):
+        super().__init__(name=name, daemon=True)
+        self.cap = cap
+        # video files are read as fast as the disk allows; pace_fps > 0 plays them in real time
+        # (also lowered at runtime to idle a camera between lessons)
+        self.pace_fps = pace_fps
+        self.stats = StageStats(name)
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._ts = 0.0
+        self._consumed_seq = 0
+        self._stopped = False
+        self.dropped = 0
+        self.failed = False
+
+    def run(self):
+        next_ts = time.time()
+        while not self._stopped:
+            if self.pace_fps > 0:
+                next_ts += 1.0 / self.pace_fps
+                delay = next_ts - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_ts = time.time()
+            t0 = time.perf_counter()
+            ret, frame = self.cap.read()
+            METRICS.observe("capture", time.perf_counter() - t0)
+            if not ret:
+                with self._cond:
+                    self.failed = True
+                    self._stopped = True
+                    self._cond.notify_all()
+                break
+
+            with self._cond:
+                # previous frame was never picked up by a consumer
+                if self._frame is not None and self._seq > self._consumed_seq:
+                    self.dropped += 1
+                self._frame = frame
+                self._seq += 1
+                self._ts = time.time()
+                self._cond.notify_all()
+            self.stats.tick()
+
+    def wait_frame(self, last_seq: int = 0, timeout: float = 1.0):
+        """
+        Returns (seq, ts, frame) for the newest frame with seq > last_seq,
+        or None on timeout / when the camera stopped.
+        """
+        with self._cond:
+            if self._seq <= last_seq and not self._stopped:
+                self._cond.wait(timeout)
+            if self._seq <= last_seq or self._frame is None:
+                return None
+            self._consumed_seq = self._seq
+            return self._seq, self._ts, self._frame
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def has_new(self, last_seq: int) -> bool:
+        return self._seq > last_seq
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped
+
+
+class StageThread(threading.Thread):
+    """
+    Generic pipeline stage: item = in_q.get(); out = fn(item); out_q.put(out).
+    fn may return None to emit nothing. Several StageThreads can share the same
+    queues to form a worker pool.
+    """
+
+    def __init__(self, name: str, fn, in_q: DropOldestQueue, out_q: DropOldestQueue = None,
+                 stats: StageStats = None):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.in_q = in_q
+        self.out_q = out_q
+        self.stats = stats or StageStats(name, in_q)
+        self._stopped = False
+
+    def run(self):
+        while not self._stopped:
+            item = self.in_q.get(timeout=0.5)
+            if item is None:
+                if self.in_q.closed:
+                    break
+                continue
+            try:
+                out = self.fn(item)
+            except Exception as e:
+                print(f"[PIPELINE] {self.name} error: {e}")
+                continue
+            self.stats.tick()
+            if out is not None and self.out_q is not None:
+                self.out_q.put(out)
+
+    def stop(self):
+        self._stopped = True
+
+
+class FairQueue:
+    """
+    One bounded drop-oldest deque per source (e.g. per camera). get_batch()
+    takes items round-robin across sources, so a busy camera cannot starve
+    the others, and one batch can mix faces from several cameras.
+    """
+
+    def __init__(self, maxsize_per_key: int = 32):
+        self.maxsize_per_key = max(1, int(maxsize_per_key))
+        self._queues = {}
+        self._order = []
+        self._rr = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, key, item):
+        with self._cond:
+            if self._closed:
+                return
+            q = self._queues.get(key)
+            if q is None:
+                q = self._queues[key] = deque()
+                self._order.append(key)
+            if len(q) >= self.maxsize_per_key:
+                q.popleft()
+                self.dropped += 1
+            q.append(item)
+            self._cond.notify()
+
+    def get_batch(self, max_items: int, timeout: float = None):
+        """
+        Returns up to max_items items (possibly from several keys), or [] on timeout / close.
+        """
+        with self._cond:
+            if not self._has_items() and not self._closed:
+                self._cond.wait(timeout)
+            batch = []
+            while len(batch) < max_items and self._has_items():
+                key = self._order[self._rr % len(self._order)]
+                self._rr += 1
+                q = self._queues[key]
+                if q:
+                    batch.append(q.popleft())
+            return batch
+
+    def _has_items(self) -> bool:
+        return any(self._queues.values())
+
+    def qsize(self) -> int:
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+def worker_process_context():
+    """
+    multiprocessing context for worker process pools (embed_pool.py, tiled
+    detection). Never fork: the recogniser has ONNX Runtime sessions (antispoof,
+    onnx embedder) from the moment recognition.py is imported, and a fork copies
+    their thread pools' locks without the threads. forkserver where available,
+    spawn otherwise (Windows). Either re-imports the recogniser script in each
+    worker; recognition.py skips its models there (IN_WORKER_PROCESS).
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
@@ -0,0 +1,213 @@
+# prototypes.py
+# Incremental prototype classifier (alternative to retraining the SVC).
+# - Every student is a few prototypes: k-means centres (PROTOTYPES_PER_STUDENT)
+#   of their L2-normalised enrolment embeddings, or the centroid when they
+#   have too few images. Adding, replacing or removing a student only touches
+#   that student's embeddings; the others are kept as they are.
+# - Scoring is a GalleryMatcher over all prototypes (one matmul, best
+#   prototype per student).
+# - Probability: a logistic map from the best cosine similarity to
+#   P(correct student), fitted on a held-out split (calibrate()). It stays
+#   valid while students are added; refit it now and then (train_prototypes.py
+#   --recalibrate) or when the embedder changes.
+# Saved as prototypes.npz (plain numpy arrays, no pickle). recognition.py
+# loads it with MATCHER = "prototype".
+import hashlib
+import os
+
+import numpy as np
+
+from gallery import GalleryMatcher, l2_normalize
+
+PROTOTYPE_FILE = "prototypes.npz"
+PROTOTYPES_PER_STUDENT = 3
+MIN_IMAGES_PER_PROTOTYPE = 10    # fewer images than this per prototype -> fewer prototypes
+ACCEPT_PROBA = 0.70              # same meaning as recognition.ACCEPT_PROBA for the SVC
+
+
+def fingerprint(embeddings) -> str:
+    """
+    Content hash of one student's embedding rows (detects re-enrolment).
+    """
+    return hashlib.sha1(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes()).hexdigest()
+
+
+def student_prototypes(embeddings, k: int = PROTOTYPES_PER_STUDENT, seed: int = 0):
+    """
+    (k', D) L2-normalised prototypes for one student, k' <= k.
+    """
+    X = l2_normalize(embeddings)
+    k = max(1, min(k, len(X) // MIN_IMAGES_PER_PROTOTYPE))
+    if k == 1:
+        return l2_normalize(X.mean(axis=0))
+
+    from sklearn.cluster import KMeans
+
+    km = KMeans(n_clusters=k, n_init=3, random_state=seed).fit(X)
+    return l2_normalize(km.cluster_centers_)
+
+
+class PrototypeClassifier:
+    def __init__(self, k: int = PROTOTYPES_PER_STUDENT, a: float = 10.0, b: float = -5.0,
+                 accept_proba: float = ACCEPT_PROBA, margin: float = 0.0, embedder: str = None):
+        self.k = k
+        self.a = float(a)                 # P(correct) = sigmoid(a * best_similarity + b)
+        self.b = float(b)
+        self.accept_proba = float(accept_proba)
+        self.margin = float(margin)
+        self.embedder = embedder
+        self.students = {}                # name -> (prototypes (k', D), image count, fingerprint)
+        self._scorer = None
+
+    # ----------------------------
+    # incremental updates
+    # ----------------------------
+    def set_student(self, name: str, embeddings):
+        """
+        Adds or replaces one student. O(that student's images).
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if len(embeddings) == 0:
+            return self.remove_student(name)
+        self.students[str(name)] = (student_prototypes(embeddings, self.k), len(embeddings),
+                                    fingerprint(embeddings))
+        self._scorer = None
+        return True
+
+    def remove_student(self, name: str):
+        removed = self.students.pop(str(name), None) is not None
+        if removed:
+            self._scorer = None
+        return removed
+
+    def sync(self, embeddings, names):
+        """
+        Brings the model in line with a full set of rows: students whose rows
+        changed are rebuilt, missing ones removed, unchanged ones kept.
+        Returns (added, updated, removed) name lists.
+        """
+        names = np.asarray(names)
+        embeddings = np.asarray(embeddings)
+        order = np.argsort(names, kind="stable")
+        uniq, starts = np.unique(names[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+
+        added, updated = [], []
+        for name, s, e in zip(uniq, starts, ends):
+            rows = np.asarray(embeddings[np.sort(order[s:e])], dtype=np.float32)
+            current = self.students.get(str(name))
+            if current is not None and current[2] == fingerprint(rows):
+                continue
+            (updated if current is not None else added).append(str(name))
+            self.set_student(name, rows)
+
+        keep = {str(n) for n in uniq}
+        removed = [n for n in list(self.students) if n not in keep]
+        for n in removed:
+            self.remove_student(n)
+        return added, updated, removed
+
+    @property
+    def label_names(self):
+        return self.scorer().label_names
+
+    def scorer(self) -> GalleryMatcher:
+        """
+        One GalleryMatcher over every student's prototypes, rebuilt after changes.
+        """
+        if self._scorer is None:
+            names = sorted(self.students)
+            if not names:
+                raise ValueError("Prototype classifier has no students")
+            mats = [self.students[n][0] for n in names]
+            row_labels = np.repeat(np.arange(len(names)), [len(m) for m in mats])
+            self._scorer = GalleryMatcher(np.vstack(mats), row_labels, np.asarray(names), mode="prototypes")
+        return self._scorer
+
+    # ----------------------------
+    # prediction
+    # ----------------------------
+    def probability(self, similarity):
+        return 1.0 / (1.0 + np.exp(-(self.a * np.asarray(similarity, dtype=np.float32) + self.b)))
+
+    def predict(self, queries):
+        """
+        Returns (names, probabilities, accepted) for a batch of query embeddings,
+        the same shape of result as GalleryMatcher.predict / the SVC path.
+        """
+        scorer = self.scorer()
+        top_idx, top_scores = scorer.match(queries, k=2)
+        proba = self.probability(top_scores[:, 0])
+        accepted = proba >= self.accept_proba
+        if self.margin > 0 and top_scores.shape[1] > 1:
+            accepted &= (top_scores[:, 0] - top_scores[:, 1]) >= self.margin
+        return scorer.label_names[top_idx[:, 0]], proba, accepted
+
+    # ----------------------------
+    # calibration
+    # ----------------------------
+    def calibrate(self, embeddings, names):
+        """
+        Fits the similarity -> probability map on held-out rows (students not
+        in the model are ignored): label 1 where the best-scoring student is the
+        right one. Returns a small report dict.
+        """
+        from sklearn.linear_model import LogisticRegression
+
+        names = np.asarray(names).astype(str)
+        known = np.isin(names, list(self.students))
+        if not known.any():
+            raise ValueError("No calibration samples belong to known students")
+
+        scorer = self.scorer()
+        top_idx, top_scores = scorer.match(np.asarray(embeddings)[known], k=1)
+        best = top_scores[:, 0]
+        correct = (scorer.label_names[top_idx[:, 0]] == names[known]).astype(int)
+
+        if correct.min() == correct.max():
+            # nothing to separate (all right or all wrong): keep the current map
+            return {"a": self.a, "b": self.b, "samples": int(len(best)), "accuracy": float(correct.mean())}
+
+        lr = LogisticRegression(C=100.0).fit(best.reshape(-1, 1), correct)
+        self.a, self.b = float(lr.coef_[0, 0]), float(lr.intercept_[0])
+        proba = self.probability(best)
+        accepted = proba >= self.accept_proba
+        return {
+            "a": self.a,
+            "b": self.b,
+            "samples": int(len(best)),
+            "accuracy": float(correct.mean()),
+            "accept_rate": float(accepted.mean()),
+            "accepted_accuracy": float(correct[accepted].mean()) if accepted.any() else None,
+        }
+
+    # ----------------------------
+    # save / load
+    # ----------------------------
+    def save(self, path: str = PROTOTYPE_FILE):
+        # temp file + rename so a hot-reloading recogniser never reads a partial file
+        names = sorted(self.students)
+        mats = [self.students[n][0] for n in names]
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                matrix=np.vstack(mats).astype(np.float32) if mats else np.zeros((0, 0), np.float32),
+                row_labels=np.repeat(np.arange(len(names)), [len(m) for m in mats]).astype(np.int32),
+                label_names=np.asarray(names, dtype=str),
+                counts=np.asarray([self.students[n][1] for n in names], dtype=np.int64),
+                fingerprints=np.asarray([self.students[n][2] for n in names], dtype=str),
+                params=np.asarray([self.k, self.a, self.b, self.accept_proba, self.margin], dtype=np.float64),
+                embedder=np.array(self.embedder or ""),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = PROTOTYPE_FILE):
+        with np.load(path, allow_pickle=False) as z:
+            k, a, b, accept_proba, margin = (float(v) for v in z["params"])
+            model = cls(int(k), a, b, accept_proba, margin, embedder=str(z["embedder"]) or None)
+            matrix, row_labels = z["matrix"], z["row_labels"]
+            for i, name in enumerate(z["label_names"]):
+                model.students[str(name)] = (matrix[row_labels == i], int(z["counts"][i]), str(z["fingerprints"][i]))
+        return model
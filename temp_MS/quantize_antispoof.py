@@ -0,0 +1,136 @@
+# quantize_antispoof.py
+# INT8 builds of antispoof_best.onnx + the report antispoof.py selects from.
+# 1) dynamic INT8: weights quantised offline, activations at run time
+# 2) static INT8 (QDQ, per-channel): activation ranges calibrated on face crops
+#    from calibration_samples/ (calibration_capture.py)
+# 3) every variant (FP32 included) is scored with evaluate_antispoof.evaluate()
+#    (confusion matrix, AUC, accuracy on antispoof_dataset/) and timed with the
+#    benchmark_antispoof.py crops at several batch sizes
+# Writes antispoof_variants.json; antispoof.py then loads the fastest variant
+# that passes its accuracy gate (ANTISPOOF_MAX_AUC_DROP / ANTISPOOF_MAX_ACC_DROP).
+#
+# Usage: python quantize_antispoof.py [--skip-static] [--calib-limit 200]
+import argparse
+import glob
+import json
+import os
+
+import cv2
+import dlib
+import numpy as np
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                      quantize_dynamic, quantize_static)
+
+import antispoof
+from antispoof import MODEL_PATH, VARIANTS_FILE, make_session, passes_gate, preprocess, is_real_face_batch
+from benchmark_antispoof import load_crops, time_it
+from evaluate_antispoof import evaluate
+
+CALIB_DIR = "calibration_samples"
+DYNAMIC_PATH = "antispoof_best.int8_dynamic.onnx"
+STATIC_PATH = "antispoof_best.int8_static.onnx"
+LATENCY_BATCH_SIZES = [1, 8, 32]
+SELECT_BATCH = 8        # latency_ms used for selection (typical faces per frame batch)
+REPEATS = 20
+
+
+def calibration_crops(limit):
+    """
+    Face crops (same box as the live pipeline, no margin) from the calibration
+    frames; the whole image is used when no face is found.
+    """
+    detector = dlib.get_frontal_face_detector()
+    crops = []
+    for f in sorted(glob.glob(f"{CALIB_DIR}/*.jpg"))[:limit]:
+        img = cv2.imread(f)
+        if img is None:
+            continue
+        rects = detector(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), 0)
+        if len(rects):
+            r = max(rects, key=lambda r: r.width() * r.height())
+            H, W = img.shape[:2]
+            x1, y1 = max(0, r.left()), max(0, r.top())
+            x2, y2 = min(W, r.right()), min(H, r.bottom())
+            img = img[y1:y2, x1:x2] if x2 > x1 and y2 > y1 else img
+        crops.append(img)
+    return crops
+
+
+class CropReader(CalibrationDataReader):
+    def __init__(self, crops):
+        self._it = iter([{"input": preprocess(c)} for c in crops])
+
+    def get_next(self):
+        return next(self._it, None)
+
+
+def latency(session):
+    crops_all = load_crops(max(LATENCY_BATCH_SIZES))
+    out = {}
+    for n in LATENCY_BATCH_SIZES:
+        crops = crops_all[:n]
+        is_real_face_batch(crops, session)   # warm-up
+        out[str(n)] = round(time_it(lambda: is_real_face_batch(crops, session), REPEATS), 3)
+    return out
+
+
+def score(name, path):
+    print(f"\n== {name}: {path} ==")
+    session = make_session(path)
+    report = evaluate(session)
+    report["latency_ms_by_batch"] = latency(session)
+    report["latency_ms"] = report["latency_ms_by_batch"][str(SELECT_BATCH)]
+    report["path"] = path
+    report["size_mb"] = round(os.path.getsize(path) / (1024.0 * 1024.0), 2)
+    print(f"AUC: {report['auc']}  accuracy: {report['accuracy']}  "
+          f"batch {SELECT_BATCH}: {report['latency_ms']:.2f} ms  size: {report['size_mb']} MB")
+    print("Confusion Matrix:")
+    print(np.array(report["confusion_matrix"]))
+    return report
+
+
+def main():
+    p = argparse.ArgumentParser(description="INT8 quantisation + accuracy/latency report for the antispoof model")
+    p.add_argument("--skip-dynamic", action="store_true")
+    p.add_argument("--skip-static", action="store_true")
+    p.add_argument("--calib-limit", type=int, default=200, help="max calibration frames")
+    args = p.parse_args()
+
+    built = {"fp32": MODEL_PATH}
+
+    if not args.skip_dynamic:
+        print("Quantising (dynamic INT8)...")
+        quantize_dynamic(MODEL_PATH, DYNAMIC_PATH, weight_type=QuantType.QInt8)
+        built["int8_dynamic"] = DYNAMIC_PATH
+
+    if not args.skip_static:
+        crops = calibration_crops(args.calib_limit)
+        if not crops:
+            print(f"No calibration images in {CALIB_DIR}/, skipping static INT8 (run calibration_capture.py)")
+        else:
+            print(f"Quantising (static INT8, {len(crops)} calibration crops)...")
+            quantize_static(
+                MODEL_PATH, STATIC_PATH, CropReader(crops),
+                quant_format=QuantFormat.QDQ, per_channel=True,
+                activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                calibrate_method=CalibrationMethod.MinMax,
+            )
+            built["int8_static"] = STATIC_PATH
+
+    variants = {name: score(name, path) for name, path in built.items()}
+    for name, v in variants.items():
+        v["passes_gate"] = name == "fp32" or passes_gate(v, variants["fp32"])
+
+    with open(VARIANTS_FILE, "w", encoding="utf-8") as f:
+        json.dump({"select_batch": SELECT_BATCH, "variants": variants}, f, indent=2)
+
+    chosen, _ = antispoof.select_model(VARIANTS_FILE, "auto")
+    print(f"\nGate: AUC drop <= {antispoof.MAX_AUC_DROP}, accuracy drop <= {antispoof.MAX_ACC_DROP}")
+    for name, v in variants.items():
+        print(f"{name:>13} | AUC {v['auc']} | acc {v['accuracy']} | {v['latency_ms']:.2f} ms | "
+              f"{'pass' if v['passes_gate'] else 'FAIL'}")
+    print(f"\nSaved {VARIANTS_FILE}; antispoof.py will load: {chosen}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,36 @@
 import cv2
-import dlib
-import numpy as np
-import pickle
 import time
 import os
+import sys
+import threading
 from datetime import datetime
 import requests
 
-# Optional: antispoof (won't crash if missing)
-try:
-    from antispoof import is_real_face_raw
-    HAS_ANTISPOOF = True
-except Exception:
-    HAS_ANTISPOOF = False
+from pipeline import DropOldestQueue, StageStats, LatestFrameGrabber, StageThread, format_stats
+from tracker import FaceTracker
+from detection import min_safe_scale
+from frame_context import FrameContext
+from snapshot import SnapshotWindow
+from uploader import SnapshotSpool, SnapshotUploader
+from metrics import METRICS, start_metrics_server
+from roster import RosterGallery
+from activity import ActivityScheduler, DetectionScheduler, MotionDetector, ACTIVE, IDLE
+from embed_pool import EmbedPool
+from preprocess import BUFFERS
+from recognition import (
+    MIN_FACE_RATIO, DETECT_SCALE, DETECT_TILED, CHIP_SIZE, JITTERS,
+    close_tiled_detector, describe_detection, detect_boxes, recognise_faces, start_model_watcher,
+    start_tiled_detector,
+)
 
 
 # ==============================
 # CONFIG
 # ==============================
+# Recognition settings (thresholds, face size gate, antispoof, chip size,
+# matcher, detection scale/ROI) live in recognition.py, shared with
+# recognise_server.py.
+
 # IMPORTANT:
 # If your backend is mounted under /ai (e.g., include_router(..., prefix="/ai")),
 # set BASE_API = "http://localhost:8000/ai"
@@ -25,26 +38,69 @@ BASE_API = "http://localhost:8000"  # change to "http://localhost:8000/ai" if ne
 
 TODAY_LESSONS_URL = f"{BASE_API}/attendance/today-lessons"
 ATTENDANCE_AUTO_URL = f"{BASE_API}/attendance/auto"
+ROSTER_GALLERY_URL = f"{BASE_API}/attendance/roster-gallery"
+
+# Only match against students enrolled in this room's active / next lesson
+# (falls back to the full classifier/gallery when there is no roster)
+USE_ROSTER_GALLERY = True
 
-ACCEPT_PROBA = 0.70            # 70% threshold (face recognition confidence)
 SNAPSHOT_SECONDS = 60          # snapshot window length
 SCHEDULE_REFRESH_SECONDS = 300 # refresh today's lessons every 5 mins
 
-# Face size gating (relative to frame width)
-MIN_FACE_RATIO = 0.10
-MAX_FACE_RATIO = 0.60
-
-# Antispoof gating
-USE_ANTISPOOF_GATE = True
-ANTISPOOF_THRESH = 0.50
-
-# Dlib chip settings (speed vs accuracy)
-CHIP_SIZE = 120
-CHIP_PADDING = 0.25
-JITTERS = 0
-
-# Performance: detect every N frames
-DETECT_EVERY_N_FRAMES = 1
+# Snapshots are spooled to disk and posted by a background thread (uploader.py)
+SPOOL_FILE = "snapshot_spool.db"
+UPLOAD_TIMEOUT = 8             # seconds per POST (never blocks the video loop)
+
+# Idle mode: outside lessons the camera is only checked for motion at a low frame rate
+# (full detection + recognition resume WARMUP minutes before a lesson, or on motion)
+USE_IDLE_MODE = True
+IDLE_WARMUP_MINUTES = 10       # spin up the full pipeline this long before a lesson starts
+IDLE_COOLDOWN_MINUTES = 5      # ...and keep it up this long after a lesson ends
+IDLE_MOTION_HOLD_SECONDS = 120 # stay active this long after the last motion outside lessons
+IDLE_CAPTURE_FPS = 2.0         # camera read rate while idle
+IDLE_MOTION_WIDTH = 160        # motion check resolution (width in px)
+IDLE_MOTION_AREA = 0.01        # fraction of pixels that must change to count as motion
+
+# Performance: detect every N frames (tracks carry faces in between)
+DETECT_EVERY_N_FRAMES = 3      # used when adaptive detection is off
+
+# Adaptive detection: a per-frame motion check (160 px grey difference) decides
+# when HOG runs; fast when something moves near a face or an entrance, backing
+# off to DETECT_MAX_STALENESS seconds when the room is still
+USE_ADAPTIVE_DETECTION = True
+DETECT_TARGET_FPS = 5.0        # detection rate while there is motion near faces / entrances
+DETECT_MAX_STALENESS = 2.0     # longest gap between detections in a static scene (seconds)
+DETECT_ENTRANCES = []          # (x1, y1, x2, y2) frame fractions of doors/aisles, e.g. [(0.0, 0.0, 0.15, 1.0)]
+
+# Face tracking: recognise once per track, then reuse the cached identity
+USE_CORRELATION_TRACKING = True  # move boxes between detections (OpenCV MOSSE/KCF)
+TRACK_IOU_THRESH = 0.30          # detection <-> track association
+TRACK_MAX_MISSES = 3             # drop a track after N detection rounds without a match
+REVERIFY_SECONDS = 10.0          # re-run recognition on an accepted track every N seconds
+RETRY_SECONDS = 1.0              # ...or every N seconds while it is unknown / spoof / low conf
+REVERIFY_IOU = 0.50              # ...or when the box moved away from where it was verified
+# Identity voting: a track only counts as a student once VOTE_MIN_AGREE of its last
+# VOTE_WINDOW recognitions agree (one lucky frame can't mark someone present)
+VOTE_WINDOW = 5
+VOTE_MIN_AGREE = 3
+VOTE_MAX_AGE_SECONDS = 30.0      # votes older than this are forgotten
+VOTE_SECONDS = 0.5               # re-recognition interval while a track is collecting votes
+
+# Pipeline (capture -> detect -> embed/classify pool -> render/post)
+EMBED_WORKERS = max(1, (os.cpu_count() or 2) - 2)  # leave cores for capture + detect
+# Landmarks + embeddings in EMBED_WORKERS processes (embed_pool.py) instead of threads:
+# dlib holds the GIL, processes scale across cores. Frames reach them through a
+# shared-memory ring, one copy per frame and none per face.
+USE_PROCESS_EMBED = True
+QUEUE_SIZE = 2                 # bounded queues drop the oldest frame when full
+FRAME_SLOTS = EMBED_WORKERS + QUEUE_SIZE + 2  # frames in flight (detect queue + one per worker + spare)
+STATS_PRINT_SECONDS = 30       # print per-stage FPS / queue depth every N seconds (0 = off)
+
+# Unattended room PCs: no window, no overlays (also enabled by running with --headless)
+HEADLESS = False
+# Local metrics endpoint: http://127.0.0.1:9108/metrics (Prometheus) and /metrics.json (0 = off)
+METRICS_PORT = 9108
+METRICS_HOST = "127.0.0.1"     # "0.0.0.0" to let a dashboard on another machine scrape it
 
 # ==============================
 # LOCATION (SET PER ROOM PC)
@@ -55,52 +111,9 @@ LOCATION_BUILDING = "A"   # example
 LOCATION_ROOM = "101"       # example
 
 
-# ==============================
-# LOAD MODELS
-# ==============================
-print("Loading dlib models...")
-detector = dlib.get_frontal_face_detector()
-shape_predictor = dlib.shape_predictor("shape_predictor_5_face_landmarks.dat")
-face_rec_model = dlib.face_recognition_model_v1("dlib_face_recognition_resnet_model_v1.dat")
-
-print("Loading face classifier...")
-clf = pickle.load(open("classifier.pkl", "rb"))
-
-if not os.path.exists("labels.pkl"):
-    raise RuntimeError("labels.pkl not found (needed for inverse_transform). Run train_classifier.py")
-
-label_encoder = pickle.load(open("labels.pkl", "rb"))
-print("Loaded LabelEncoder from labels.pkl")
-print("System ready.\n")
-
-
 # ==============================
 # HELPERS
 # ==============================
-def clamp_box(x1, y1, x2, y2, w, h):
-    x1 = max(0, x1); y1 = max(0, y1)
-    x2 = min(w - 1, x2); y2 = min(h - 1, y2)
-    if x2 <= x1: x2 = min(w - 1, x1 + 1)
-    if y2 <= y1: y2 = min(h - 1, y1 + 1)
-    return x1, y1, x2, y2
-
-def extract_student_num(label: str) -> str:
-    # label like "8220967_Din" OR "allison_lang_190036"
-    first = label.split("_")[0].strip()
-    return first if first.isdigit() else label
-
-def face_chip_embedding(frame_bgr, rect):
-    rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-
-    shape = shape_predictor(rgb, rect)
-    chip = dlib.get_face_chip(rgb, shape, size=CHIP_SIZE, padding=CHIP_PADDING)
-
-    chip_rect = dlib.rectangle(0, 0, chip.shape[1] - 1, chip.shape[0] - 1)
-    chip_shape = shape_predictor(chip, chip_rect)
-
-    desc = face_rec_model.compute_face_descriptor(chip, chip_shape, JITTERS)
-    return np.array(desc, dtype=np.float32)
-
 def draw_box(frame, x1, y1, x2, y2, color, text=None):
     cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
     if text:
@@ -111,11 +124,16 @@ def now_str():
     return datetime.now().strftime("%d-%m-%Y %H:%M:%S")
 
 def fetch_today_lessons():
+    """
+    Today's lessons in this room, or None if the backend could not be asked
+    (callers keep the previous list; the idle scheduler stays active).
+    """
     try:
-        r = requests.get(TODAY_LESSONS_URL, timeout=3)
+        params = {"building": LOCATION_BUILDING or "", "room": LOCATION_ROOM or ""}
+        r = requests.get(TODAY_LESSONS_URL, params=params, timeout=3)
         if not r.ok:
             print("[SCHEDULE] status:", r.status_code, "body:", r.text[:200])
-            return []
+            return None
         data = r.json()
         lessons = data.get("lessons", [])
         parsed = []
@@ -131,7 +149,7 @@ def fetch_today_lessons():
         return parsed
     except Exception as e:
         print("[SCHEDULE] Error fetching today's lessons:", e)
-        return []
+        return None
 
 def get_active_lesson(now_dt: datetime, lessons: list):
     for L in lessons:
@@ -144,9 +162,10 @@ def get_next_lesson(now_dt: datetime, lessons: list):
     future.sort(key=lambda x: x["start"])
     return future[0] if future else None
 
-def post_snapshot_auto(captured_at: datetime, snapshot_best: dict):
+def post_snapshot_auto(uploader: SnapshotUploader, window: SnapshotWindow,
+                       building=LOCATION_BUILDING, room=LOCATION_ROOM):
     """
-    POST to /attendance/auto:
+    Queues a POST to /attendance/auto:
     {
       "captured_at": "...",
       "detections": [...],
@@ -155,52 +174,170 @@ def post_snapshot_auto(captured_at: datetime, snapshot_best: dict):
 
     Backend resolves the correct lesson per student (based on time + enrolment/group),
     AND can enforce that the lesson is happening in this room.
+
+    The snapshot is written to the local spool and sent by the uploader thread
+    (with an Idempotency-Key), so this returns immediately. Returns the key,
+    or None if the snapshot was empty.
     """
-    if not snapshot_best:
-        print("[BACKEND] Snapshot skipped (0 students)")
-        return {"ok": True, "logs_created": 0}
-
-    payload = {
-        "captured_at": captured_at.isoformat(),
-        "detections": list(snapshot_best.values()),
-        "location": {
-            "building": (LOCATION_BUILDING or None),
-            "room": (LOCATION_ROOM or None),
-        }
-    }
+    if not len(window):
+        print(f"[BACKEND] Snapshot skipped (0 students) [{building}/{room}]")
+        return None
+
+    key = uploader.submit(ATTENDANCE_AUTO_URL, window.payload(building, room))
+    print(f"[BACKEND] Snapshot queued ({len(window)} students, {building}/{room}, key={key}, "
+          f"pending={uploader.queue_depth()})")
+    return key
+
 
+# ==============================
+# PIPELINE STAGES
+# ==============================
+def recognise_job(job, tracker, roster=None, pool=None):
+    """
+    Embed/classify worker: recognises only the tracks that need (re)verification
+    and stores the result in the tracker's per-track cache.
+    With an EmbedPool the frame is already in shared-memory slot job["slot"];
+    the slot is released here once the faces are embedded.
+    """
+    todo = job["todo"]
+    slot = job.get("slot")
     try:
-        r = requests.post(ATTENDANCE_AUTO_URL, json=payload, timeout=8)
-        print("[BACKEND] status:", r.status_code)
-        print("[BACKEND] body:", r.text[:800])
-        if r.ok:
-            return r.json()
-        return {"ok": False}
-    except Exception as e:
-        print(f"[BACKEND] Error posting snapshot: {e}")
-        return {"ok": False}
+        if todo:
+            m = roster.matcher if roster is not None else None
+            embed_fn = None
+            if pool is not None and slot is not None:
+                embed_fn = lambda ctx, boxes: pool.embed(slot, boxes, JITTERS, CHIP_SIZE)
+            results = recognise_faces(job["ctx"], [box for _, box in todo], m, embed_fn)
+            for (track_id, box), res in zip(todo, results):
+                tracker.set_result(track_id, res, box, job["ts"])
+    finally:
+        if pool is not None:
+            pool.ring.release(slot)
+    return job
+
+
+def detection_stage(grabber, tracker, out_q, stats, stop_event, activity=None, detect_sched=None, ring=None):
+    """
+    Detect thread: always takes the newest captured frame, runs HOG on grey
+    when detect_sched says so (or every DETECT_EVERY_N_FRAMES; tracks carry
+    the faces in between) and hands the frame plus the tracks that need
+    recognition to the embed pool (via a shared-memory slot of ring, if given).
+    While the room is idle it only runs a low-res motion check.
+    """
+    last_seq = 0
+    frame_idx = 0
+    motion = MotionDetector(IDLE_MOTION_WIDTH, min_area=IDLE_MOTION_AREA)
+    while not stop_event.is_set():
+        item = grabber.wait_frame(last_seq, timeout=0.5)
+        if item is None:
+            if grabber.stopped:
+                break
+            continue
+        seq, ts, frame = item
+        last_seq = seq
+
+        if activity is not None and not activity.active:
+            grabber.pace_fps = IDLE_CAPTURE_FPS
+            if motion.update(frame):
+                activity.motion(ts)
+                if detect_sched is not None:
+                    detect_sched.force()
+            else:
+                out_q.put({"seq": seq, "ts": ts, "frame": frame, "ctx": None, "faces": [], "todo": []})
+                continue
+        grabber.pace_fps = 0.0
+        motion.reset()
+
+        ctx = FrameContext(frame)
+        frame_idx += 1
+
+        if detect_sched is not None:
+            do_detect = detect_sched.should_detect(frame, ts, [t.box for t in tracker.tracks()])
+        else:
+            do_detect = frame_idx % DETECT_EVERY_N_FRAMES == 0
+
+        if do_detect:
+            tracks = tracker.update(detect_boxes(ctx), frame, ts)
+        else:
+            tracks = tracker.predict(frame, ts)
+
+        faces = []
+        need = []
+        for t in tracks:
+            if t.misses > 0:
+                continue
+            faces.append((t.id, t.box))
+            if activity is not None:
+                # people in view count as activity outside lesson times too
+                activity.motion(ts)
+            if tracker.needs_recognition(t, ts):
+                need.append(t)
+
+        slot = None
+        if need and ring is not None and ring.fits(frame):
+            slot = ring.put(frame)
+            if slot is None:
+                # every slot still in use: the workers are behind, retry on a later frame
+                need = []
+
+        todo = []
+        for t in need:
+            tracker.mark_pending(t, ts)
+            todo.append((t.id, t.box))
+
+        out_q.put({"seq": seq, "ts": ts, "frame": frame, "ctx": ctx, "faces": faces, "todo": todo, "slot": slot})
+        stats.tick()
+
+    out_q.close()
 
 
 # ==============================
 # MAIN
 # ==============================
+def register_gauges(grabber, queues, stats, tracker, uploader, faces_per_frame):
+    """
+    Metrics read on every scrape of the local endpoint.
+    """
+    for st in stats:
+        METRICS.gauge(f"{st.name}_fps", st.fps, f"Frames per second through the {st.name} stage")
+    METRICS.gauge("dropped_frames", lambda: grabber.dropped + sum(q.dropped for q in queues),
+                  "Frames dropped by the camera grabber and bounded stage queues")
+    METRICS.gauge("faces_per_frame", lambda: faces_per_frame[0], "Moving average of tracked faces per frame")
+    METRICS.gauge("tracks", lambda: len(tracker), "Live face tracks")
+    METRICS.gauge("identity_commits", lambda: tracker.commits, "Track identities committed by voting since start")
+    METRICS.gauge("recognition_saved_ratio", tracker.savings,
+                  "Fraction of per-frame faces served from the track cache")
+    METRICS.gauge("snapshot_queue_depth", uploader.queue_depth, "Snapshots waiting in the upload spool")
+    METRICS.gauge("preprocess_allocations", lambda: BUFFERS.allocations,
+                  "Preprocessing buffers created since start (flat once warmed up)")
+    METRICS.gauge("backend_last_status", lambda: uploader.last_status, "HTTP status of the last snapshot post")
+    METRICS.gauge("backend_last_ok_timestamp", lambda: uploader.last_ok_ts,
+                  "Unix time of the last accepted snapshot")
+
+
 def main():
+    headless = HEADLESS or "--headless" in sys.argv
+
     # ---------------------------------------------------------
-    # Lesson schedule state (for UI only)
+    # Lesson schedule state (UI + idle mode)
     # ---------------------------------------------------------
-    today_lessons = fetch_today_lessons()
+    fetched = fetch_today_lessons()
+    today_lessons = fetched or []
+    schedule_known = fetched is not None
     last_schedule_refresh_ts = time.time()
 
-    # --- snapshot window state ---
-    snapshot_start_ts = time.time()
-    snapshot_captured_at = datetime.now()
+    activity = None
+    if USE_IDLE_MODE:
+        activity = ActivityScheduler(IDLE_WARMUP_MINUTES, IDLE_COOLDOWN_MINUTES, IDLE_MOTION_HOLD_SECONDS)
+        activity.update(datetime.now(), today_lessons if schedule_known else None)
 
     # best detection per student in current snapshot window
-    snapshot_best = {}
+    window = SnapshotWindow(SNAPSHOT_SECONDS)
 
     # display last backend resolution (debug overlay)
     last_backend_lesson = None
     last_backend_resolved = {}
+    last_backend_response = None
 
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
@@ -214,149 +351,275 @@ def main():
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     print(f"[CAM] Resolution set to: {w}x{h}")
 
-    frame_idx = 0
-    last_dets = []
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    safe_scale = min_safe_scale(MIN_FACE_RATIO * w)
+    print(f"[DETECT] {describe_detection(w)}")
+    if not DETECT_TILED and DETECT_SCALE < safe_scale:
+        print("[DETECT] WARNING: DETECT_SCALE is below the safe scale, the smallest accepted faces may be missed")
 
-        now_dt = datetime.now()
-        H, W = frame.shape[:2]
-        frame_idx += 1
-
-        # refresh lesson schedule (UI only)
-        if time.time() - last_schedule_refresh_ts >= SCHEDULE_REFRESH_SECONDS:
-            today_lessons = fetch_today_lessons()
-            last_schedule_refresh_ts = time.time()
-
-        # determine active lesson (UI only)
-        active = get_active_lesson(now_dt, today_lessons)
+    # ---------------------------------------------------------
+    # Pipeline: capture -> detect -> embed pool -> render/post (this thread)
+    # ---------------------------------------------------------
+    stop_event = threading.Event()
+
+    # worker processes (forkserver / spawn, see pipeline.worker_process_context) load
+    # their models before the uploader, roster and pipeline threads start competing for CPU
+    start_tiled_detector()
+    embed_pool = None
+    if USE_PROCESS_EMBED:
+        try:
+            embed_pool = EmbedPool(EMBED_WORKERS, FRAME_SLOTS, (h, w, 3))
+            embed_pool.warm_up()
+            METRICS.gauge("frame_slots_free", embed_pool.ring.free, "Free shared-memory frame slots")
+            METRICS.gauge("frame_slot_waits", lambda: embed_pool.ring.waits,
+                          "Frames whose faces waited for a free slot (workers behind)")
+        except Exception as e:
+            print(f"[PIPELINE] Embed processes unavailable ({e}), embedding in threads")
+            if embed_pool is not None:
+                embed_pool.close()
+            embed_pool = None
+
+    # background uploader (replays anything left in the spool from last run)
+    spool = SnapshotSpool(SPOOL_FILE)
+    uploader = SnapshotUploader(spool, timeout=UPLOAD_TIMEOUT)
+    uploader.start()
+    if spool.pending_count():
+        print(f"[UPLOAD] {spool.pending_count()} snapshot(s) left in spool, replaying in background")
+
+    ring = embed_pool.ring if embed_pool is not None else None
+    detect_q = DropOldestQueue(QUEUE_SIZE, on_drop=(lambda job: ring.release(job.get("slot"))) if ring else None)
+    result_q = DropOldestQueue(QUEUE_SIZE)
+
+    grabber = LatestFrameGrabber(cap)
+    tracker = FaceTracker(
+        iou_thresh=TRACK_IOU_THRESH,
+        max_misses=TRACK_MAX_MISSES,
+        reverify_seconds=REVERIFY_SECONDS,
+        retry_seconds=RETRY_SECONDS,
+        reverify_iou=REVERIFY_IOU,
+        use_correlation=USE_CORRELATION_TRACKING,
+        vote_window=VOTE_WINDOW,
+        vote_min_agree=VOTE_MIN_AGREE,
+        vote_max_age=VOTE_MAX_AGE_SECONDS,
+        vote_seconds=VOTE_SECONDS,
+    )
+    roster = None
+    if USE_ROSTER_GALLERY:
+        roster = RosterGallery(ROSTER_GALLERY_URL, LOCATION_BUILDING, LOCATION_ROOM)
+        roster.start()
+        METRICS.gauge("roster_students", lambda: roster.size, "Candidates in the room roster (0 = campus matcher)")
+
+    detect_sched = None
+    if USE_ADAPTIVE_DETECTION:
+        detect_sched = DetectionScheduler(DETECT_TARGET_FPS, DETECT_MAX_STALENESS, DETECT_ENTRANCES)
+        METRICS.gauge("detect_interval_seconds", lambda: detect_sched.gap, "Current adaptive detection interval")
+        METRICS.gauge("detect_ratio", lambda: detect_sched.detect_ratio, "Fraction of frames that ran face detection")
+
+    detect_stats = StageStats("detect")
+    embed_stats = StageStats("embed", detect_q)
+    render_stats = StageStats("render", result_q)
+    all_stats = [grabber.stats, detect_stats, embed_stats, render_stats]
+
+    detect_thread = threading.Thread(
+        target=detection_stage,
+        args=(grabber, tracker, detect_q, detect_stats, stop_event, activity, detect_sched, ring),
+        name="detect", daemon=True,
+    )
+    workers = [
+        StageThread(f"embed-{i}", lambda job: recognise_job(job, tracker, roster, embed_pool), detect_q, result_q,
+                    stats=embed_stats)
+        for i in range(EMBED_WORKERS)
+    ]
+
+    grabber.start()
+    detect_thread.start()
+    for t in workers:
+        t.start()
+    print(f"[PIPELINE] Started with {EMBED_WORKERS} embed {'process' if embed_pool else 'thread'}(s)"
+          f"{' (headless)' if headless else ''}")
+
+    faces_per_frame = [0.0]
+    register_gauges(grabber, [detect_q, result_q], all_stats, tracker, uploader, faces_per_frame)
+    if activity is not None:
+        METRICS.gauge("idle", lambda: 0 if activity.active else 1, "1 while the room is idle (motion check only)")
+        METRICS.gauge("active_seconds_total", lambda: activity.seconds_in(ACTIVE), "Time spent with the full pipeline up")
+        METRICS.gauge("idle_seconds_total", lambda: activity.seconds_in(IDLE), "Time spent idle")
+    metrics_server = start_metrics_server(METRICS_PORT, METRICS_HOST)
+    model_watcher = start_model_watcher()
+
+    last_shown_seq = 0
+    last_stats_print_ts = time.time()
+    frames_since_print = 0
+    allocs_at_print = BUFFERS.allocations
 
-        if active:
-            cv2.putText(frame, f"Schedule says active lesson: {active['lesson_id']}",
-                        (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-        else:
-            nxt = get_next_lesson(now_dt, today_lessons)
-            if nxt:
-                mins = int((nxt["start"] - now_dt).total_seconds() // 60)
-                cv2.putText(frame, f"Schedule says: none active. Next in ~{mins} min (Lesson {nxt['lesson_id']})",
-                            (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255, 255, 255), 2)
-            else:
-                cv2.putText(frame, "Schedule says: no lessons today",
-                            (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255, 255, 255), 2)
-
-        # show configured location
-        cv2.putText(frame, f"Location: {LOCATION_BUILDING}/{LOCATION_ROOM}",
-                    (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255, 255, 255), 2)
-
-        # Debug overlay from backend resolution
-        if last_backend_lesson is not None:
-            cv2.putText(frame, f"Backend resolved lesson: {last_backend_lesson}",
-                        (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
-
-        # ---------- SNAPSHOT TIMER ----------
-        now_ts = time.time()
-        if now_ts - snapshot_start_ts >= SNAPSHOT_SECONDS:
-            resp = post_snapshot_auto(snapshot_captured_at, snapshot_best)
-
-            # store debug info for overlay
-            if isinstance(resp, dict) and resp.get("ok"):
-                last_backend_lesson = resp.get("lesson_id")
-                last_backend_resolved = resp.get("resolved", {}) or {}
-
-            snapshot_best.clear()
-            snapshot_start_ts = now_ts
-            snapshot_captured_at = datetime.now()
-
-        seconds_left = max(0, int(SNAPSHOT_SECONDS - (now_ts - snapshot_start_ts)))
-        cv2.putText(frame, f"Next snapshot in: {seconds_left}s",
-                    (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-
-        # show small resolved map (top 3) on screen
-        if last_backend_resolved:
-            y = 120
-            shown = 0
-            for k, v in last_backend_resolved.items():
-                cv2.putText(frame, f"{k} -> lesson {v}",
-                            (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                y += 25
-                shown += 1
-                if shown >= 3:
+    try:
+        while True:
+            job = result_q.get(timeout=0.5)
+            if job is None:
+                if grabber.stopped and not detect_thread.is_alive() and result_q.qsize() == 0:
+                    break
+                if not headless and cv2.waitKey(1) & 0xFF == ord("q"):
                     break
-
-        # ---------- DETECT ----------
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        if frame_idx % DETECT_EVERY_N_FRAMES == 0:
-            dets = detector(gray, 0)
-            last_dets = dets
-        else:
-            dets = last_dets
-
-        # ---------- PROCESS MULTIPLE FACES ----------
-        for d in dets:
-            x1, y1, x2, y2 = clamp_box(d.left(), d.top(), d.right(), d.bottom(), W, H)
-            face_w = max(1, x2 - x1)
-            face_ratio = face_w / float(W)
-
-            if face_ratio < MIN_FACE_RATIO:
-                draw_box(frame, x1, y1, x2, y2, (0, 255, 255), "Too small - come closer")
-                continue
-            if face_ratio > MAX_FACE_RATIO:
-                draw_box(frame, x1, y1, x2, y2, (0, 165, 255), "Too close - move back")
                 continue
 
-            cnn_score = None
-            if HAS_ANTISPOOF:
-                crop = frame[y1:y2, x1:x2]
-                cnn_score = float(is_real_face_raw(crop))
-                if USE_ANTISPOOF_GATE and cnn_score < ANTISPOOF_THRESH:
-                    draw_box(frame, x1, y1, x2, y2, (0, 0, 255), f"SPOOF (cnn={cnn_score:.2f})")
-                    continue
-
-            try:
-                emb = face_chip_embedding(frame, d)
-            except Exception:
-                draw_box(frame, x1, y1, x2, y2, (0, 0, 255), "Chip/landmark failed")
+            render_stats.tick()
+            frames_since_print += 1
+            frame = job["frame"]
+            now_dt = datetime.now()
+
+            # cached per-track results (may have been verified on an earlier frame)
+            results = []
+            for track_id, box in job["faces"]:
+                t = tracker.get(track_id)
+                results.append((track_id, box, t.result if t is not None else None))
+            faces_per_frame[0] = 0.9 * faces_per_frame[0] + 0.1 * len(results)
+
+            # ---------- SNAPSHOT UPDATE ----------
+            # results from every frame count, even if a newer frame was already shown
+            for _, _, res in results:
+                if res and window.add(res):
+                    print(f"{now_str()} - {res['name']} detected ({res['conf']*100:.1f}%)")
+
+            # refresh lesson schedule (UI + idle mode; keep the last list if the backend is down)
+            if time.time() - last_schedule_refresh_ts >= SCHEDULE_REFRESH_SECONDS:
+                fetched = fetch_today_lessons()
+                if fetched is not None:
+                    today_lessons, schedule_known = fetched, True
+                last_schedule_refresh_ts = time.time()
+
+            if activity is not None:
+                activity.update(now_dt, today_lessons if schedule_known else None)
+
+            # ---------- SNAPSHOT TIMER ----------
+            now_ts = time.time()
+            if window.due(now_ts):
+                # nothing to report from an idle room
+                if len(window) or activity is None or activity.active:
+                    post_snapshot_auto(uploader, window)
+                window.reset(now_ts)
+
+            # store debug info for overlay (whenever the uploader got a new response)
+            resp = uploader.last_response
+            if resp is not last_backend_response:
+                last_backend_response = resp
+                if isinstance(resp, dict) and resp.get("ok"):
+                    last_backend_lesson = resp.get("lesson_id")
+                    last_backend_resolved = resp.get("resolved", {}) or {}
+
+            if STATS_PRINT_SECONDS and now_ts - last_stats_print_ts >= STATS_PRINT_SECONDS:
+                print(f"[PIPELINE] {format_stats(all_stats)} | cam_drop={grabber.dropped} "
+                      f"tracks={len(tracker)} recog_saved={tracker.savings()*100:.0f}% "
+                      f"upload_pending={uploader.queue_depth()} "
+                      f"prep_allocs/frame={(BUFFERS.allocations - allocs_at_print) / max(1, frames_since_print):.2f}"
+                      + (f" detect_ratio={detect_sched.detect_ratio*100:.0f}%" if detect_sched is not None else "")
+                      + (f" | {activity.summary()}" if activity is not None else ""))
+                last_stats_print_ts = now_ts
+                frames_since_print = 0
+                allocs_at_print = BUFFERS.allocations
+
+            if headless:
                 continue
 
-            probs = clf.predict_proba([emb])[0]
-            idx = int(np.argmax(probs))
-            conf = float(probs[idx])
-
-            if conf < ACCEPT_PROBA:
-                draw_box(frame, x1, y1, x2, y2, (0, 255, 255), f"Low confidence ({conf*100:.1f}%)")
+            # pool workers can finish out of order: never draw an older frame
+            if job["seq"] <= last_shown_seq:
                 continue
+            last_shown_seq = job["seq"]
 
-            name = label_encoder.inverse_transform([idx])[0]
-            student_num = extract_student_num(name)
+            # determine active lesson (UI only)
+            active = get_active_lesson(now_dt, today_lessons)
 
-            prev = snapshot_best.get(student_num)
-            if (prev is None) or (conf > prev["accuracy"]):
-                snapshot_best[student_num] = {
-                    "student_num": student_num,
-                    "accuracy": round(conf, 4),
-                    "cnn": round(cnn_score, 3) if (cnn_score is not None) else None
-                }
-                print(f"{now_str()} - {name} detected ({conf*100:.1f}%)")
+            if active:
+                cv2.putText(frame, f"Schedule says active lesson: {active['lesson_id']}",
+                            (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
+            else:
+                nxt = get_next_lesson(now_dt, today_lessons)
+                if nxt:
+                    mins = int((nxt["start"] - now_dt).total_seconds() // 60)
+                    cv2.putText(frame, f"Schedule says: none active. Next in ~{mins} min (Lesson {nxt['lesson_id']})",
+                                (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255, 255, 255), 2)
+                else:
+                    cv2.putText(frame, "Schedule says: no lessons today",
+                                (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255, 255, 255), 2)
+
+            # show configured location
+            cv2.putText(frame, f"Location: {LOCATION_BUILDING}/{LOCATION_ROOM}",
+                        (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.65, (255, 255, 255), 2)
+
+            # Debug overlay from backend resolution
+            if last_backend_lesson is not None:
+                cv2.putText(frame, f"Backend resolved lesson: {last_backend_lesson}",
+                            (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (255, 255, 255), 2)
+
+            seconds_left = window.seconds_left(now_ts)
+            if activity is not None and not activity.active:
+                cv2.putText(frame, "IDLE - no lesson, watching for motion",
+                            (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+            else:
+                cv2.putText(frame, f"Next snapshot in: {seconds_left}s",
+                            (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+
+            # show small resolved map (top 3) on screen
+            if last_backend_resolved:
+                y = 120
+                shown = 0
+                for k, v in last_backend_resolved.items():
+                    cv2.putText(frame, f"{k} -> lesson {v}",
+                                (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+                    y += 25
+                    shown += 1
+                    if shown >= 3:
+                        break
+
+            # per-stage FPS / queue depth
+            cv2.putText(frame, format_stats(all_stats),
+                        (10, frame.shape[0] - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+            for track_id, (x1, y1, x2, y2), res in results:
+                if res is None:
+                    draw_box(frame, x1, y1, x2, y2, (200, 200, 200), f"#{track_id} verifying...")
+                else:
+                    draw_box(frame, x1, y1, x2, y2, res["color"], f"#{track_id} {res['text']}")
+
+            cv2.imshow("Attendance", frame)
+            if cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+    except KeyboardInterrupt:
+        print("\n[PIPELINE] Stopping...")
+
+    # stop pipeline threads
+    stop_event.set()
+    if model_watcher is not None:
+        model_watcher.stop()
+    close_tiled_detector()
+    if roster is not None:
+        roster.stop()
+    grabber.stop()
+    detect_q.close()
+    for t in workers:
+        t.stop()
+    detect_thread.join(timeout=2)
+    for t in workers:
+        t.join(timeout=2)
+    grabber.join(timeout=2)
+    if embed_pool is not None:
+        embed_pool.close()
 
-            label = f"{name} ({conf*100:.1f}%)"
-            if cnn_score is not None:
-                label += f" cnn={cnn_score:.2f}"
-            draw_box(frame, x1, y1, x2, y2, (0, 255, 0), label)
+    # final snapshot on exit (if any detections in window)
+    if len(window):
+        post_snapshot_auto(uploader, window)
 
-        cv2.imshow("Attendance", frame)
-        if cv2.waitKey(1) & 0xFF == ord("q"):
-            break
+    # give the uploader a moment; anything unsent stays in the spool for next run
+    if not uploader.flush(timeout=10):
+        print(f"[UPLOAD] {spool.pending_count()} snapshot(s) still spooled, will be sent on next start")
+    uploader.stop()
+    uploader.join(timeout=UPLOAD_TIMEOUT + 1)
+    spool.close()
 
-    # final snapshot on exit (if any detections in window)
-    if snapshot_best:
-        post_snapshot_auto(snapshot_captured_at, snapshot_best)
+    if metrics_server is not None:
+        metrics_server.shutdown()
 
     cap.release()
-    cv2.destroyAllWindows()
+    if not headless:
+        cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
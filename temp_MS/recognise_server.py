@@ -0,0 +1,453 @@
+# recognise_server.py
+# Headless multi-camera recognition server.
+# - One process serves every camera of a building: one copy of the dlib models,
+#   the classifier/gallery and the antispoof session (see recognition.py)
+# - Per camera: a latest-frame grabber, a face tracker and a snapshot window
+# - A small detect pool serves the cameras round-robin (one frame per camera at a time)
+# - Faces that need recognition go into one fair queue; embed workers take
+#   mixed-camera batches so antispoof / descriptor / classifier calls are batched
+#   across cameras instead of per frame
+# - Snapshots are posted per camera (with that camera's building/room) through one
+#   shared spool-backed uploader
+#
+# Streams come from STREAMS below, or from streams.json if it exists:
+# [
+#   {"source": "rtsp://cam-a101/stream1", "building": "A", "room": "101"},
+#   {"source": 0, "building": "A", "room": "102"}
+# ]
+import json
+import os
+import threading
+import time
+
+import cv2
+
+from pipeline import FairQueue, LatestFrameGrabber, StageStats, format_stats
+from tracker import FaceTracker
+from activity import DetectionScheduler
+from frame_context import FrameContext
+from frame_source import open_source
+from snapshot import SnapshotWindow
+from uploader import SnapshotSpool, SnapshotUploader
+from metrics import METRICS, start_metrics_server
+from roster import RosterGallery
+from preprocess import BUFFERS
+from recognition import (close_tiled_detector, describe_detection, detect_boxes, recognise_batch,
+                         start_model_watcher, start_tiled_detector)
+
+
+# ==============================
+# CONFIG
+# ==============================
+BASE_API = "http://localhost:8000"  # change to "http://localhost:8000/ai" if needed
+ATTENDANCE_AUTO_URL = f"{BASE_API}/attendance/auto"
+ROSTER_GALLERY_URL = f"{BASE_API}/attendance/roster-gallery"
+USE_ROSTER_GALLERY = True      # per-room candidate set (see roster.py)
+
+STREAMS_FILE = "streams.json"
+STREAMS = [
+    {"source": 0, "building": "A", "room": "101"},
+]
+
+CAMERA_WIDTH = 1280
+CAMERA_HEIGHT = 720
+RECONNECT_SECONDS = 5.0        # reopen a dropped camera / RTSP stream after N seconds
+
+SNAPSHOT_SECONDS = 60
+SPOOL_FILE = "snapshot_spool.db"
+UPLOAD_TIMEOUT = 8
+
+DETECT_EVERY_N_FRAMES = 3      # used when adaptive detection is off
+
+# Adaptive detection (same meaning as in recognise_live_1.1.py); per-stream
+# entrances can be set in streams.json as "entrances": [[x1, y1, x2, y2], ...]
+USE_ADAPTIVE_DETECTION = True
+DETECT_TARGET_FPS = 5.0
+DETECT_MAX_STALENESS = 2.0
+
+# Tracking (same meaning as in recognise_live_1.1.py)
+USE_CORRELATION_TRACKING = True
+TRACK_IOU_THRESH = 0.30
+TRACK_MAX_MISSES = 3
+REVERIFY_SECONDS = 10.0
+RETRY_SECONDS = 1.0
+REVERIFY_IOU = 0.50
+VOTE_WINDOW = 5                # identity committed once VOTE_MIN_AGREE of the last VOTE_WINDOW recognitions agree
+VOTE_MIN_AGREE = 3
+VOTE_MAX_AGE_SECONDS = 30.0
+VOTE_SECONDS = 0.5
+
+# Worker pools
+DETECT_WORKERS = 2
+EMBED_WORKERS = max(1, (os.cpu_count() or 2) - 1 - DETECT_WORKERS)
+MAX_BATCH_FACES = 32           # faces per recognise_batch() call, across cameras
+MAX_PENDING_PER_STREAM = 16    # per-camera face backlog (oldest dropped when full)
+
+STATS_PRINT_SECONDS = 30
+METRICS_PORT = 9108            # http://127.0.0.1:9108/metrics (0 = off)
+METRICS_HOST = "127.0.0.1"
+
+
+def load_streams():
+    if os.path.exists(STREAMS_FILE):
+        with open(STREAMS_FILE, "r", encoding="utf-8") as f:
+            streams = json.load(f)
+        print(f"[SERVER] Loaded {len(streams)} stream(s) from {STREAMS_FILE}")
+        return streams
+    return STREAMS
+
+
+def now_str():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# ==============================
+# STREAM
+# ==============================
+class CameraStream:
+    """
+    Everything that belongs to one camera. Only one detect worker handles a
+    stream at a time (see StreamScheduler), so its tracker sees frames in order.
+    """
+
+    def __init__(self, index: int, source, building=None, room=None, entrances=None):
+        self.index = index
+        self.source = source
+        self.building = building
+        self.room = room
+        self.name = f"{building or '?'}/{room or '?'}#{index}"
+
+        self.tracker = FaceTracker(
+            iou_thresh=TRACK_IOU_THRESH,
+            max_misses=TRACK_MAX_MISSES,
+            reverify_seconds=REVERIFY_SECONDS,
+            retry_seconds=RETRY_SECONDS,
+            reverify_iou=REVERIFY_IOU,
+            use_correlation=USE_CORRELATION_TRACKING,
+            vote_window=VOTE_WINDOW,
+            vote_min_agree=VOTE_MIN_AGREE,
+            vote_max_age=VOTE_MAX_AGE_SECONDS,
+            vote_seconds=VOTE_SECONDS,
+        )
+        self.window = SnapshotWindow(SNAPSHOT_SECONDS)
+        self.window_lock = threading.Lock()   # detect workers add, the main loop posts / resets
+        self.detect_sched = (DetectionScheduler(DETECT_TARGET_FPS, DETECT_MAX_STALENESS, entrances)
+                             if USE_ADAPTIVE_DETECTION else None)
+        self.roster = RosterGallery(ROSTER_GALLERY_URL, building, room) if USE_ROSTER_GALLERY else None
+        self.stats = StageStats(f"detect[{self.name}]")
+
+        self.cap = None
+        self.grabber = None
+        self.last_seq = 0
+        self.frame_idx = 0
+        self.busy = False
+        self.finished = False
+        self.next_open_ts = 0.0
+
+    @property
+    def is_live(self) -> bool:
+        # cameras and network streams are reopened when they drop, files/folders end
+        src = self.source
+        if isinstance(src, int) or (isinstance(src, str) and src.strip().isdigit()):
+            return True
+        return isinstance(src, str) and "://" in src
+
+    def open(self) -> bool:
+        self.cap = open_source(self.source, CAMERA_WIDTH, CAMERA_HEIGHT)
+        if not self.cap.isOpened():
+            print(f"[{self.name}] Could not open source {self.source!r}")
+            self.cap.release()
+            self.cap = None
+            self.next_open_ts = time.time() + RECONNECT_SECONDS
+            return False
+
+        # video files play at their own frame rate instead of as fast as they decode
+        pace = 0.0 if self.is_live else float(self.cap.get(cv2.CAP_PROP_FPS) or 0.0)
+        self.grabber = LatestFrameGrabber(self.cap, name=f"capture[{self.name}]", pace_fps=pace)
+        self.grabber.start()
+        self.last_seq = 0
+        print(f"[{self.name}] Opened {self.source!r}")
+        return True
+
+    def check(self, now_ts: float):
+        """
+        Reopens a dropped live stream; marks file sources finished when they end.
+        """
+        if self.finished:
+            return
+        if self.grabber is None:
+            if now_ts >= self.next_open_ts:
+                self.open()
+            return
+        if not self.grabber.stopped:
+            return
+        self.grabber.join(timeout=1)
+        self.cap.release()
+        self.grabber, self.cap = None, None
+        if self.is_live:
+            print(f"[{self.name}] Stream dropped, reconnecting in {RECONNECT_SECONDS:.0f}s")
+            self.next_open_ts = now_ts + RECONNECT_SECONDS
+        else:
+            print(f"[{self.name}] Source ended")
+            self.finished = True
+
+    @property
+    def matcher(self):
+        return self.roster.matcher if self.roster is not None else None
+
+    def close(self):
+        if self.roster is not None:
+            self.roster.stop()
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber.join(timeout=1)
+        if self.cap is not None:
+            self.cap.release()
+
+
+class StreamScheduler:
+    """
+    Hands detect workers the next stream (round-robin) that has a new frame
+    and is not already being processed by another worker.
+    """
+
+    def __init__(self, streams):
+        self.streams = streams
+        self._rr = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: float = 0.02):
+        with self._cond:
+            n = len(self.streams)
+            for i in range(n):
+                s = self.streams[(self._rr + i) % n]
+                if s.busy or s.grabber is None or not s.grabber.has_new(s.last_seq):
+                    continue
+                s.busy = True
+                self._rr = (self._rr + i + 1) % n
+                return s
+            self._cond.wait(timeout)
+            return None
+
+    def release(self, s: CameraStream):
+        with self._cond:
+            s.busy = False
+            self._cond.notify()
+
+
+# ==============================
+# STAGES
+# ==============================
+# exceptions caught per stage iteration (the worker logs them and carries on)
+STAGE_ERRORS = {"detect": 0, "embed": 0}
+_errors_lock = threading.Lock()
+
+def count_error(stage: str, e: Exception, where: str = ""):
+    with _errors_lock:
+        STAGE_ERRORS[stage] += 1
+    print(f"[SERVER] {stage} error{f' ({where})' if where else ''}: {e!r}")
+
+
+def detect_worker(scheduler, face_q, stop_event):
+    """
+    Detect thread: takes the newest frame of the next free camera, updates that
+    camera's tracker and queues the faces that need (re)recognition.
+    Accepted tracks in view feed the camera's snapshot window once per frame
+    (same "frames" count as recognise_live_1.1.py).
+    """
+    while not stop_event.is_set():
+        s = scheduler.acquire()
+        if s is None:
+            continue
+        try:
+            grabber = s.grabber  # main loop may swap it out while reconnecting
+            item = grabber.wait_frame(s.last_seq, timeout=0) if grabber else None
+            if item is None:
+                continue
+            seq, ts, frame = item
+            s.last_seq = seq
+            ctx = FrameContext(frame)
+            s.frame_idx += 1
+
+            if s.detect_sched is not None:
+                do_detect = s.detect_sched.should_detect(frame, ts, [t.box for t in s.tracker.tracks()])
+            else:
+                do_detect = s.frame_idx % DETECT_EVERY_N_FRAMES == 0
+
+            if do_detect:
+                tracks = s.tracker.update(detect_boxes(ctx), frame, ts)
+            else:
+                tracks = s.tracker.predict(frame, ts)
+
+            seen = []
+            for t in tracks:
+                if t.misses > 0:
+                    continue
+                if t.accepted:
+                    seen.append(t.result)
+                if s.tracker.needs_recognition(t, ts):
+                    s.tracker.mark_pending(t, ts)
+                    face_q.put(s.index, (s, ctx, t.id, t.box, ts))
+            if seen:
+                with s.window_lock:
+                    for res in seen:
+                        s.window.add(res)
+            s.stats.tick()
+        except Exception as e:
+            count_error("detect", e, s.name)
+        finally:
+            scheduler.release(s)
+
+
+def embed_worker(face_q, stats, stop_event):
+    """
+    Embed thread: one recognise_batch() over faces from any number of cameras,
+    results go back into each camera's tracker cache.
+    """
+    while not stop_event.is_set():
+        batch = face_q.get_batch(MAX_BATCH_FACES, timeout=0.5)
+        if not batch:
+            if face_q.closed:
+                break
+            continue
+        try:
+            results = recognise_batch([(ctx, box) for _, ctx, _, box, _ in batch], [s.matcher for s, *_ in batch])
+            for (s, _, track_id, box, ts), res in zip(batch, results):
+                s.tracker.set_result(track_id, res, box, ts)
+        except Exception as e:
+            count_error("embed", e, f"{len(batch)} face(s)")
+            # tracks without a result go back to the detect workers' schedule
+            for s, _, track_id, _, _ in batch:
+                s.tracker.clear_pending(track_id)
+            continue
+        stats.tick()
+
+
+def post_snapshot(uploader, s: CameraStream):
+    # caller holds s.window_lock
+    payload = s.window.payload(s.building, s.room)
+    key = uploader.submit(ATTENDANCE_AUTO_URL, payload)
+    print(f"\n[{now_str()}] [{s.name}] Snapshot {key} queued "
+          f"({len(payload['detections'])} student(s), {uploader.queue_depth()} pending)")
+
+
+# ==============================
+# MAIN
+# ==============================
+def main():
+    streams = [
+        CameraStream(i, cfg["source"], cfg.get("building"), cfg.get("room"), cfg.get("entrances"))
+        for i, cfg in enumerate(load_streams())
+    ]
+    if not streams:
+        raise RuntimeError("No streams configured")
+
+    # tile worker processes load their detectors before the camera threads start
+    start_tiled_detector()
+
+    spool = SnapshotSpool(SPOOL_FILE)
+    uploader = SnapshotUploader(spool, timeout=UPLOAD_TIMEOUT)
+    uploader.start()
+
+    for s in streams:
+        s.open()
+        if s.roster is not None:
+            s.roster.start()
+
+    scheduler = StreamScheduler(streams)
+    face_q = FairQueue(MAX_PENDING_PER_STREAM)
+    stop_event = threading.Event()
+    embed_stats = StageStats("embed")
+
+    workers = [
+        threading.Thread(target=detect_worker, args=(scheduler, face_q, stop_event),
+                         name=f"detect-{i}", daemon=True)
+        for i in range(DETECT_WORKERS)
+    ] + [
+        threading.Thread(target=embed_worker, args=(face_q, embed_stats, stop_event),
+                         name=f"embed-{i}", daemon=True)
+        for i in range(EMBED_WORKERS)
+    ]
+    for w in workers:
+        w.start()
+
+    print(f"[SERVER] {len(streams)} stream(s), {DETECT_WORKERS} detect / {EMBED_WORKERS} embed worker(s)")
+    print(f"[DETECT] {describe_detection(CAMERA_WIDTH)}")
+
+    METRICS.gauge("embed_fps", embed_stats.fps, "Face batches per second through the embed pool")
+    METRICS.gauge("face_queue_depth", face_q.qsize, "Faces waiting for recognition, all cameras")
+    METRICS.gauge("dropped_frames", lambda: face_q.dropped + sum(s.grabber.dropped for s in streams if s.grabber),
+                  "Frames dropped by the grabbers plus faces dropped from the face queue")
+    METRICS.gauge("tracks", lambda: sum(len(s.tracker) for s in streams), "Live face tracks, all cameras")
+    METRICS.gauge("preprocess_allocations", lambda: BUFFERS.allocations,
+                  "Preprocessing buffers created since start (flat once warmed up)")
+    METRICS.gauge("identity_commits", lambda: sum(s.tracker.commits for s in streams),
+                  "Track identities committed by voting since start, all cameras")
+    METRICS.gauge("detect_errors", lambda: STAGE_ERRORS["detect"], "Detect iterations that raised (frame skipped)")
+    METRICS.gauge("embed_errors", lambda: STAGE_ERRORS["embed"],
+                  "Face batches whose recognition raised (tracks rescheduled)")
+    METRICS.gauge("streams_up", lambda: sum(1 for s in streams if s.grabber is not None), "Cameras currently open")
+    METRICS.gauge("snapshot_queue_depth", uploader.queue_depth, "Snapshots waiting in the upload spool")
+    METRICS.gauge("backend_last_status", lambda: uploader.last_status, "HTTP status of the last snapshot post")
+    METRICS.gauge("backend_last_ok_timestamp", lambda: uploader.last_ok_ts,
+                  "Unix time of the last accepted snapshot")
+    metrics_server = start_metrics_server(METRICS_PORT, METRICS_HOST)
+    model_watcher = start_model_watcher()
+
+    last_stats_print_ts = time.time()
+    try:
+        while True:
+            now_ts = time.time()
+
+            for s in streams:
+                s.check(now_ts)
+
+                with s.window_lock:
+                    if s.window.due(now_ts):
+                        # an empty window has nothing to report (and would claim an idempotency row)
+                        if len(s.window):
+                            post_snapshot(uploader, s)
+                        s.window.reset(now_ts)
+
+            if all(s.finished for s in streams):
+                print("[SERVER] All sources ended")
+                break
+
+            if STATS_PRINT_SECONDS and now_ts - last_stats_print_ts >= STATS_PRINT_SECONDS:
+                last_stats_print_ts = now_ts
+                stats = [s.stats for s in streams] + [embed_stats]
+                print(f"[STATS] {format_stats(stats)} | face_q={face_q.qsize()} dropped={face_q.dropped} "
+                      f"| upload_pending={uploader.queue_depth()}")
+                for s in streams:
+                    print(f"[STATS]   {s.name}: tracks={len(s.tracker)} recog_saved={s.tracker.savings()*100:.0f}% "
+                          f"window={len(s.window)}")
+
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        print("\n[SERVER] Stopping...")
+
+    stop_event.set()
+    face_q.close()
+    if model_watcher is not None:
+        model_watcher.stop()
+    close_tiled_detector()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    for w in workers:
+        w.join(timeout=2)
+
+    # final partial windows
+    for s in streams:
+        if len(s.window):
+            post_snapshot(uploader, s)
+        s.close()
+
+    if not uploader.flush(10):
+        print(f"[UPLOAD] {uploader.queue_depth()} snapshot(s) left in {SPOOL_FILE}, will be sent on next start")
+    uploader.stop()
+    uploader.join(timeout=UPLOAD_TIMEOUT + 1)
+    spool.close()
+
+
+if __name__ == "__main__":
+    main()
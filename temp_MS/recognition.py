@@ -0,0 +1,490 @@
+# recognition.py
+# Shared recognition core: models, settings and the detection -> antispoof ->
+# chip -> embed -> classify path. Used by recognise_live_1.1.py (one camera)
+# and recognise_server.py (many cameras sharing one copy of every model).
+# Models are loaded once, on import (not in worker processes, see IN_WORKER_PROCESS).
+import multiprocessing
+import os
+import pickle
+import threading
+from datetime import datetime
+
+import dlib
+import numpy as np
+
+from gallery import GalleryMatcher
+from prototypes import PrototypeClassifier
+from embedding import make_embedder
+from detection import detect_faces, min_safe_face_px, TiledDetector
+from frame_context import FrameContext
+from metrics import METRICS
+from model_artifacts import MANIFEST_FILE, ModelWatcher, read_manifest
+
+# Worker processes (embed_pool.py, tiled detection) load their own models. They
+# only get here because forkserver / spawn re-run the recogniser script's
+# imports, so the recogniser's models (and ONNX sessions) are skipped there.
+IN_WORKER_PROCESS = multiprocessing.current_process().name != "MainProcess"
+
+# Optional: antispoof (won't crash if missing)
+HAS_ANTISPOOF = False
+if not IN_WORKER_PROCESS:
+    try:
+        from antispoof import is_real_face_batch
+        HAS_ANTISPOOF = True
+    except Exception:
+        HAS_ANTISPOOF = False
+
+
+# ==============================
+# RECOGNITION SETTINGS
+# ==============================
+ACCEPT_PROBA = 0.70            # 70% threshold (face recognition confidence, svc matcher)
+
+# Face size gating (relative to frame width)
+MIN_FACE_RATIO = 0.10
+MAX_FACE_RATIO = 0.60
+MIN_FACE_PX = 80               # tiled detection: minimum face width in pixels instead of MIN_FACE_RATIO
+
+# Face matcher: "svc" (classifier.pkl + labels.pkl), "gallery" (gallery.npz,
+# cosine similarity with the calibrated open-set threshold from train_gallery.py)
+# or "prototype" (prototypes.npz from train_prototypes.py, updated per enrolment)
+MATCHER = "svc"
+GALLERY_FILE = "gallery.npz"
+PROTOTYPE_FILE = "prototypes.npz"
+CLASSIFIER_FILE = "classifier.pkl"
+LABELS_FILE = "labels.pkl"
+
+# Hot reload: re-train / re-enrol and running recognisers pick the new model up
+# within RELOAD_POLL_SECONDS (watches the MATCHER entry of model_version.json, see model_artifacts.py)
+HOT_RELOAD = True
+RELOAD_POLL_SECONDS = 10.0
+
+# Antispoof gating
+USE_ANTISPOOF_GATE = True
+ANTISPOOF_THRESH = 0.50
+
+# Embedding backend: embedding.EMBED_BACKEND ("dlib" or "onnx", env EMBED_BACKEND).
+# Chip size / padding belong to the backend, so chips match the ones it was trained on.
+CHIP_SIZE = None               # experiments only: cut chips this size and resize to the backend's
+JITTERS = 0                    # dlib only
+
+# Detection runs on a reduced image; boxes are mapped back to full resolution
+# and chips/antispoof crops are still cut from the full-res frame.
+DETECT_SCALE = 0.5             # 1.0 = full res. Faces must stay >= 80px after scaling (see benchmark_detection.py)
+DETECT_ROI = None              # or (x1, y1, x2, y2) fractions of the frame, e.g. (0.0, 0.25, 1.0, 1.0) for the seating area
+
+# Tiled detection for large lecture theatres: the ROI is split into overlapping
+# tiles detected in parallel, the far (top) rows at a higher resolution, boxes
+# merged with NMS. Faces in far rows stay >= 80px after DETECT_FAR_SCALE.
+DETECT_TILED = False
+DETECT_TILES = (2, 3)          # rows, cols
+DETECT_TILE_OVERLAP = 0.2      # fraction of a tile; must exceed the largest face / tile size ratio
+DETECT_FAR_ROWS = 1            # top tile rows run at DETECT_FAR_SCALE, the rest at DETECT_SCALE
+DETECT_FAR_SCALE = 1.0
+DETECT_TILE_WORKERS = 0        # 0 = one per tile, up to the CPU count
+DETECT_TILE_EXECUTOR = "process"   # "process" (HOG holds the GIL) or "thread"
+
+SHAPE_PREDICTOR_PATH = "shape_predictor_5_face_landmarks.dat"
+
+
+# ==============================
+# LOAD MODELS
+# ==============================
+if IN_WORKER_PROCESS:
+    detector = shape_predictor = embedder = None
+else:
+    print("Loading dlib models...")
+    detector = dlib.get_frontal_face_detector()
+    shape_predictor = dlib.shape_predictor(SHAPE_PREDICTOR_PATH)
+    embedder = make_embedder(jitters=JITTERS)
+    print(f"Embedding backend: {embedder.signature} ({embedder.dim}-d)")
+
+# every detect / embed worker thread gets its own HOG detector and landmark model
+# (loaded on first use); the embedder keeps its own per-thread state
+_thread_models = threading.local()
+
+def worker_detector():
+    det = getattr(_thread_models, "detector", None)
+    if det is None:
+        if threading.current_thread() is threading.main_thread():
+            det = detector
+        else:
+            det = dlib.get_frontal_face_detector()
+        _thread_models.detector = det
+    return det
+
+def worker_predictor():
+    sp = getattr(_thread_models, "sp", None)
+    if sp is None:
+        if threading.current_thread() is threading.main_thread():
+            sp = shape_predictor
+        else:
+            sp = dlib.shape_predictor(SHAPE_PREDICTOR_PATH)
+        _thread_models.sp = sp
+    return sp
+
+class FaceMatcher:
+    """
+    One loaded version of the face matcher. Never mutated after loading, so a
+    batch classified with it is consistent even if a reload swaps it mid-frame.
+    """
+
+    def __init__(self, clf=None, label_names=None, gallery=None, version=None):
+        self.clf = clf
+        self.label_names = label_names
+        self.gallery = gallery
+        self.version = version
+        self.loaded_at = datetime.now()
+
+    @property
+    def num_students(self) -> int:
+        return len(self.gallery.label_names if self.gallery is not None else self.label_names)
+
+
+def load_matcher() -> FaceMatcher:
+    manifest = read_manifest(MATCHER, MANIFEST_FILE) or {}
+    version = manifest.get("version")
+    trained_with = manifest.get("embedder")
+    if trained_with and trained_with != embedder.signature:
+        raise RuntimeError(f"Face matcher was trained on {trained_with} embeddings, but this recogniser "
+                           f"uses {embedder.signature}. Re-run training with the same EMBED_BACKEND.")
+
+    if MATCHER == "prototype":
+        if not os.path.exists(PROTOTYPE_FILE):
+            raise RuntimeError(f"{PROTOTYPE_FILE} not found. Run train_prototypes.py")
+        # same predict() -> (names, confidences, accepted) as a GalleryMatcher
+        prototypes = PrototypeClassifier.load(PROTOTYPE_FILE)
+        prototypes.scorer()   # build the scoring matrix now, before embed threads share it
+        print(f"Loaded prototypes: {len(prototypes.students)} students, accept P >= {prototypes.accept_proba:.2f}"
+              f" (version {version})")
+        return FaceMatcher(gallery=prototypes, version=version)
+
+    if MATCHER == "gallery":
+        if not os.path.exists(GALLERY_FILE):
+            raise RuntimeError(f"{GALLERY_FILE} not found. Run train_gallery.py")
+        gallery = GalleryMatcher.load(GALLERY_FILE)
+        print(f"Loaded gallery: {len(gallery.label_names)} students, threshold={gallery.threshold:.3f}"
+              f" (version {version})")
+        return FaceMatcher(gallery=gallery, version=version)
+
+    if not os.path.exists(LABELS_FILE):
+        raise RuntimeError("labels.pkl not found (needed for inverse_transform). Run train_classifier.py")
+    with open(CLASSIFIER_FILE, "rb") as f:
+        clf = pickle.load(f)
+    with open(LABELS_FILE, "rb") as f:
+        label_encoder = pickle.load(f)
+    # class index -> name lookup without calling inverse_transform per face
+    label_names = np.asarray(label_encoder.classes_)
+    print(f"Loaded classifier + LabelEncoder: {len(label_names)} students (version {version})")
+    return FaceMatcher(clf=clf, label_names=label_names, version=version)
+
+
+matcher = None
+if not IN_WORKER_PROCESS:
+    print("Loading face matcher...")
+    matcher = load_matcher()
+
+
+def swap_matcher(new_matcher: FaceMatcher):
+    # a single reference assignment: workers read `matcher` once per batch
+    global matcher
+    matcher = new_matcher
+
+
+def start_model_watcher():
+    """
+    Starts the background hot-reload thread (if HOT_RELOAD). Returns it, or None.
+    """
+    if not HOT_RELOAD:
+        return None
+    files = {"gallery": [GALLERY_FILE], "prototype": [PROTOTYPE_FILE]}.get(MATCHER, [CLASSIFIER_FILE, LABELS_FILE])
+    watcher = ModelWatcher(
+        MATCHER, files, load_matcher, swap_matcher, poll_seconds=RELOAD_POLL_SECONDS,
+        on_reload=lambda m, seconds: METRICS.observe("model_reload", seconds),
+    )
+    METRICS.gauge("model_version", lambda: matcher.version, "Version of the face matcher in use (model_version.json)")
+    METRICS.gauge("model_loaded_timestamp", lambda: matcher.loaded_at.timestamp(),
+                  "Unix time the face matcher in use was loaded")
+    METRICS.gauge("model_students", lambda: matcher.num_students, "Students known to the face matcher in use")
+    METRICS.gauge("model_reload_failures", lambda: watcher.failures, "Failed hot reloads since start")
+    watcher.start()
+    return watcher
+if not IN_WORKER_PROCESS:
+    print("System ready.\n")
+
+
+# ==============================
+# HELPERS
+# ==============================
+def clamp_box(x1, y1, x2, y2, w, h):
+    x1 = max(0, x1); y1 = max(0, y1)
+    x2 = min(w - 1, x2); y2 = min(h - 1, y2)
+    if x2 <= x1: x2 = min(w - 1, x1 + 1)
+    if y2 <= y1: y2 = min(h - 1, y1 + 1)
+    return x1, y1, x2, y2
+
+def extract_student_num(label: str) -> str:
+    # label like "8220967_Din" OR "allison_lang_190036"
+    first = label.split("_")[0].strip()
+    return first if first.isdigit() else label
+
+_tiled_detector = None
+_tiled_lock = threading.Lock()
+
+def tiled_detector() -> TiledDetector:
+    global _tiled_detector
+    with _tiled_lock:
+        if _tiled_detector is None:
+            rows, cols = DETECT_TILES
+            _tiled_detector = TiledDetector(
+                detector, rows, cols, DETECT_TILE_OVERLAP, DETECT_SCALE, DETECT_FAR_ROWS, DETECT_FAR_SCALE,
+                roi=DETECT_ROI, workers=DETECT_TILE_WORKERS, executor=DETECT_TILE_EXECUTOR,
+            )
+        return _tiled_detector
+
+def start_tiled_detector():
+    """
+    Starts the tile workers (DETECT_TILED only) and waits for their detectors,
+    so the first frames aren't held up by worker start-up.
+    """
+    if DETECT_TILED:
+        tiled_detector().start()
+
+def close_tiled_detector():
+    global _tiled_detector
+    with _tiled_lock:
+        if _tiled_detector is not None:
+            _tiled_detector.close()
+            _tiled_detector = None
+
+def describe_detection(W: int) -> str:
+    """
+    One-line detection setup for the startup log, with the smallest findable face.
+    """
+    if DETECT_TILED:
+        rows, cols = DETECT_TILES
+        return (f"tiled {rows}x{cols} overlap={DETECT_TILE_OVERLAP} far_rows={DETECT_FAR_ROWS}@{DETECT_FAR_SCALE} "
+                f"near@{DETECT_SCALE} roi={DETECT_ROI} workers={DETECT_TILE_EXECUTOR} "
+                f"(min face {MIN_FACE_PX}px, HOG finds >= {min_safe_face_px(DETECT_FAR_SCALE):.0f}px far / "
+                f"{min_safe_face_px(DETECT_SCALE):.0f}px near)")
+    return (f"scale={DETECT_SCALE} roi={DETECT_ROI} (min face {MIN_FACE_RATIO * W:.0f}px, "
+            f"HOG finds >= {min_safe_face_px(DETECT_SCALE):.0f}px)")
+
+def min_face_ok(face_w: int, W: int) -> bool:
+    if DETECT_TILED:
+        return face_w >= MIN_FACE_PX
+    return face_w / float(W) >= MIN_FACE_RATIO
+
+def detect_boxes(ctx: FrameContext):
+    """
+    Detection on the reduced image (or tiles), returns clamped full-res (x1, y1, x2, y2) boxes.
+    """
+    H, W = ctx.shape[:2]
+    with METRICS.timer("detect"):
+        if DETECT_TILED:
+            boxes = tiled_detector().detect(ctx.bgr, gray=ctx.gray)
+        else:
+            # full-res grey is only worth converting when detection runs at full res
+            gray = ctx.gray if (DETECT_SCALE == 1.0 and not DETECT_ROI) else None
+            boxes = detect_faces(worker_detector(), ctx.bgr, DETECT_SCALE, DETECT_ROI, gray=gray)
+    return [clamp_box(*b, W, H) for b in boxes]
+
+def classify_embeddings(embs, m: FaceMatcher = None):
+    """
+    Classifies a batch of embeddings with matcher m (default: the campus matcher).
+    Returns (names, confidences, accepted) arrays.
+    """
+    X = np.asarray(embs, dtype=np.float32)
+    m = m or matcher
+    if m.gallery is not None:
+        return m.gallery.predict(X)
+
+    probs = m.clf.predict_proba(X)
+    idx = np.argmax(probs, axis=1)
+    conf = probs[np.arange(len(idx)), idx]
+    return m.label_names[idx], conf, conf >= ACCEPT_PROBA
+
+def face_chips(ctx: FrameContext, boxes):
+    """
+    One landmark pass per face on the shared RGB frame, then all aligned chips
+    of the frame from a single get_face_chips call (the embedder's geometry).
+    """
+    if not boxes:
+        return []
+    sp = worker_predictor()
+    rgb = ctx.rgb
+
+    shapes = dlib.full_object_detections()
+    for box in boxes:
+        shapes.append(sp(rgb, dlib.rectangle(*box)))
+    return embedder.face_chips(rgb, shapes, cut_size=CHIP_SIZE)
+
+def embed_chips(chips):
+    """
+    One embed_batch over a list of aligned chips (may come from several
+    frames / cameras). Returns one float32 (dim,) array per chip, or None
+    where it failed.
+    """
+    if not chips:
+        return []
+    try:
+        return list(embedder.embed_batch(chips, JITTERS))
+    except Exception:
+        # fall back to one chip at a time so one bad face doesn't drop the batch
+        out = []
+        for chip in chips:
+            try:
+                out.append(embedder.embed_batch([chip], JITTERS)[0])
+            except Exception:
+                out.append(None)
+        return out
+
+def face_chip_embeddings(ctx: FrameContext, boxes):
+    """
+    Embeds every box of one frame: landmarks -> chips -> one descriptor batch.
+    """
+    return embed_chips(face_chips(ctx, boxes))
+
+
+# ==============================
+# RECOGNITION PATH
+# ==============================
+def recognise_batch(items, matchers=None, embed_fn=None):
+    """
+    Recognition path for a list of (FrameContext, (x1, y1, x2, y2)) items,
+    which may come from different frames or cameras:
+    size gate -> one antispoof batch -> chips per frame -> one embedding batch
+    -> one classifier batch per matcher.
+    matchers: None (campus matcher), one FaceMatcher, or one per item (e.g. each
+    camera's room roster, see roster.py).
+    embed_fn(ctx, boxes): optional replacement for landmarks + chips + embedding
+    of one frame (e.g. embed_pool.EmbedPool in worker processes), returning one
+    embedding or None per box.
+    Returns one dict per item that can be drawn and fed into a snapshot window.
+    """
+    results = []
+    candidates = []
+    if matchers is None or isinstance(matchers, FaceMatcher):
+        matchers = [matchers] * len(items)
+    matcher_of = {}
+
+    # ---------- SIZE GATE ----------
+    for (ctx, box), m in zip(items, matchers):
+        H, W = ctx.shape[:2]
+        x1, y1, x2, y2 = clamp_box(*box, W, H)
+        res = {"box": (x1, y1, x2, y2), "student_num": None, "cnn": None}
+        results.append(res)
+        matcher_of[id(res)] = m or matcher
+
+        face_w = max(1, x2 - x1)
+        face_ratio = face_w / float(W)
+
+        if not min_face_ok(face_w, W):
+            res.update(color=(0, 255, 255), text="Too small - come closer")
+            continue
+        if face_ratio > MAX_FACE_RATIO:
+            res.update(color=(0, 165, 255), text="Too close - move back")
+            continue
+        candidates.append((ctx, res))
+
+    # ---------- ANTISPOOF (one batch for all faces) ----------
+    if HAS_ANTISPOOF and candidates:
+        crops = [ctx.crop(res["box"]) for ctx, res in candidates]
+        with METRICS.timer("antispoof"):
+            scores = is_real_face_batch(crops)
+        live = []
+        for (ctx, res), score in zip(candidates, scores):
+            res["cnn"] = float(score)
+            if USE_ANTISPOOF_GATE and res["cnn"] < ANTISPOOF_THRESH:
+                res.update(color=(0, 0, 255), text=f"SPOOF (cnn={res['cnn']:.2f})")
+                continue
+            live.append((ctx, res))
+        candidates = live
+
+    # ---------- CHIPS (landmarks per frame) ----------
+    by_frame = {}
+    for ctx, res in candidates:
+        by_frame.setdefault(id(ctx), (ctx, []))[1].append(res)
+
+    chipped = []
+    chips = []
+    chip_embs = []
+    for ctx, frame_res in by_frame.values():
+        boxes = [res["box"] for res in frame_res]
+        if embed_fn is not None:
+            # landmarks + chips + embedding happen elsewhere, one call per frame
+            try:
+                with METRICS.timer("embed"):
+                    frame_embs = embed_fn(ctx, boxes)
+            except Exception:
+                frame_embs = [None] * len(frame_res)
+            chipped.extend(frame_res)
+            chip_embs.extend(frame_embs)
+            continue
+        try:
+            with METRICS.timer("landmark"):
+                frame_chips = face_chips(ctx, boxes)
+        except Exception:
+            frame_chips = [None] * len(frame_res)
+        for res, chip in zip(frame_res, frame_chips):
+            if chip is None:
+                res.update(color=(0, 0, 255), text="Chip/landmark failed")
+                continue
+            chipped.append(res)
+            chips.append(chip)
+
+    # ---------- EMBED (one batch for all faces) ----------
+    embedded = []
+    embs = []
+    if chips:
+        with METRICS.timer("embed"):
+            chip_embs = embed_chips(chips)
+    for res, emb in zip(chipped, chip_embs):
+        if emb is None:
+            res.update(color=(0, 0, 255), text="Chip/landmark failed")
+            continue
+        embs.append(emb)
+        embedded.append(res)
+
+    if not embedded:
+        return results
+
+    # ---------- CLASSIFY (one batch per matcher) ----------
+    groups = {}
+    for res, emb in zip(embedded, embs):
+        m = matcher_of[id(res)]
+        group = groups.setdefault(id(m), (m, [], []))
+        group[1].append(res)
+        group[2].append(emb)
+
+    classified = []
+    with METRICS.timer("classify"):
+        for m, group_res, group_embs in groups.values():
+            names, confs, accepted = classify_embeddings(group_embs, m)
+            classified.extend(zip(group_res, names, confs, accepted))
+
+    for res, name, conf, ok in classified:
+        cnn_score = res["cnn"]
+        name = str(name)
+        conf = float(conf)
+
+        if not ok:
+            res.update(color=(0, 255, 255), text=f"Low confidence ({conf*100:.1f}%)")
+            continue
+
+        label = f"{name} ({conf*100:.1f}%)"
+        if cnn_score is not None:
+            label += f" cnn={cnn_score:.2f}"
+
+        res.update(
+            color=(0, 255, 0), text=label,
+            name=name, student_num=extract_student_num(name), conf=conf,
+        )
+
+    return results
+
+def recognise_faces(ctx: FrameContext, boxes, m: FaceMatcher = None, embed_fn=None):
+    """
+    Single-frame convenience wrapper around recognise_batch().
+    """
+    return recognise_batch([(ctx, box) for box in boxes], m, embed_fn)
@@ -0,0 +1,134 @@
+# roster.py
+# Per-room candidate gallery from the backend (/attendance/roster-gallery).
+# Only the students enrolled in the room's active / next lesson are searched,
+# so matching cost stays flat as campus enrolment grows and faces can't be
+# matched to students who aren't scheduled there.
+# Falls back to the full campus matcher (recognition.matcher) when the backend
+# is unreachable, no lesson is scheduled, or the roster was built from another
+# embedder than this recogniser's (EMBED_BACKEND).
+import base64
+import threading
+import time
+
+import numpy as np
+import requests
+
+from gallery import GalleryMatcher
+
+ROSTER_REFRESH_SECONDS = 120   # roster changes at lesson boundaries; the ETag makes polling cheap
+ROSTER_TIMEOUT = 5
+ROSTER_MAX_STALE_SECONDS = 900 # backend down longer than this: the lesson may be over, use the campus matcher
+
+
+def decode_roster(data: dict) -> GalleryMatcher:
+    dim = int(data["dim"])
+    raw = base64.b64decode(data["embeddings"])
+    matrix = np.frombuffer(raw, dtype="<f4").reshape(-1, dim) if dim else np.zeros((0, 0), dtype=np.float32)
+    return GalleryMatcher(
+        matrix, np.asarray(data["row_labels"], dtype=np.int32), np.asarray(data["label_names"]),
+        threshold=float(data["threshold"]), margin=float(data["margin"]), mode=data.get("mode", "centroid"),
+        embedder=data.get("embedder") or None,
+    )
+
+
+class RosterGallery(threading.Thread):
+    """
+    Background poller for one room. `matcher` is the current roster matcher
+    (a recognition.FaceMatcher) or None, meaning "use the campus matcher".
+    """
+
+    def __init__(self, url: str, building=None, room=None,
+                 refresh_seconds: float = ROSTER_REFRESH_SECONDS, timeout: float = ROSTER_TIMEOUT):
+        super().__init__(name=f"roster[{building}/{room}]", daemon=True)
+        self.url = url
+        self.building = building
+        self.room = room
+        self.refresh_seconds = refresh_seconds
+        self.timeout = timeout
+        self.session = requests.Session()
+
+        self._matcher = None
+        self.last_ok_ts = 0.0
+        self.etag = None
+        self.lessons = []
+        self.missing = []
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.refresh_seconds)
+
+    def refresh(self) -> bool:
+        # imported here: recognition loads the models on import
+        from recognition import FaceMatcher, embedder
+
+        headers = {"If-None-Match": self.etag} if (self.etag and self._matcher is not None) else {}
+        params = {"building": self.building or "", "room": self.room or ""}
+        try:
+            r = self.session.get(self.url, params=params, headers=headers, timeout=self.timeout)
+        except Exception as e:
+            self._failed(f"{type(e).__name__}: {e}")
+            return False
+
+        if r.status_code == 304:
+            self.last_ok_ts = time.time()
+            self.last_error = None
+            return True
+        if not r.ok:
+            self._failed(f"HTTP {r.status_code}")
+            return False
+
+        try:
+            data = r.json()
+            gallery = decode_roster(data)
+        except Exception as e:
+            self._failed(f"bad roster: {e}")
+            return False
+        if gallery.embedder and gallery.embedder != embedder.signature:
+            # vectors from another backend are not comparable, same rule as recognition.load_matcher
+            self._matcher = None
+            self._failed(f"roster built from {gallery.embedder} embeddings, this recogniser uses "
+                         f"{embedder.signature}")
+            return False
+
+        self.etag = r.headers.get("ETag")
+        self.lessons = data.get("lessons", [])
+        self.missing = data.get("missing_embeddings", [])
+        self.last_error = None
+        self.last_ok_ts = time.time()
+
+        if len(gallery.label_names) == 0:
+            # no lesson (or nobody enrolled) in this room right now
+            if self._matcher is not None:
+                print(f"[ROSTER] {self.building}/{self.room}: no scheduled students, using campus matcher")
+            self._matcher = None
+            return True
+
+        self._matcher = FaceMatcher(gallery=gallery, version=data.get("version"))
+        lesson_ids = [L["lesson_id"] for L in self.lessons]
+        print(f"[ROSTER] {self.building}/{self.room}: {len(gallery.label_names)} candidate(s) "
+              f"for lesson(s) {lesson_ids}" + (f", {len(self.missing)} without embeddings" if self.missing else ""))
+        return True
+
+    def _failed(self, error: str):
+        if self.last_error is None:
+            print(f"[ROSTER] {self.building}/{self.room}: roster unavailable ({error}), "
+                  f"{'keeping last roster' if self._matcher is not None else 'using campus matcher'}")
+        self.last_error = error
+
+    @property
+    def matcher(self):
+        m = self._matcher
+        if m is None or time.time() - self.last_ok_ts > ROSTER_MAX_STALE_SECONDS:
+            return None
+        return m
+
+    @property
+    def size(self) -> int:
+        m = self.matcher
+        return m.num_students if m is not None else 0
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,71 @@
+# snapshot.py
+# Snapshot window: best detection per student over SNAPSHOT_SECONDS, turned
+# into the /attendance/auto payload when the window closes.
+# With track voting (tracker.py) "accuracy" is the aggregated track confidence;
+# "frames" counts the frames the student was seen in, "votes" the agreeing
+# recognitions behind the best one.
+import time
+from datetime import datetime
+
+
+class SnapshotWindow:
+    def __init__(self, seconds: float = 60):
+        self.seconds = seconds
+        self.best = {}
+        self.start_ts = time.time()
+        self.captured_at = datetime.now()
+
+    def add(self, res: dict) -> bool:
+        """
+        Feeds one accepted recognition result. Returns True if it is the best
+        detection of that student so far in this window.
+        """
+        student_num = res.get("student_num")
+        if not student_num:
+            return False
+        conf = res["conf"]
+        cnn_score = res.get("cnn")
+        prev = self.best.get(student_num)
+        frames = (prev["frames"] if prev else 0) + 1
+        if (prev is None) or (conf > prev["accuracy"]):
+            self.best[student_num] = {
+                "student_num": student_num,
+                "accuracy": round(conf, 4),
+                "cnn": round(cnn_score, 3) if (cnn_score is not None) else None,
+                "frames": frames,
+                "votes": int(res.get("votes", 1)),
+            }
+            return True
+        prev["frames"] = frames
+        return False
+
+    def due(self, now_ts: float = None) -> bool:
+        return (now_ts or time.time()) - self.start_ts >= self.seconds
+
+    def seconds_left(self, now_ts: float = None) -> int:
+        return max(0, int(self.seconds - ((now_ts or time.time()) - self.start_ts)))
+
+    def payload(self, building=None, room=None) -> dict:
+        """
+        {
+          "captured_at": "...",
+          "detections": [...],
+          "location": {"building": "...", "room": "..."}
+        }
+        """
+        return {
+            "captured_at": self.captured_at.isoformat(),
+            "detections": list(self.best.values()),
+            "location": {
+                "building": (building or None),
+                "room": (room or None),
+            }
+        }
+
+    def reset(self, now_ts: float = None):
+        self.best = {}
+        self.start_ts = now_ts or time.time()
+        self.captured_at = datetime.now()
+
+    def __len__(self):
+        return len(self.best)
@@ -0,0 +1,7 @@
+# Unit tests for the temp_MS modules: python -m pytest tests (from temp_MS).
+# The scripts import each other by module name (they are run from this
+# folder), so the folder goes on sys.path.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
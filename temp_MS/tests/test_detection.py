@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from detection import make_tiles, nms
+
+
+def test_nms_keeps_highest_scoring_of_overlapping_boxes():
+    boxes = [(0, 0, 100, 100), (5, 5, 105, 105), (300, 0, 400, 100)]
+    kept = nms(boxes, [0.5, 0.9, 0.7])
+    assert kept == [(5, 5, 105, 105), (300, 0, 400, 100)]
+
+
+def test_nms_keeps_boxes_below_iou_threshold():
+    boxes = [(0, 0, 100, 100), (70, 0, 170, 100)]   # IoU 0.18
+    assert len(nms(boxes, [0.9, 0.8], iou_thresh=0.4)) == 2
+
+
+def test_nms_drops_box_mostly_inside_a_kept_one():
+    # a face clipped at a tile edge (low IoU, but 100% inside the whole face)
+    whole, clipped = (0, 0, 100, 100), (0, 0, 40, 100)
+    assert nms([whole, clipped], [0.9, 0.8]) == [whole]
+    assert len(nms([whole, clipped], [0.9, 0.8], contain_thresh=1.1)) == 2
+
+
+def test_nms_empty():
+    assert nms([], []) == []
+
+
+def test_tiles_overlap_and_cover_the_roi():
+    tiles = make_tiles(1200, 600, rows=2, cols=3, overlap=0.2)
+    assert [r for r, _ in tiles] == [0, 0, 0, 1, 1, 1]
+    xs = sorted({(x1, x2) for _, (x1, _, x2, _) in tiles})
+    assert xs[0][0] == 0 and xs[-1][1] == 1200
+    for (_, a_x2), (b_x1, _) in zip(xs, xs[1:]):
+        assert b_x1 < a_x2     # neighbouring tiles overlap
+
+
+def test_tiles_stay_inside_roi():
+    tiles = make_tiles(1000, 1000, rows=2, cols=2, roi=(0.0, 0.5, 1.0, 1.0))
+    for _, (x1, y1, x2, y2) in tiles:
+        assert 0 <= x1 < x2 <= 1000 and 500 <= y1 < y2 <= 1000
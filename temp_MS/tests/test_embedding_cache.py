@@ -0,0 +1,85 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from embedding_cache import EmbeddingCache, local_version
+
+SIG = "dlib_resnet_v1:150/0.25"
+
+
+def emb(seed):
+    return np.random.default_rng(seed).normal(size=128).astype(np.float32)
+
+
+def test_get_hits_only_the_same_version(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.npz"), SIG)
+    cache.put("a.jpg", "v1", emb(0))
+    hit, e = cache.get("a.jpg", "v1")
+    assert hit and np.array_equal(e, emb(0))
+    assert cache.get("a.jpg", "v2") == (False, None)
+    assert cache.get("b.jpg", "v1") == (False, None)
+
+
+def test_no_face_is_a_cached_hit(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.npz"), SIG)
+    cache.put("blurry.jpg", "v1", None)
+    assert cache.get("blurry.jpg", "v1") == (True, None)
+
+
+def test_stale_lists_new_and_changed_paths_once(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.npz"), SIG)
+    cache.put("same.jpg", "v1", emb(0))
+    cache.put("changed.jpg", "v1", emb(1))
+    items = [("same.jpg", "v1"), ("changed.jpg", "v2"), ("new.jpg", "v1"), ("new.jpg", "v1")]
+    assert cache.stale(items) == [("changed.jpg", "v2"), ("new.jpg", "v1")]
+
+
+def test_prune_drops_deleted_paths(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.npz"), SIG)
+    for i, p in enumerate(("a.jpg", "b.jpg", "c.jpg")):
+        cache.put(p, "v1", emb(i))
+    assert cache.prune(["a.jpg", "c.jpg"]) == 1
+    assert sorted(cache.entries) == ["a.jpg", "c.jpg"]
+    assert cache.removed == 1
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "cache.npz")
+    cache = EmbeddingCache(path, SIG)
+    cache.put("a.jpg", "v1", emb(0))
+    cache.put("noface.jpg", "v3", None)
+    cache.put("b.jpg", "v2", emb(1))
+    cache.save()
+
+    loaded = EmbeddingCache.load(path, SIG)
+    assert len(loaded) == 3
+    assert np.array_equal(loaded.get("a.jpg", "v1")[1], emb(0))
+    assert np.array_equal(loaded.get("b.jpg", "v2")[1], emb(1))
+    assert loaded.get("noface.jpg", "v3") == (True, None)
+    # plain arrays only: readable without pickle
+    with np.load(path, allow_pickle=False) as z:
+        assert z["embeddings"].shape == (2, 128)
+
+
+def test_other_embedder_or_rebuild_starts_empty(tmp_path):
+    path = str(tmp_path / "cache.npz")
+    cache = EmbeddingCache(path, SIG)
+    cache.put("a.jpg", "v1", emb(0))
+    cache.save()
+    assert len(EmbeddingCache.load(path, "onnx:other")) == 0
+    assert len(EmbeddingCache.load(path, SIG, rebuild=True)) == 0
+    assert len(EmbeddingCache.load(str(tmp_path / "missing.npz"), SIG)) == 0
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / "cache.npz"
+    path.write_bytes(b"not an npz")
+    assert len(EmbeddingCache.load(str(path), SIG)) == 0
+
+
+def test_local_version_changes_with_content(tmp_path):
+    f = tmp_path / "img.jpg"
+    f.write_bytes(b"1234")
+    v1 = local_version(str(f))
+    f.write_bytes(b"123456")
+    assert local_version(str(f)) != v1
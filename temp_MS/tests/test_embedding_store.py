@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from embedding_store import EmbeddingStore, load_embeddings, save_embeddings
+
+
+def rows(n=6, dim=8):
+    X = np.random.default_rng(0).normal(size=(n, dim)).astype(np.float32)
+    names = ["bob", "amy", "bob", "cat", "amy", "bob"][:n]
+    return X, names
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "embeddings")
+    X, names = rows()
+    save_embeddings(X, names, "dlib_resnet_v1", path, source=["local"] * 6, path=[f"{i}.jpg" for i in range(6)])
+
+    store = load_embeddings(path)
+    assert isinstance(store.embeddings, np.memmap)
+    assert np.array_equal(np.asarray(store.embeddings), X)
+    assert list(store.names) == names
+    assert list(store.labels) == ["amy", "bob", "cat"]
+    assert store.embedder == "dlib_resnet_v1"
+    assert (len(store), store.dim) == (6, 8)
+    assert store.provenance()["path"] == [f"{i}.jpg" for i in range(6)]
+    assert store.provenance()["angle"] == [""] * 6
+
+
+def test_load_without_mmap(tmp_path):
+    path = str(tmp_path / "embeddings")
+    save_embeddings(*rows(), store_dir=path)
+    store = load_embeddings(path, mmap=False)
+    assert not isinstance(store.embeddings, np.memmap)
+
+
+def test_provenance_length_must_match(tmp_path):
+    X, names = rows()
+    with pytest.raises(ValueError):
+        EmbeddingStore.from_rows(X, names, source=["local"] * 5)
+
+
+def test_missing_store(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_embeddings(str(tmp_path / "nothing"))
+
+
+def test_row_count_mismatch_is_rejected(tmp_path):
+    # e.g. embeddings.npy replaced by a newer run before meta.json
+    path = str(tmp_path / "embeddings")
+    save_embeddings(*rows(), store_dir=path)
+    np.save(os.path.join(path, "embeddings.npy"), np.zeros((5, 8), dtype=np.float32))
+    with pytest.raises(RuntimeError, match="row counts"):
+        load_embeddings(path)
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    path = str(tmp_path / "embeddings")
+    save_embeddings(*rows(), store_dir=path)
+    meta_file = os.path.join(path, "meta.json")
+    with open(meta_file, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["format"] = 99
+    with open(meta_file, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    with pytest.raises(RuntimeError, match="format"):
+        load_embeddings(path)
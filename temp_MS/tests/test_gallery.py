@@ -0,0 +1,124 @@
+# Parity of the cosine gallery matcher with the SVC path (recognition.classify_embeddings)
+# on synthetic embeddings: well separated students plus faces of people not enrolled.
+import time
+import warnings
+
+import pytest
+
+np = pytest.importorskip("numpy")
+svm = pytest.importorskip("sklearn.svm")
+
+from gallery import GalleryMatcher, l2_normalize
+
+STUDENTS, PER_STUDENT, DIM = 8, 40, 128
+ACCEPT_PROBA = 0.70    # recognition.ACCEPT_PROBA (the SVC path's reject rule)
+
+
+def clustered(rng, centres, per_centre, names=None):
+    X = np.repeat(centres, per_centre, axis=0)
+    X = X + rng.normal(scale=0.25, size=X.shape).astype(np.float32)
+    return X.astype(np.float32), (np.repeat(names, per_centre) if names is not None else None)
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    names = np.array([f"s{i:02d}" for i in range(STUDENTS)])
+    X, y = clustered(rng, rng.normal(size=(STUDENTS, DIM)).astype(np.float32), PER_STUDENT, names)
+    split = np.arange(len(X)) % 4
+    unknown, _ = clustered(rng, rng.normal(size=(3, DIM)).astype(np.float32), 10)
+    return {
+        "train": (X[split >= 2], y[split >= 2]),
+        "calib": (X[split == 1], y[split == 1]),
+        "test": (X[split == 0], y[split == 0]),
+        "unknown": unknown,
+    }
+
+
+@pytest.fixture(scope="module")
+def svc(data):
+    X, y = data["train"]
+    with warnings.catch_warnings():
+        # sklearn >= 1.9 deprecates probability=True; train_classifier.py still uses it
+        warnings.simplefilter("ignore", FutureWarning)
+        return svm.SVC(kernel="linear", probability=True, random_state=0).fit(X, y)
+
+
+def svc_predict(clf, X):
+    probs = clf.predict_proba(X)
+    idx = np.argmax(probs, axis=1)
+    conf = probs[np.arange(len(idx)), idx]
+    return clf.classes_[idx], conf >= ACCEPT_PROBA
+
+
+def calibrated(data, mode):
+    g = GalleryMatcher.build(*data["train"], mode=mode)
+    g.calibrate(*data["calib"], target_far=0.01)
+    return g
+
+
+@pytest.mark.parametrize("mode", ["centroid", "all"])
+def test_top1_matches_svc(data, svc, mode):
+    X, y = data["test"]
+    g = calibrated(data, mode)
+    names, _, _ = g.predict(X)
+    svc_names, _ = svc_predict(svc, X)
+    assert np.mean(names == svc_names) >= 0.98
+    assert np.mean(names == y) >= np.mean(svc_names == y) - 0.01
+
+
+@pytest.mark.parametrize("mode", ["centroid", "all"])
+def test_reject_matches_svc(data, svc, mode):
+    g = calibrated(data, mode)
+    X = np.vstack([data["test"][0], data["unknown"]])
+    enrolled = np.arange(len(X)) < len(data["test"][0])
+    _, _, accepted = g.predict(X)
+    _, svc_accepted = svc_predict(svc, X)
+    # Platt-scaled SVC probabilities sit not far above ACCEPT_PROBA with 8 students,
+    # so compare rates rather than every face
+    assert np.mean(svc_accepted[enrolled]) >= 0.95 and not svc_accepted[~enrolled].any()
+    assert np.mean(accepted[enrolled]) >= 0.95 and not accepted[~enrolled].any()
+    assert np.mean(accepted == svc_accepted) >= 0.95
+
+
+def test_centroid_mode_scores_against_mean_embedding(data):
+    X, y = data["train"]
+    g = GalleryMatcher.build(X, y, mode="centroid")
+    assert g.matrix.shape == (STUDENTS, DIM)
+    q = data["test"][0][:5]
+    expected = l2_normalize(q) @ l2_normalize(np.stack([l2_normalize(X[y == n]).mean(axis=0)
+                                                         for n in g.label_names])).T
+    assert np.allclose(g.label_scores(q), expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["all", "prototypes"])
+def test_multi_row_modes_take_best_row_per_student(mode):
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(7, 16)).astype(np.float32)
+    row_labels = np.array([2, 0, 1, 0, 2, 1, 0])     # unsorted on purpose
+    g = GalleryMatcher(matrix, row_labels, np.array(["a", "b", "c"]), mode=mode)
+    q = rng.normal(size=(4, 16)).astype(np.float32)
+    sims = l2_normalize(q) @ l2_normalize(matrix).T
+    expected = np.stack([sims[:, row_labels == i].max(axis=1) for i in range(3)], axis=1)
+    assert np.allclose(g.label_scores(q), expected, atol=1e-5)
+
+
+def test_margin_rejects_close_runner_up():
+    g = GalleryMatcher(np.eye(2, dtype=np.float32), np.arange(2), np.array(["a", "b"]), threshold=0.0, margin=0.1)
+    _, _, accepted = g.predict(np.array([[1.0, 0.98], [1.0, 0.2]], dtype=np.float32))
+    assert accepted.tolist() == [False, True]
+
+
+def test_batch_latency_not_worse_than_svc(data, svc):
+    q = data["test"][0][np.arange(64) % len(data["test"][0])]
+    g = calibrated(data, "all")
+
+    def best_ms(fn, repeats=20):
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return best * 1000.0
+
+    assert best_ms(lambda: g.predict(q)) <= best_ms(lambda: svc.predict_proba(q))
@@ -0,0 +1,83 @@
+import threading
+
+from pipeline import DropOldestQueue, FairQueue
+
+
+def test_drop_oldest_keeps_newest_items():
+    q = DropOldestQueue(maxsize=2)
+    for i in range(5):
+        q.put(i)
+    assert q.dropped == 3
+    assert q.qsize() == 2
+    assert [q.get(timeout=0), q.get(timeout=0)] == [3, 4]
+
+
+def test_get_times_out_empty():
+    q = DropOldestQueue(maxsize=2)
+    assert q.get(timeout=0.01) is None
+
+
+def test_get_wakes_on_put():
+    q = DropOldestQueue(maxsize=2)
+    threading.Timer(0.05, q.put, args=("frame",)).start()
+    assert q.get(timeout=5.0) == "frame"
+
+
+def test_close_drains_then_returns_none():
+    q = DropOldestQueue(maxsize=2)
+    q.put(1)
+    q.close()
+    assert q.closed
+    assert q.get(timeout=0) == 1
+    assert q.get(timeout=5.0) is None
+
+
+def test_on_drop_gets_each_discarded_item():
+    freed = []
+    q = DropOldestQueue(maxsize=2, on_drop=freed.append)
+    for i in range(4):
+        q.put(i)
+    assert freed == [0, 1]
+    assert q.dropped == 2
+
+
+def test_on_drop_gets_items_put_after_close():
+    # a closed queue must still hand the item back, or its frame slot leaks
+    freed = []
+    q = DropOldestQueue(maxsize=2, on_drop=freed.append)
+    q.close()
+    q.put("late")
+    assert freed == ["late"]
+    assert q.qsize() == 0
+
+
+# ----------------------------
+# FairQueue (multi-camera batching)
+# ----------------------------
+def test_fair_queue_round_robin_across_sources():
+    q = FairQueue(maxsize_per_key=10)
+    for i in range(4):
+        q.put("cam0", f"a{i}")
+    q.put("cam1", "b0")
+    q.put("cam2", "c0")
+    assert q.get_batch(4, timeout=0) == ["a0", "b0", "c0", "a1"]
+    assert q.get_batch(10, timeout=0) == ["a2", "a3"]
+
+
+def test_fair_queue_drops_oldest_per_source():
+    q = FairQueue(maxsize_per_key=2)
+    for i in range(5):
+        q.put("cam0", i)
+    q.put("cam1", "x")
+    assert q.dropped == 3
+    assert q.qsize() == 3
+    assert sorted(map(str, q.get_batch(10, timeout=0))) == ["3", "4", "x"]
+
+
+def test_fair_queue_empty_batch_on_timeout_and_close():
+    q = FairQueue()
+    assert q.get_batch(8, timeout=0.01) == []
+    q.close()
+    q.put("cam0", 1)
+    assert q.closed
+    assert q.get_batch(8, timeout=5.0) == []
@@ -0,0 +1,87 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("sklearn")
+
+from prototypes import PrototypeClassifier, student_prototypes
+
+DIM = 32
+
+
+def student_rows(seed, n=30):
+    rng = np.random.default_rng(seed)
+    return (rng.normal(size=DIM) + rng.normal(scale=0.2, size=(n, DIM))).astype(np.float32)
+
+
+def gallery(*students):
+    X = np.vstack([student_rows(seed, n) for _, seed, n in students])
+    names = np.concatenate([[name] * n for name, _, n in students])
+    return X, names
+
+
+def test_sync_adds_every_student():
+    model = PrototypeClassifier()
+    added, updated, removed = model.sync(*gallery(("amy", 1, 30), ("bob", 2, 30)))
+    assert (sorted(added), updated, removed) == (["amy", "bob"], [], [])
+    assert model.students["amy"][1] == 30
+
+
+def test_sync_skips_unchanged_students():
+    model = PrototypeClassifier()
+    model.sync(*gallery(("amy", 1, 30), ("bob", 2, 30)))
+    protos = model.students["amy"][0]
+    added, updated, removed = model.sync(*gallery(("amy", 1, 30), ("bob", 2, 30)))
+    assert (added, updated, removed) == ([], [], [])
+    assert model.students["amy"][0] is protos
+
+
+def test_sync_updates_reenrolled_and_removes_missing():
+    model = PrototypeClassifier()
+    model.sync(*gallery(("amy", 1, 30), ("bob", 2, 30), ("cat", 3, 30)))
+    added, updated, removed = model.sync(*gallery(("amy", 1, 30), ("bob", 9, 25), ("dan", 4, 30)))
+    assert (added, updated, removed) == (["dan"], ["bob"], ["cat"])
+    assert sorted(model.students) == ["amy", "bob", "dan"]
+    assert model.students["bob"][1] == 25
+
+
+def test_sync_ignores_row_order_across_students():
+    X, names = gallery(("amy", 1, 30), ("bob", 2, 30))
+    model = PrototypeClassifier()
+    model.sync(X, names)
+    order = np.r_[np.arange(30, 60), np.arange(0, 30)]
+    assert model.sync(X[order], names[order]) == ([], [], [])
+
+
+def test_prototype_count_follows_image_count():
+    assert student_prototypes(student_rows(1, 5), k=3).shape == (1, DIM)
+    assert student_prototypes(student_rows(1, 30), k=3).shape == (3, DIM)
+    assert np.allclose(np.linalg.norm(student_prototypes(student_rows(1, 30), k=3), axis=1), 1.0, atol=1e-5)
+
+
+def test_scorer_rebuilt_after_changes():
+    model = PrototypeClassifier()
+    model.sync(*gallery(("amy", 1, 30), ("bob", 2, 30)))
+    assert list(model.label_names) == ["amy", "bob"]
+    model.set_student("cat", student_rows(3))
+    assert list(model.label_names) == ["amy", "bob", "cat"]
+    model.remove_student("amy")
+    assert list(model.label_names) == ["bob", "cat"]
+
+
+def test_predict_and_round_trip(tmp_path):
+    model = PrototypeClassifier(embedder="dlib_resnet_v1")
+    model.sync(*gallery(("amy", 1, 30), ("bob", 2, 30)))
+    queries = np.vstack([student_rows(1, 3), student_rows(2, 3)])
+    names, proba, accepted = model.predict(queries)
+    assert list(names) == ["amy"] * 3 + ["bob"] * 3
+
+    path = str(tmp_path / "prototypes.npz")
+    model.save(path)
+    loaded = PrototypeClassifier.load(path)
+    assert loaded.embedder == "dlib_resnet_v1"
+    assert sorted(loaded.students) == ["amy", "bob"]
+    # unchanged rows are still recognised as unchanged after a reload
+    assert loaded.sync(*gallery(("amy", 1, 30), ("bob", 2, 30))) == ([], [], [])
+    names2, proba2, accepted2 = loaded.predict(queries)
+    assert list(names2) == list(names)
+    assert np.allclose(proba2, proba) and np.array_equal(accepted2, accepted)
@@ -0,0 +1,162 @@
+import pytest
+
+pytest.importorskip("cv2")
+
+from tracker import FaceTracker, centroid_distance, iou
+
+T0 = 1000.0
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (20, 20, 30, 30)) == 0.0
+    assert iou((0, 0, 10, 10), (5, 0, 15, 10)) == pytest.approx(50 / 150)
+
+
+def test_centroid_distance_is_relative_to_width():
+    assert centroid_distance((0, 0, 100, 100), (50, 0, 150, 100)) == pytest.approx(0.5)
+
+
+def test_overlapping_detection_keeps_track():
+    tracker = FaceTracker(iou_thresh=0.3)
+    (t,) = tracker.update([(0, 0, 100, 100)], ts=T0)
+    (t2,) = tracker.update([(10, 5, 110, 105)], ts=T0 + 0.1)
+    assert t2.id == t.id
+    assert t2.box == (10, 5, 110, 105)
+
+
+def test_centroid_fallback_for_fast_mover():
+    tracker = FaceTracker(iou_thresh=0.3, max_centroid_dist=0.6)
+    (t,) = tracker.update([(0, 0, 100, 100)], ts=T0)
+    # IoU 0.29 (below the threshold), centre moved 0.55 box widths
+    (t2,) = tracker.update([(55, 0, 155, 100)], ts=T0 + 0.1)
+    assert t2.id == t.id
+
+
+def test_distant_detection_starts_new_track():
+    tracker = FaceTracker(iou_thresh=0.3, max_centroid_dist=0.6)
+    (t,) = tracker.update([(0, 0, 100, 100)], ts=T0)
+    live = tracker.update([(0, 0, 100, 100), (400, 0, 500, 100)], ts=T0 + 0.1)
+    assert len(live) == 2
+    assert {x.id for x in live} == {t.id, t.id + 1}
+
+
+def test_each_detection_matches_one_track():
+    tracker = FaceTracker(iou_thresh=0.3)
+    a, b = tracker.update([(0, 0, 100, 100), (300, 0, 400, 100)], ts=T0)
+    live = tracker.update([(305, 0, 405, 100), (2, 0, 102, 100)], ts=T0 + 0.1)
+    boxes = {x.id: x.box for x in live}
+    assert boxes == {a.id: (2, 0, 102, 100), b.id: (305, 0, 405, 100)}
+
+
+def test_missed_track_ages_out():
+    tracker = FaceTracker(max_misses=2)
+    (t,) = tracker.update([(0, 0, 100, 100)], ts=T0)
+    tracker.update([], ts=T0 + 1)
+    tracker.update([], ts=T0 + 2)
+    assert tracker.get(t.id) is not None
+    assert tracker.get(t.id).misses == 2
+    tracker.update([], ts=T0 + 3)
+    assert tracker.get(t.id) is None
+    assert len(tracker) == 0
+
+
+def test_redetection_resets_misses():
+    tracker = FaceTracker(max_misses=2)
+    (t,) = tracker.update([(0, 0, 100, 100)], ts=T0)
+    tracker.update([], ts=T0 + 1)
+    tracker.update([], ts=T0 + 2)
+    tracker.update([(0, 0, 100, 100)], ts=T0 + 3)
+    tracker.update([], ts=T0 + 4)
+    assert tracker.get(t.id).misses == 1
+
+
+def test_cached_result_until_reverify():
+    tracker = FaceTracker(reverify_seconds=10.0, retry_seconds=1.0)
+    (t,) = tracker.update([(0, 0, 100, 100)], ts=T0)
+    assert tracker.needs_recognition(t, ts=T0)
+    tracker.mark_pending(t, ts=T0)
+    assert not tracker.needs_recognition(t, ts=T0 + 0.1)
+    tracker.set_result(t.id, {"name": "A", "student_num": "1", "conf": 0.9}, t.box, ts=T0 + 0.2)
+    assert not tracker.needs_recognition(t, ts=T0 + 5)
+    assert tracker.needs_recognition(t, ts=T0 + 10.3)
+
+
+def test_clear_pending_allows_retry():
+    tracker = FaceTracker(pending_timeout=3.0)
+    (t,) = tracker.update([(0, 0, 100, 100)], ts=T0)
+    tracker.mark_pending(t, ts=T0)
+    assert not tracker.needs_recognition(t, ts=T0 + 0.1)
+    tracker.clear_pending(t.id)
+    assert tracker.needs_recognition(t, ts=T0 + 0.1)
+
+
+# ----------------------------
+# identity voting (k-of-n)
+# ----------------------------
+def accepted(name, conf=0.9, cnn=0.8):
+    return {"name": name, "student_num": name, "conf": conf, "cnn": cnn}
+
+
+def unknown():
+    return {"name": "Unknown", "student_num": None, "conf": 0.2, "cnn": 0.8}
+
+
+def voting_tracker(**kw):
+    tracker = FaceTracker(vote_window=5, vote_min_agree=3, vote_max_age=30.0, **kw)
+    (t,) = tracker.update([(0, 0, 100, 100)], ts=T0)
+    return tracker, t
+
+
+def vote(tracker, t, result, ts):
+    tracker.set_result(t.id, result, t.box, ts=ts)
+    return tracker.get(t.id).result
+
+
+def test_identity_committed_after_k_agreeing_votes():
+    tracker, t = voting_tracker()
+    r = vote(tracker, t, accepted("A"), T0 + 1)
+    assert r["student_num"] is None and r["text"].startswith("Verifying A (1/3)")
+    r = vote(tracker, t, accepted("A"), T0 + 2)
+    assert r["student_num"] is None
+    r = vote(tracker, t, accepted("A"), T0 + 3)
+    assert r["student_num"] == "A"
+    assert r["votes"] == 3
+    assert tracker.commits == 1
+
+
+def test_committed_conf_is_geometric_mean():
+    tracker, t = voting_tracker()
+    for i, conf in enumerate((0.9, 0.4, 0.9)):
+        r = vote(tracker, t, accepted("A", conf=conf), T0 + 1 + i)
+    assert r["conf"] == pytest.approx((0.9 * 0.4 * 0.9) ** (1 / 3))
+
+
+def test_unknown_votes_do_not_count():
+    tracker, t = voting_tracker()
+    for i, result in enumerate((accepted("A"), unknown(), accepted("A"), unknown())):
+        r = vote(tracker, t, result, T0 + 1 + i)
+    assert r["student_num"] is None
+
+
+def test_commit_kept_until_another_identity_wins():
+    tracker, t = voting_tracker()
+    for i in range(3):
+        vote(tracker, t, accepted("A"), T0 + 1 + i)
+    # A keeps the commit while B collects votes (window A A A B B)
+    r = vote(tracker, t, accepted("B"), T0 + 4)
+    r = vote(tracker, t, accepted("B"), T0 + 5)
+    assert r["student_num"] == "A"
+    # window A A B B B: B leads with 3
+    r = vote(tracker, t, accepted("B"), T0 + 6)
+    assert r["student_num"] == "B"
+    assert tracker.commits == 2
+
+
+def test_commit_dropped_when_votes_age_out():
+    tracker, t = voting_tracker()
+    for i in range(3):
+        vote(tracker, t, accepted("A"), T0 + 1 + i)
+    r = vote(tracker, t, unknown(), T0 + 100)
+    assert r["student_num"] is None
+    assert tracker.get(t.id).committed is None
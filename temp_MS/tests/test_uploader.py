@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from uploader import SnapshotSpool
+
+
+@pytest.fixture
+def spool(tmp_path):
+    s = SnapshotSpool(str(tmp_path / "spool.db"))
+    yield s
+    s.close()
+
+
+def ids(rows):
+    return [row[0] for row in rows]
+
+
+def test_due_is_oldest_first(spool):
+    for i in range(3):
+        spool.append("http://backend/attendance/auto", {"i": i})
+    assert ids(spool.due()) == [1, 2, 3]
+
+
+def test_failure_blocks_the_whole_queue(spool):
+    for i in range(3):
+        spool.append("http://backend/attendance/auto", {"i": i})
+    head = spool.due()[0]
+    spool.retry_later(head[0], head[4], "ConnectionError")
+    # nothing newer may overtake the failed head while backing off
+    assert spool.due() == []
+    spool.replay_now()
+    rows = spool.due()
+    assert ids(rows) == [1, 2, 3]
+    assert rows[0][4] == 1     # attempts recorded on the row
+
+
+def test_done_and_dead_move_the_head_on(spool):
+    for i in range(3):
+        spool.append("http://backend/attendance/auto", {"i": i})
+    spool.done(1)
+    spool.dead(2, "HTTP 422")
+    assert ids(spool.due()) == [3]
+    assert spool.pending_count() == 1
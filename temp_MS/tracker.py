@@ -0,0 +1,338 @@
+# tracker.py
+# Lightweight multi-face tracker for the live recogniser.
+# - Associates detections to existing tracks by IoU, falling back to centroid distance
+# - Optional OpenCV correlation tracker (MOSSE/KCF) moves boxes between detections
+# - Caches each track's recognition result (identity, confidence, antispoof score)
+#   so recognition only re-runs on an interval or when the box changes a lot
+# - Identity voting: a track's identity is only committed once vote_min_agree of
+#   its last vote_window recognitions agree; the committed result carries the
+#   geometric-mean confidence (mean log-probability) and mean antispoof score
+
+import math
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+def iou(a, b):
+    ax1, ay1, ax2, ay2 = a
+    bx1, by1, bx2, by2 = b
+    ix1, iy1 = max(ax1, bx1), max(ay1, by1)
+    ix2, iy2 = min(ax2, bx2), min(ay2, by2)
+    iw, ih = max(0, ix2 - ix1), max(0, iy2 - iy1)
+    inter = iw * ih
+    if inter <= 0:
+        return 0.0
+    area_a = max(1, (ax2 - ax1) * (ay2 - ay1))
+    area_b = max(1, (bx2 - bx1) * (by2 - by1))
+    return inter / float(area_a + area_b - inter)
+
+
+def centroid_distance(a, b):
+    """
+    Centre distance between two boxes, relative to the width of box a.
+    """
+    acx, acy = (a[0] + a[2]) / 2.0, (a[1] + a[3]) / 2.0
+    bcx, bcy = (b[0] + b[2]) / 2.0, (b[1] + b[3]) / 2.0
+    width = max(1.0, float(a[2] - a[0]))
+    return (((acx - bcx) ** 2 + (acy - bcy) ** 2) ** 0.5) / width
+
+
+def create_correlation_tracker():
+    """
+    Returns a new OpenCV correlation tracker, or None if this OpenCV build has none.
+    MOSSE lives in cv2.legacy on opencv-contrib >= 4.5; KCF is the fallback.
+    """
+    legacy = getattr(cv2, "legacy", None)
+    for factory in (
+        getattr(legacy, "TrackerMOSSE_create", None) if legacy else None,
+        getattr(cv2, "TrackerMOSSE_create", None),
+        getattr(legacy, "TrackerKCF_create", None) if legacy else None,
+        getattr(cv2, "TrackerKCF_create", None),
+    ):
+        if factory is not None:
+            return factory()
+    return None
+
+
+class Track:
+    def __init__(self, track_id: int, box, ts: float):
+        self.id = track_id
+        self.box = box
+        self.created_ts = ts
+        self.last_seen_ts = ts
+        self.misses = 0
+
+        # cached recognition
+        self.result = None          # aggregated (committed) result, or the last raw one
+        self.verified_ts = 0.0
+        self.verified_box = None
+        self.pending_ts = None
+
+        # identity voting: (ts, name or None, conf, cnn, raw result) per recognition
+        self.votes = deque()
+        self.committed = None
+
+        self.corr = None
+
+    @property
+    def accepted(self) -> bool:
+        return bool(self.result and self.result.get("student_num"))
+
+
+class FaceTracker:
+    """
+    Thread-safe: the detect stage calls update()/predict(), embed workers call
+    set_result(), the render stage reads results via get().
+    """
+
+    def __init__(
+        self,
+        iou_thresh: float = 0.30,
+        max_centroid_dist: float = 0.60,
+        max_misses: int = 3,
+        reverify_seconds: float = 10.0,
+        retry_seconds: float = 1.0,
+        reverify_iou: float = 0.50,
+        pending_timeout: float = 3.0,
+        use_correlation: bool = False,
+        vote_window: int = 1,
+        vote_min_agree: int = 1,
+        vote_max_age: float = 30.0,
+        vote_seconds: float = 0.5,
+    ):
+        self.iou_thresh = iou_thresh
+        self.max_centroid_dist = max_centroid_dist
+        self.max_misses = max_misses
+        self.reverify_seconds = reverify_seconds
+        self.retry_seconds = retry_seconds
+        self.reverify_iou = reverify_iou
+        self.pending_timeout = pending_timeout
+        self.vote_window = max(1, vote_window)
+        self.vote_min_agree = max(1, min(vote_min_agree, self.vote_window))
+        self.vote_max_age = vote_max_age
+        self.vote_seconds = vote_seconds      # re-recognition interval while votes are being collected
+        self.use_correlation = use_correlation and (create_correlation_tracker() is not None)
+        if use_correlation and not self.use_correlation:
+            print("[TRACK] No OpenCV correlation tracker available, holding boxes between detections")
+
+        self._tracks = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+        # counters: faces seen across frames vs recognitions actually requested
+        self.faces_seen = 0
+        self.recognitions = 0
+        self.commits = 0
+
+    # ----------------------------
+    # detection / prediction
+    # ----------------------------
+    def update(self, boxes, frame=None, ts: float = None):
+        """
+        Associate this frame's detections with existing tracks.
+        Returns the list of live tracks.
+        """
+        ts = ts or time.time()
+        with self._lock:
+            tracks = list(self._tracks.values())
+
+            # greedy IoU matching, best pairs first
+            pairs = []
+            for ti, t in enumerate(tracks):
+                for di, b in enumerate(boxes):
+                    score = iou(t.box, b)
+                    if score >= self.iou_thresh:
+                        pairs.append((score, ti, di))
+            pairs.sort(reverse=True)
+
+            matched_t, matched_d = set(), set()
+            for _, ti, di in pairs:
+                if ti in matched_t or di in matched_d:
+                    continue
+                matched_t.add(ti)
+                matched_d.add(di)
+                self._assign(tracks[ti], boxes[di], frame, ts)
+
+            # centroid fallback for fast movers that lost IoU overlap
+            for ti, t in enumerate(tracks):
+                if ti in matched_t:
+                    continue
+                best_di, best_dist = None, self.max_centroid_dist
+                for di, b in enumerate(boxes):
+                    if di in matched_d:
+                        continue
+                    dist = centroid_distance(t.box, b)
+                    if dist < best_dist:
+                        best_di, best_dist = di, dist
+                if best_di is not None:
+                    matched_t.add(ti)
+                    matched_d.add(best_di)
+                    self._assign(t, boxes[best_di], frame, ts)
+
+            # unmatched tracks age out
+            for ti, t in enumerate(tracks):
+                if ti not in matched_t:
+                    t.misses += 1
+                    if t.misses > self.max_misses:
+                        del self._tracks[t.id]
+
+            # unmatched detections start new tracks
+            for di, b in enumerate(boxes):
+                if di in matched_d:
+                    continue
+                t = Track(self._next_id, b, ts)
+                self._next_id += 1
+                self._tracks[t.id] = t
+                self._assign(t, b, frame, ts)
+
+            live = list(self._tracks.values())
+            self.faces_seen += len(live)
+            return live
+
+    def _assign(self, t: Track, box, frame, ts):
+        t.box = box
+        t.last_seen_ts = ts
+        t.misses = 0
+        if self.use_correlation and frame is not None:
+            x1, y1, x2, y2 = box
+            t.corr = create_correlation_tracker()
+            try:
+                t.corr.init(frame, (int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+            except Exception:
+                t.corr = None
+
+    def predict(self, frame=None, ts: float = None):
+        """
+        Between detections: move boxes with the correlation tracker if enabled,
+        otherwise keep the last detected box. Returns the list of live tracks.
+        """
+        ts = ts or time.time()
+        with self._lock:
+            for t in list(self._tracks.values()):
+                if t.corr is None or frame is None:
+                    continue
+                ok, (x, y, w, h) = t.corr.update(frame)
+                if ok and w > 0 and h > 0:
+                    t.box = (int(x), int(y), int(x + w), int(y + h))
+                    t.last_seen_ts = ts
+                else:
+                    t.corr = None
+            live = list(self._tracks.values())
+            self.faces_seen += len(live)
+            return live
+
+    # ----------------------------
+    # recognition cache
+    # ----------------------------
+    def needs_recognition(self, t: Track, ts: float = None) -> bool:
+        ts = ts or time.time()
+        with self._lock:
+            if t.pending_ts is not None and ts - t.pending_ts < self.pending_timeout:
+                return False
+            if t.result is None:
+                return True
+            if t.accepted:
+                interval = self.reverify_seconds
+            elif any(v[1] for v in t.votes):
+                interval = self.vote_seconds
+            else:
+                interval = self.retry_seconds
+            if ts - t.verified_ts >= interval:
+                return True
+            if t.verified_box is not None and iou(t.box, t.verified_box) < self.reverify_iou:
+                return True
+            return False
+
+    def mark_pending(self, t: Track, ts: float = None):
+        with self._lock:
+            t.pending_ts = ts or time.time()
+            self.recognitions += 1
+
+    def clear_pending(self, track_id: int):
+        """
+        Recognition of a pending track failed: it may be scheduled again right away.
+        """
+        with self._lock:
+            t = self._tracks.get(track_id)
+            if t is not None:
+                t.pending_ts = None
+
+    def set_result(self, track_id: int, result: dict, box, ts: float = None):
+        with self._lock:
+            t = self._tracks.get(track_id)
+            if t is None:
+                return
+            ts = ts or time.time()
+            t.verified_ts = ts
+            t.verified_box = box
+            t.pending_ts = None
+
+            name = result.get("name") if result.get("student_num") else None
+            t.votes.append((ts, name, result.get("conf"), result.get("cnn"), result))
+            while len(t.votes) > self.vote_window or (t.votes and ts - t.votes[0][0] > self.vote_max_age):
+                t.votes.popleft()
+            t.result = self._aggregate(t, result)
+
+    def _aggregate(self, t: Track, raw: dict) -> dict:
+        """
+        k-of-n vote over the track's recent recognitions. The winning identity is
+        committed once it has vote_min_agree votes and kept until another one
+        gets there (or its own votes age out).
+        """
+        by_name = {}
+        for v in t.votes:
+            if v[1]:
+                by_name.setdefault(v[1], []).append(v)
+
+        leader = max(by_name, key=lambda n: (len(by_name[n]), self._log_conf(by_name[n])), default=None)
+        if leader is not None and len(by_name[leader]) >= self.vote_min_agree:
+            if leader != t.committed:
+                self.commits += 1
+            t.committed = leader
+        elif t.committed not in by_name:
+            t.committed = None
+
+        if t.committed is None:
+            if leader is None:
+                return raw
+            # accepted, but not enough agreeing votes yet: shown, not reported
+            return dict(raw, student_num=None, color=(0, 255, 255),
+                        text=f"Verifying {leader} ({len(by_name[leader])}/{self.vote_min_agree})")
+
+        agree = by_name[t.committed]
+        conf = math.exp(self._log_conf(agree))
+        cnns = [v[3] for v in agree if v[3] is not None]
+        cnn = sum(cnns) / len(cnns) if cnns else None
+        label = f"{t.committed} ({conf*100:.1f}%)"
+        if cnn is not None:
+            label += f" cnn={cnn:.2f}"
+        if len(agree) > 1:
+            label += f" x{len(agree)}"
+        return dict(agree[-1][4], conf=conf, cnn=cnn, votes=len(agree), color=(0, 255, 0), text=label)
+
+    @staticmethod
+    def _log_conf(votes) -> float:
+        return sum(math.log(max(1e-6, float(v[2] or 0.0))) for v in votes) / len(votes)
+
+    def get(self, track_id: int):
+        with self._lock:
+            return self._tracks.get(track_id)
+
+    def tracks(self):
+        with self._lock:
+            return list(self._tracks.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tracks)
+
+    def savings(self) -> float:
+        """
+        Fraction of per-frame faces that did not need a fresh recognition.
+        """
+        if self.faces_seen <= 0:
+            return 0.0
+        return 1.0 - (self.recognitions / float(self.faces_seen))
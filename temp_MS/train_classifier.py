@@ -1,22 +1,22 @@
 # train_classifier.py
-import pickle
 import numpy as np
 from sklearn.svm import SVC
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score
 from sklearn.model_selection import train_test_split
 
-EMB_FILE = "encodings.pkl"
+from embedding_store import EMBEDDING_STORE_DIR, load_embeddings
+from model_artifacts import atomic_pickle_dump, write_manifest
+
 CLS_FILE = "classifier.pkl"
 LBL_FILE = "labels.pkl"
 
 def main():
     print("Loading embeddings...")
-    with open(EMB_FILE, "rb") as f:
-        data = pickle.load(f)
+    store = load_embeddings(EMBEDDING_STORE_DIR)
 
-    names = np.array(data["names"])
-    embeddings = np.array(data["embeddings"])
+    names = store.names
+    embeddings = store.embeddings   # memory-mapped; train_test_split copies only the rows it picks
 
     print("Total embeddings:", len(embeddings))
     print("Unique students:", len(set(names)))
@@ -39,14 +39,14 @@ def main():
     print("Classifier Accuracy:", acc)
 
     print("💾 Saving classifier...")
-    with open(CLS_FILE, "wb") as f:
-        pickle.dump(clf, f)
-
-    with open(LBL_FILE, "wb") as f:
-        pickle.dump(encoder, f)
+    # atomic writes + version bump last: running recognisers hot-reload on the new version
+    atomic_pickle_dump(clf, CLS_FILE)
+    atomic_pickle_dump(encoder, LBL_FILE)
+    manifest = write_manifest("svc", [CLS_FILE, LBL_FILE], students=int(len(encoder.classes_)),
+                              accuracy=round(float(acc), 4), embedder=store.embedder)
 
     print("🎉 Training complete!")
-    print("Saved:", CLS_FILE, "and", LBL_FILE)
+    print("Saved:", CLS_FILE, "and", LBL_FILE, f"(model version {manifest['version']})")
 
 if __name__ == "__main__":
     main()
@@ -1,91 +1,109 @@
 # train_embeddings.py (dlib aligned face chips)
+# Incremental: embeddings are cached per image in EMBEDDING_CACHE_FILE
+# (embedding_cache.py) with the file's mtime + size, so only new or changed
+# images are embedded and deleted ones drop out. REBUILD_CACHE = True re-embeds all.
+# Detection + embedding run on a process pool (train_pool.py), one worker per core.
+#
+# Usage: python train_embeddings1.1.py [--workers N]
+import argparse
 import os
-import pickle
+import time
 import numpy as np
-import cv2
-import dlib
 
-DATASET_DIR = "dataset"
-EMBEDDINGS_FILE = "encodings.pkl"
+from embedding_cache import EmbeddingCache, local_version
+from embedding_store import EMBEDDING_STORE_DIR, save_embeddings
+from train_pool import STATUS_NO_FACE, STATUS_OK, STATUS_UNREADABLE, TrainEmbedPool
 
-SHAPE_PREDICTOR_PATH = "shape_predictor_5_face_landmarks.dat"
-DLIB_REC_MODEL_PATH = "dlib_face_recognition_resnet_model_v1.dat"
+DATASET_DIR = "dataset"
+EMBEDDINGS_DIR = EMBEDDING_STORE_DIR     # embedding_store.py (replaces encodings.pkl)
+EMBEDDING_CACHE_FILE = "embedding_cache.npz"
+REBUILD_CACHE = False
 
-# Chip settings
-CHIP_SIZE = 150          # 150 is common for dlib face embeddings
-PADDING = 0.25           # more padding helps with glasses / hairline
+# Chip size / padding come from the embedding backend (embedding.py, env EMBED_BACKEND),
+# the same ones recognition.py uses live
+JITTERS = 1              # dlib only: 1 is faster; 2-3 slightly better but slower embeddings
+WORKERS = os.cpu_count() or 1
+PROGRESS_EVERY = 50
 
 def iter_images(folder):
-    for img_name in os.listdir(folder):
+    for img_name in sorted(os.listdir(folder)):
         if img_name.lower().endswith((".jpg", ".jpeg", ".png")):
             yield img_name, os.path.join(folder, img_name)
 
-def largest_face(rects):
-    return max(rects, key=lambda r: (r.right() - r.left()) * (r.bottom() - r.top()))
-
 def main():
-    print("Loading dlib models...")
-    detector = dlib.get_frontal_face_detector()
-    sp = dlib.shape_predictor(SHAPE_PREDICTOR_PATH)
-    facerec = dlib.face_recognition_model_v1(DLIB_REC_MODEL_PATH)
-
-    names = []
-    embeddings = []
+    p = argparse.ArgumentParser(description="Train face embeddings from dataset/")
+    p.add_argument("--workers", type=int, default=WORKERS, help="embedding processes (1 = no pool)")
+    args = p.parse_args()
 
     if not os.path.isdir(DATASET_DIR):
         print(f"❌ DATASET_DIR not found: {DATASET_DIR}")
         return
 
+    print(f"Loading dlib models ({args.workers} worker{'s' if args.workers != 1 else ''})...")
+    pool = TrainEmbedPool(args.workers, jitters=JITTERS)
+    signature = pool.signature
+    print(f"Embedding backend: {signature}")
+
+    # jitters change the dlib descriptors, so they are part of the cache key
+    cache = EmbeddingCache.load(EMBEDDING_CACHE_FILE, f"{signature}:jitters={JITTERS}",
+                                rebuild=REBUILD_CACHE)
+
+    items = []   # (student, img_name, key, version) in dataset order
     for student_folder in sorted(os.listdir(DATASET_DIR)):
         folder_path = os.path.join(DATASET_DIR, student_folder)
         if not os.path.isdir(folder_path):
             continue
-
-        print(f"\n== Student: {student_folder} ==")
-
         for img_name, img_path in iter_images(folder_path):
-            bgr = cv2.imread(img_path)
-            if bgr is None:
-                print(f"⚠️ Skipped unreadable: {img_path}")
-                continue
-
-            rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-
-            # Detect faces (dlib works best on RGB)
-            rects = detector(rgb, 1)
-            if len(rects) == 0:
-                print(f"⚠️ No face: {student_folder}/{img_name}")
-                continue
-
-            # Use largest face if multiple detected
-            rect = largest_face(rects)
-
-            # Align to chip
-            shape = sp(rgb, rect)
-            try:
-                chip = dlib.get_face_chip(rgb, shape, size=CHIP_SIZE, padding=PADDING)
-            except Exception as e:
-                print(f"⚠️ Chip failed: {student_folder}/{img_name} ({e})")
-                continue
-
-            # Compute embedding
-            # jitter=1 is faster; increase to 2–3 if you want slightly better but slower embeddings
-            emb = np.array(facerec.compute_face_descriptor(chip, num_jitters=1), dtype=np.float32)
+            items.append((student_folder, img_name, f"{student_folder}/{img_name}", local_version(img_path)))
+
+    todo = {key for key, _ in cache.stale((key, version) for _, _, key, version in items)}
+    print(f"Images: {len(items)} | cached: {len(items) - len(todo)} | to embed: {len(todo)}")
+
+    versions = {key: version for _, _, key, version in items}
+    jobs = [(key, os.path.join(DATASET_DIR, student_folder, img_name))
+            for student_folder, img_name, key, _ in items if key in todo]
+
+    t0 = time.perf_counter()
+    with pool:
+        # results come back in dataset order
+        for n, (key, emb, status) in enumerate(pool.map_paths(jobs), 1):
+            if status == STATUS_OK:
+                cache.put(key, versions[key], emb)
+                print(f"✅ Encoded: {key}")
+            elif status == STATUS_NO_FACE:
+                cache.put(key, versions[key], None)
+                print(f"⚠️ No face: {key}")
+            elif status == STATUS_UNREADABLE:
+                print(f"⚠️ Skipped unreadable: {key}")
+            else:
+                print(f"⚠️ Chip failed: {key} ({status})")
+
+            if n % PROGRESS_EVERY == 0 or n == len(jobs):
+                elapsed = time.perf_counter() - t0
+                print(f"[PROGRESS] {n}/{len(jobs)} | {n / max(elapsed, 1e-6):.1f} img/s")
+
+    removed = cache.prune(key for _, _, key, _ in items)
+    cache.save()
+    print(f"\nCache: {len(cache)} images, {cache.added} new/changed, {removed} removed")
 
+    names = []
+    embeddings = []
+    paths = []
+    for student_folder, _, key, version in items:
+        hit, emb = cache.get(key, version)
+        if hit and emb is not None:
             embeddings.append(emb)
             names.append(student_folder)
-
-            print(f"✅ Encoded: {student_folder}/{img_name}")
+            paths.append(key)
 
     if len(embeddings) == 0:
         print("\n❌ No embeddings created. Check your dataset images.")
         return
 
-    data = {"names": names, "embeddings": np.vstack(embeddings)}
-    with open(EMBEDDINGS_FILE, "wb") as f:
-        pickle.dump(data, f)
+    save_embeddings(np.vstack(embeddings), names, signature, EMBEDDINGS_DIR,
+                    source=["local_dataset"] * len(names), path=paths)
 
-    print(f"\n🎉 Saved {len(embeddings)} embeddings to {EMBEDDINGS_FILE}")
+    print(f"\n🎉 Saved {len(embeddings)} embeddings to {EMBEDDINGS_DIR}/")
 
 if __name__ == "__main__":
     main()
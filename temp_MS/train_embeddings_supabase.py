@@ -3,18 +3,41 @@
 # - Trains from bucket folder:  dataset/<person_folder>/*.jpg
 # - Optionally also trains from DB table: studentangles (imagepath)
 # - Optionally ALSO trains from top-level user folders: <user_folder>/**/*.jpg   (excluding dataset/)
-# Output: encodings.pkl  (same format as your existing classifier script)
-
+# Output: embedding store in embeddings/ (embedding_store.py): float32 matrix,
+#         label indices, label table and per-row source / path / angle
+#
+# Pipeline: signed URLs are created in batches (one API call per SIGN_BATCH
+# paths), images are downloaded + decoded by DOWNLOAD_WORKERS threads over one
+# keep-alive session, and decoded images stream into the embedding stage
+# (this thread) as they arrive. Rows are written in training-item order.
+#
+# Incremental: every image's embedding is kept in EMBEDDING_CACHE_FILE
+# (embedding_cache.py) with the object version it came from (etag /
+# updated_at from the storage listing). A run lists the bucket, downloads and
+# embeds only new or changed objects, drops deleted ones, and rebuilds
+# the embedding store from the cache. REBUILD_EMBEDDING_CACHE=1 re-embeds everything.
+#
+# Decoding, detection and embedding run on TRAIN_WORKERS processes
+# (train_pool.py); downloaded bytes are handed to them as they arrive.
+#
+# Usage: python train_embeddings_supabase.py [--workers N]
+
+import argparse
 import os
-import pickle
+import queue
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import numpy as np
-import cv2
-import dlib
 import requests
+from requests.adapters import HTTPAdapter
 
 from supabase import create_client, Client
 
+from embedding_cache import EmbeddingCache
+from embedding_store import EMBEDDING_STORE_DIR, save_embeddings
+from train_pool import STATUS_NO_FACE, STATUS_OK, STATUS_UNREADABLE, TrainEmbedPool
+
 # ✅ Load .env automatically if python-dotenv is installed
 try:
     from dotenv import load_dotenv
@@ -40,22 +63,27 @@ DATASET_PREFIX = (os.getenv("DATASET_PREFIX") or "dataset").strip().strip("/")
 # ----------------------------
 # OUTPUT FILE
 # ----------------------------
-EMBEDDINGS_FILE = "encodings.pkl"
+EMBEDDINGS_DIR = EMBEDDING_STORE_DIR
+EMBEDDING_CACHE_FILE = (os.getenv("EMBEDDING_CACHE_FILE") or "embedding_cache_supabase.npz").strip()
+REBUILD_EMBEDDING_CACHE = os.getenv("REBUILD_EMBEDDING_CACHE", "0").strip() == "1"
+CACHE_SAVE_EVERY = 500           # new embeddings between cache checkpoints (keeps progress if a run dies)
 
 # ----------------------------
 # DLIB MODELS (must exist in same folder or give full path)
 # ----------------------------
-SHAPE_PREDICTOR_PATH = "shape_predictor_5_face_landmarks.dat"
-DLIB_REC_MODEL_PATH = "dlib_face_recognition_resnet_model_v1.dat"
-
-CHIP_SIZE = 150
-PADDING = 0.25
+# Shape predictor: train_pool.py. Embedding model + chip size / padding:
+# embedding.py (env EMBED_BACKEND), shared with recognition.py
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", str(os.cpu_count() or 1)))   # embedding processes
 
 # ----------------------------
 # DOWNLOAD SETTINGS
 # ----------------------------
 TIMEOUT_SECONDS = 15
 MAX_RETRIES = 3
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "16"))   # concurrent downloads
+SIGN_BATCH = 100                 # paths per create_signed_urls call
+PREFETCH = DOWNLOAD_WORKERS * 4  # downloaded images allowed to wait for the embedding stage
+PROGRESS_EVERY = 50
 
 # Acceptable image extensions
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
@@ -96,11 +124,47 @@ def signed_url(sb: Client, path: str, expires_in: int = 3600) -> str:
     return url
 
 
-def download_image_bytes(url: str) -> bytes:
+def signed_urls(sb: Client, paths, expires_in: int = 3600) -> dict:
+    """
+    Signs many paths with one create_signed_urls call. Returns {path: url};
+    paths the batch call couldn't sign fall back to signed_url() one by one.
+    """
+    urls = {}
+    try:
+        res = sb.storage.from_(SUPABASE_BUCKET).create_signed_urls(list(paths), expires_in)
+    except Exception as e:
+        print(f"[WARN] Batch signing failed ({e}), signing one by one")
+        res = []
+
+    for entry in res or []:
+        if not isinstance(entry, dict) or entry.get("error"):
+            continue
+        url = entry.get("signedURL") or entry.get("signedUrl") or entry.get("signed_url")
+        if url and entry.get("path"):
+            urls[entry["path"]] = SUPABASE_URL.rstrip("/") + url if url.startswith("/") else url
+
+    for path in paths:
+        if path not in urls:
+            urls[path] = signed_url(sb, path, expires_in)
+    return urls
+
+
+def http_session() -> requests.Session:
+    """
+    One keep-alive connection pool shared by all download threads.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def download_image_bytes(url: str, session: requests.Session = None) -> bytes:
     last_err = None
     for _ in range(MAX_RETRIES):
         try:
-            r = requests.get(url, timeout=TIMEOUT_SECONDS)
+            r = (session or requests).get(url, timeout=TIMEOUT_SECONDS)
             r.raise_for_status()
             return r.content
         except Exception as e:
@@ -109,11 +173,6 @@ def download_image_bytes(url: str) -> bytes:
     raise RuntimeError(f"Failed to download image after retries: {last_err}")
 
 
-def bytes_to_bgr(img_bytes: bytes):
-    arr = np.frombuffer(img_bytes, dtype=np.uint8)
-    return cv2.imdecode(arr, cv2.IMREAD_COLOR)
-
-
 def is_image_name(name: str) -> bool:
     low = name.lower()
     for ext in IMAGE_EXTS:
@@ -122,10 +181,21 @@ def is_image_name(name: str) -> bool:
     return False
 
 
-def list_all_files_recursive(sb: Client, prefix: str):
+def object_version(it: dict) -> str:
+    """
+    Version of a storage object from its list() entry: etag (changes with the
+    content) + size, or updated_at when there is no etag.
+    """
+    meta = it.get("metadata") or {}
+    tag = meta.get("eTag") or meta.get("etag") or it.get("updated_at") or meta.get("lastModified") or ""
+    return f"{str(tag).strip(chr(34))}:{meta.get('size', '')}"
+
+
+def list_all_files_recursive(sb: Client, prefix: str, versions: dict = None):
     """
     Recursively list all files under a prefix in Supabase Storage.
     Returns list of full paths like: dataset/903277_Marcus/img_0001.jpg
+    versions (optional dict) is filled with {path: object_version}.
     """
     out = []
 
@@ -158,7 +228,10 @@ def list_all_files_recursive(sb: Client, prefix: str):
                     walk(f"{folder}/{name}".strip("/"))
                 else:
                     if is_image_name(name):
-                        out.append(f"{folder}/{name}".strip("/"))
+                        path = f"{folder}/{name}".strip("/")
+                        out.append(path)
+                        if versions is not None:
+                            versions[path] = object_version(it)
 
             offset += limit
 
@@ -213,19 +286,20 @@ def label_from_user_folder_path(path: str) -> str:
 
 def collect_training_items(sb: Client):
     """
-    Returns list of (label, imagepath, source)
+    Returns list of (label, imagepath, source, version, angle)
     """
     items = []
+    versions = {}   # storage path -> object version, from the listings
 
     # A) Train from storage dataset folder
     if TRAIN_FROM_DATASET_FOLDER:
         print(f"Listing storage files under: {DATASET_PREFIX}/ ...")
-        dataset_files = list_all_files_recursive(sb, DATASET_PREFIX)
+        dataset_files = list_all_files_recursive(sb, DATASET_PREFIX, versions)
         print(f"Found {len(dataset_files)} image files in {DATASET_PREFIX}/")
 
         for p in dataset_files:
             label = label_from_dataset_path(p)
-            items.append((label, p, "storage_dataset"))
+            items.append((label, p, "storage_dataset", versions[p], ""))
 
     # ✅ C) Train from top-level user folders (excluding dataset/)
     if TRAIN_FROM_USER_FOLDERS:
@@ -238,11 +312,11 @@ def collect_training_items(sb: Client):
 
         for folder in user_folders:
             try:
-                user_files = list_all_files_recursive(sb, folder)
+                user_files = list_all_files_recursive(sb, folder, versions)
                 total_user_images += len(user_files)
                 for p in user_files:
                     label = label_from_user_folder_path(p)
-                    items.append((label, p, "storage_userfolder"))
+                    items.append((label, p, "storage_userfolder", versions[p], ""))
             except Exception as e:
                 print(f"[WARN] Failed to scan folder '{folder}': {e}")
 
@@ -277,7 +351,9 @@ def collect_training_items(sb: Client):
             path = r.get("imagepath")
             if not sid or not path:
                 continue
-            items.append((str(sid), path, "studentangles"))
+            # not in a listed folder: the row's updatedat stands in for the object version
+            version = versions.get(path) or f"row:{r.get('updatedat') or ''}"
+            items.append((str(sid), path, "studentangles", version, r.get("photoangle") or ""))
             usable += 1
 
         print(f"Found {usable} rows in studentangles with imagepath.")
@@ -285,74 +361,219 @@ def collect_training_items(sb: Client):
     return items
 
 
+class TrainStats:
+    """
+    Thread-safe counters for the download / embedding pipeline.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.start_ts = time.time()
+        self._lock = threading.Lock()
+        self.counts = {"signed": 0, "sign_failed": 0, "downloaded": 0, "download_failed": 0,
+                       "decode_failed": 0, "no_face": 0, "embed_failed": 0, "embedded": 0}
+        self.bytes = 0
+
+    def add(self, key: str, n: int = 1):
+        with self._lock:
+            self.counts[key] += n
+
+    def add_bytes(self, n: int):
+        with self._lock:
+            self.bytes += n
+
+    @property
+    def failed(self) -> int:
+        c = self.counts
+        return c["sign_failed"] + c["download_failed"] + c["decode_failed"] + c["no_face"] + c["embed_failed"]
+
+    def line(self) -> str:
+        elapsed = max(1e-6, time.time() - self.start_ts)
+        c = self.counts
+        done = c["embedded"] + self.failed
+        return (f"{done}/{self.total} done | {done / elapsed:.1f} img/s | "
+                f"download {c['downloaded']} ({self.bytes / elapsed / 1e6:.2f} MB/s) | "
+                f"embedded {c['embedded']} | failed: sign={c['sign_failed']} download={c['download_failed']} "
+                f"decode={c['decode_failed']} no_face={c['no_face']} embed={c['embed_failed']}")
+
+
+def fetch_images(sb: Client, paths, out_q: queue.Queue, stats: TrainStats, stop_event: threading.Event):
+    """
+    Producer: signs paths in SIGN_BATCH batches and downloads them on
+    DOWNLOAD_WORKERS threads. Puts (index into paths, image bytes or None, error)
+    on out_q, then None.
+    At most PREFETCH images are in flight, so signing never runs far ahead of
+    the embedding stage (signed URLs expire).
+    """
+    session = http_session()
+    slots = threading.BoundedSemaphore(PREFETCH)
+
+    def fetch(idx, url):
+        try:
+            img_bytes = download_image_bytes(url, session)
+            stats.add("downloaded")
+            stats.add_bytes(len(img_bytes))
+        except Exception as e:
+            stats.add("download_failed")
+            out_q.put((idx, None, f"download: {e}"))
+            return
+        out_q.put((idx, img_bytes, None))
+
+    try:
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download") as pool:
+            for start in range(0, len(paths), SIGN_BATCH):
+                if stop_event.is_set():
+                    break
+                batch = list(enumerate(paths[start:start + SIGN_BATCH], start))
+                try:
+                    urls = signed_urls(sb, [path for _, path in batch], expires_in=3600)
+                except Exception as e:
+                    urls = {}
+                    print(f"[WARN] Signing failed for items {start}-{start + len(batch) - 1}: {e}")
+
+                for idx, path in batch:
+                    url = urls.get(path)
+                    if not url:
+                        stats.add("sign_failed")
+                        out_q.put((idx, None, "no signed url"))
+                        continue
+                    stats.add("signed")
+                    slots.acquire()
+                    fut = pool.submit(fetch, idx, url)
+                    fut.add_done_callback(lambda _: slots.release())
+    finally:
+        out_q.put(None)
+
+
 def main():
+    p = argparse.ArgumentParser(description="Train face embeddings from Supabase Storage")
+    p.add_argument("--workers", type=int, default=TRAIN_WORKERS, help="embedding processes (1 = no pool)")
+    args = p.parse_args()
+
     require_env()
 
     print("Connecting to Supabase...")
     sb = supabase_client()
 
-    print("Loading dlib models...")
-    detector = dlib.get_frontal_face_detector()
-    sp = dlib.shape_predictor(SHAPE_PREDICTOR_PATH)
-    facerec = dlib.face_recognition_model_v1(DLIB_REC_MODEL_PATH)
-
     training_items = collect_training_items(sb)
 
     if not training_items:
         print("No training images found. Nothing to train.")
         return
 
-    print(f"\nTotal images to process: {len(training_items)}")
-
-    names = []
-    embeddings = []
-    failed = 0
-    processed = 0
-
-    for label, path, source in training_items:
+    print(f"Loading dlib models ({args.workers} worker{'s' if args.workers != 1 else ''})...")
+    pool = TrainEmbedPool(args.workers)
+    signature = pool.signature
+    print(f"Embedding backend: {signature}")
+
+    cache = EmbeddingCache.load(EMBEDDING_CACHE_FILE, signature, rebuild=REBUILD_EMBEDDING_CACHE)
+    todo = cache.stale((item[1], item[3]) for item in training_items)
+    first_item = {}
+    for item in training_items:
+        first_item.setdefault(item[1], item)
+
+    print(f"\nTraining images: {len(training_items)} | cached: {len(training_items) - len(todo)} | "
+          f"to embed: {len(todo)} ({DOWNLOAD_WORKERS} download threads, {SIGN_BATCH} URLs per signing call)")
+
+    stats = TrainStats(len(todo))
+    seen = saved_at = 0
+
+    def finish(idx, emb, status):
+        nonlocal seen, saved_at
+        path, version = todo[idx]
+        label, _, source, _, _ = first_item[path]
+
+        error = None
+        if status == STATUS_OK:
+            cache.put(path, version, emb)
+            stats.add("embedded")
+        elif status == STATUS_NO_FACE:
+            cache.put(path, version, None)   # don't fetch again until it changes
+            stats.add("no_face")
+            error = "No face detected"
+        elif status == STATUS_UNREADABLE:
+            stats.add("decode_failed")
+            error = "cv2 failed to decode image"
+        else:
+            stats.add("embed_failed")
+            error = status
+        if error:
+            print(f"[SKIP] label={label} source={source} path={path} -> {error}")
+
+        seen += 1
+        if seen % PROGRESS_EVERY == 0:
+            print(f"[PROGRESS] {stats.line()}")
+        if cache.added - saved_at >= CACHE_SAVE_EVERY:
+            cache.save()
+            saved_at = cache.added
+
+    def drain(pending, block_until: int):
+        # completion order; the cache puts rows back in training-item order
+        while len(pending) > block_until:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pending.discard(fut)
+                finish(*fut.result())
+
+    if todo:
+        image_q = queue.Queue(maxsize=PREFETCH)
+        stop_event = threading.Event()
+        producer = threading.Thread(target=fetch_images,
+                                    args=(sb, [path for path, _ in todo], image_q, stats, stop_event),
+                                    name="fetch", daemon=True)
+        producer.start()
+
+        pending = set()
+        max_pending = pool.workers * 2
         try:
-            url = signed_url(sb, path, expires_in=3600)
-            img_bytes = download_image_bytes(url)
-            img = bytes_to_bgr(img_bytes)
-            if img is None:
-                raise RuntimeError("cv2 failed to decode image")
-
-            rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-            dets = detector(rgb, 1)
-            if len(dets) == 0:
-                raise RuntimeError("No face detected")
-
-            det = max(dets, key=lambda d: d.width() * d.height())
-            shape = sp(rgb, det)
-
-            chip = dlib.get_face_chip(rgb, shape, size=CHIP_SIZE, padding=PADDING)
-
-            face_descriptor = facerec.compute_face_descriptor(chip)
-            emb = np.array(face_descriptor, dtype=np.float32)
-
+            with pool:
+                while True:
+                    item = image_q.get()
+                    if item is None:
+                        break
+                    idx, img_bytes, error = item
+                    if img_bytes is None:
+                        path = todo[idx][0]
+                        label, _, source, _, _ = first_item[path]
+                        print(f"[SKIP] label={label} source={source} path={path} -> {error}")
+                        seen += 1
+                        continue
+                    pending.add(pool.submit_bytes(idx, img_bytes))
+                    drain(pending, max_pending - 1)
+                drain(pending, 0)
+        except KeyboardInterrupt:
+            print("\nStopping (keeping what was embedded so far)...")
+            stop_event.set()
+    else:
+        pool.close()
+
+    removed = cache.prune(item[1] for item in training_items)
+    cache.save()
+
+    # training-item order, same as the full (non-incremental) run
+    embeddings, names, rows = [], [], {"source": [], "path": [], "angle": []}
+    for label, path, source, version, angle in training_items:
+        hit, emb = cache.get(path, version)
+        if hit and emb is not None:
             embeddings.append(emb)
             names.append(label)
-            processed += 1
-
-            if processed % 50 == 0:
-                print(f"Processed {processed}/{len(training_items)} ...")
-
-        except Exception as e:
-            failed += 1
-            print(f"[SKIP] label={label} source={source} path={path} -> {e}")
+            rows["source"].append(source)
+            rows["path"].append(path)
+            rows["angle"].append(angle)
 
     if not embeddings:
         print("No embeddings produced (all failed).")
         return
 
-    data = {"embeddings": embeddings, "names": names}
-    with open(EMBEDDINGS_FILE, "wb") as f:
-        pickle.dump(data, f)
+    store = save_embeddings(np.vstack(embeddings), names, signature, EMBEDDINGS_DIR, **rows)
 
     print("\n✅ Done.")
-    print(f"Saved embeddings: {EMBEDDINGS_FILE}")
-    print(f"Total ok: {processed}, failed: {failed}")
+    print(f"Saved embeddings: {EMBEDDINGS_DIR}/ ({len(store)} rows x {store.dim} dims, {len(store.labels)} labels)")
+    print(f"Cache: {EMBEDDING_CACHE_FILE} | {len(cache)} images | "
+          f"new/changed {stats.counts['embedded'] + stats.counts['no_face']} | removed {removed}")
+    print(f"This run ok: {stats.counts['embedded']}, failed: {stats.failed}")
+    if todo:
+        print(f"[STATS] {stats.line()}")
 
 
 if __name__ == "__main__":
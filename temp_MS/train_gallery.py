@@ -0,0 +1,78 @@
+# train_gallery.py
+# Builds gallery.npz (cosine-similarity matcher) from the embedding store (embedding_store.py).
+# The open-set threshold is calibrated on a held-out split, then the final
+# gallery is rebuilt from all embeddings with that threshold.
+import os
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+from embedding_store import EMBEDDING_STORE_DIR, load_embeddings
+from gallery import GalleryMatcher, GALLERY_FILE
+from model_artifacts import write_manifest
+
+GALLERY_MODE = "centroid"   # "centroid" (one row per student) or "all" (every embedding)
+TARGET_FAR = 0.01           # accept at most 1% of faces as the wrong student
+MARGIN = 0.0                # optional top1 - top2 similarity margin
+
+# Publish the gallery to the Supabase bucket so the backend can serve per-room
+# roster galleries (/attendance/roster-gallery). Needs SUPABASE_URL/SPBASE_URL + SPBASE_SKEY.
+UPLOAD_TO_STORAGE = os.getenv("GALLERY_UPLOAD", "0").strip() == "1"
+STORAGE_PATH = os.getenv("FACE_GALLERY_STORAGE_PATH", "models/gallery.npz")
+
+
+def upload_gallery(path: str):
+    from supabase import create_client
+
+    url = (os.getenv("SUPABASE_URL") or os.getenv("SPBASE_URL") or "").strip()
+    key = (os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SPBASE_SKEY") or "").strip()
+    bucket = (os.getenv("SUPABASE_BUCKET") or "student-faces").strip()
+    if not url or not key:
+        print("Skipping upload: SUPABASE_URL / SPBASE_SKEY not set")
+        return
+    with open(path, "rb") as f:
+        create_client(url, key).storage.from_(bucket).upload(
+            STORAGE_PATH, f.read(),
+            file_options={"content-type": "application/octet-stream", "upsert": "true"},
+        )
+    print(f"Uploaded {path} -> {bucket}/{STORAGE_PATH}")
+
+def main():
+    print("Loading embeddings...")
+    store = load_embeddings(EMBEDDING_STORE_DIR)
+
+    names = store.names
+    embeddings = store.embeddings   # memory-mapped float32
+
+    print("Total embeddings:", len(embeddings))
+    print("Unique students:", len(set(names)))
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        embeddings, names, test_size=0.2, stratify=names, random_state=42
+    )
+
+    print(f"Calibrating open-set threshold (mode={GALLERY_MODE}, target FAR={TARGET_FAR})...")
+    held_out = GalleryMatcher.build(X_train, y_train, mode=GALLERY_MODE, margin=MARGIN)
+    report = held_out.calibrate(X_test, y_test, target_far=TARGET_FAR)
+    print(f"Threshold: {report['threshold']:.4f}  FAR: {report['far']:.4f}  TAR: {report['tar']:.4f}")
+
+    pred_names, _, _ = held_out.predict(X_test)
+    print("Closed-set accuracy:", float(np.mean(pred_names == y_test)))
+
+    print("Building final gallery from all embeddings...")
+    gallery = GalleryMatcher.build(
+        embeddings, names, mode=GALLERY_MODE, threshold=report["threshold"], margin=MARGIN,
+        embedder=store.embedder,
+    )
+    gallery.save(GALLERY_FILE)
+    # version bump last: running recognisers hot-reload on the new version
+    manifest = write_manifest("gallery", [GALLERY_FILE], students=int(len(gallery.label_names)),
+                              threshold=round(float(gallery.threshold), 4), embedder=store.embedder)
+
+    print("Saved:", GALLERY_FILE, f"({gallery.matrix.shape[0]} rows x {gallery.matrix.shape[1]} dims,"
+          f" model version {manifest['version']})")
+
+    if UPLOAD_TO_STORAGE:
+        upload_gallery(GALLERY_FILE)
+
+if __name__ == "__main__":
+    main()
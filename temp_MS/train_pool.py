@@ -0,0 +1,129 @@
+# train_pool.py
+# Parallel detect -> landmarks -> embedding for the training scripts
+# (train_embeddings1.1.py, train_embeddings_supabase.py).
+# HOG detection with upsampling and the dlib ResNet each run on one core and
+# hold the GIL, so training scales with processes, not threads.
+# - Each worker process loads the detector, shape predictor and embedder
+#   (embedding.py) once, in the pool initializer.
+# - map_paths(): local image files, chunked, results in input order.
+# - submit_bytes(): encoded image bytes (streamed downloads); decoding happens
+#   in the worker too, so the parent never touches pixels.
+# Every job returns (tag, embedding or None, status); status is one of
+# STATUS_OK / STATUS_UNREADABLE / STATUS_NO_FACE / "error: ...".
+# workers=1 runs the same code in this process (no pool), the baseline for
+# benchmark_training.py.
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+SHAPE_PREDICTOR_PATH = "shape_predictor_5_face_landmarks.dat"
+
+STATUS_OK = "ok"
+STATUS_UNREADABLE = "unreadable"
+STATUS_NO_FACE = "no_face"
+
+
+# ==============================
+# WORKER PROCESS (or this process when workers=1)
+# ==============================
+_w = {}
+
+def _worker_init(backend, jitters, single_thread):
+    import dlib
+    from embedding import EMBED_BACKEND, make_embedder
+
+    kwargs = {"jitters": jitters}
+    if single_thread and (backend or EMBED_BACKEND).lower() == "onnx":
+        kwargs["threads"] = 1    # one intra-op thread per worker, the pool already fills the cores
+    _w["detector"] = dlib.get_frontal_face_detector()
+    _w["sp"] = dlib.shape_predictor(SHAPE_PREDICTOR_PATH)
+    _w["embedder"] = make_embedder(backend, **kwargs)
+
+
+def _worker_signature():
+    return _w["embedder"].signature
+
+
+def _embed_bgr(bgr):
+    """
+    Largest face of one BGR image -> (embedding, status).
+    """
+    import cv2
+
+    if bgr is None:
+        return None, STATUS_UNREADABLE
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+    dets = _w["detector"](rgb, 1)
+    if len(dets) == 0:
+        return None, STATUS_NO_FACE
+
+    det = max(dets, key=lambda d: d.width() * d.height())
+    try:
+        chip = _w["embedder"].face_chip(rgb, _w["sp"](rgb, det))
+        return _w["embedder"].embed_batch([chip])[0], STATUS_OK
+    except Exception as e:
+        return None, f"error: {e}"
+
+
+def _worker_embed_path(item):
+    import cv2
+
+    tag, path = item
+    emb, status = _embed_bgr(cv2.imread(path))
+    return tag, emb, status
+
+
+def _worker_embed_bytes(tag, img_bytes):
+    import cv2
+
+    bgr = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    emb, status = _embed_bgr(bgr)
+    return tag, emb, status
+
+
+class TrainEmbedPool:
+    """
+    with TrainEmbedPool(workers) as pool:
+        for tag, emb, status in pool.map_paths([(tag, path), ...]): ...
+        fut = pool.submit_bytes(tag, img_bytes)   # fut.result() -> (tag, emb, status)
+    """
+
+    def __init__(self, workers: int = None, backend: str = None, jitters: int = 0, chunksize: int = 4):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.chunksize = chunksize
+        if self.workers == 1:
+            self.executor = None
+            _worker_init(backend, jitters, False)
+            self.signature = _worker_signature()
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_worker_init,
+                                                initargs=(backend, jitters, True))
+            # also waits for the first worker's models to load
+            self.signature = self.executor.submit(_worker_signature).result()
+
+    def map_paths(self, items):
+        """
+        items: (tag, path) pairs. Yields (tag, embedding, status) in input order.
+        """
+        if self.executor is None:
+            return map(_worker_embed_path, items)
+        return self.executor.map(_worker_embed_path, items, chunksize=self.chunksize)
+
+    def submit_bytes(self, tag, img_bytes) -> Future:
+        if self.executor is None:
+            fut = Future()
+            fut.set_result(_worker_embed_bytes(tag, img_bytes))
+            return fut
+        return self.executor.submit(_worker_embed_bytes, tag, img_bytes)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,85 @@
+# train_prototypes.py
+# Builds / updates prototypes.npz (prototypes.PrototypeClassifier) from the
+# embedding store. Incremental by default: only students whose embeddings
+# changed since the last run are rebuilt, students no longer in the store are
+# removed, everyone else is kept. The similarity -> probability map is fitted
+# on a held-out split on the first run, with --recalibrate, or when the
+# embedder changed; otherwise the saved one is reused.
+#
+# Usage: python train_prototypes.py [--recalibrate] [--rebuild]
+# Then set MATCHER = "prototype" in recognition.py.
+import argparse
+import os
+import time
+from sklearn.model_selection import train_test_split
+
+from embedding_store import EMBEDDING_STORE_DIR, load_embeddings
+from model_artifacts import write_manifest
+from prototypes import PROTOTYPE_FILE, PrototypeClassifier
+
+
+def calibrated(store, names):
+    """
+    Fresh classifier whose probability map is fitted on a 20% held-out split.
+    """
+    X_train, X_test, y_train, y_test = train_test_split(
+        store.embeddings, names, test_size=0.2, stratify=names, random_state=42
+    )
+    held_out = PrototypeClassifier(embedder=store.embedder)
+    held_out.sync(X_train, y_train)
+    report = held_out.calibrate(X_test, y_test)
+    print(f"Calibrated: P = sigmoid({report['a']:.2f} * similarity + {report['b']:.2f})  "
+          f"top-1 accuracy {report['accuracy']:.4f} on {report['samples']} held-out faces")
+    if report.get("accept_rate") is not None:
+        print(f"At P >= {held_out.accept_proba}: accepted {report['accept_rate']:.4f}, "
+              f"accuracy of accepted {report['accepted_accuracy']}")
+    return PrototypeClassifier(held_out.k, held_out.a, held_out.b, held_out.accept_proba, held_out.margin,
+                               embedder=store.embedder)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Incremental prototype classifier from the embedding store")
+    p.add_argument("--recalibrate", action="store_true", help="refit the similarity -> probability map")
+    p.add_argument("--rebuild", action="store_true", help="ignore the existing prototypes.npz")
+    args = p.parse_args()
+
+    print("Loading embeddings...")
+    store = load_embeddings(EMBEDDING_STORE_DIR)
+    names = store.names
+    print("Total embeddings:", len(store))
+    print("Unique students:", len(store.labels))
+
+    model = None
+    if os.path.exists(PROTOTYPE_FILE) and not args.rebuild:
+        model = PrototypeClassifier.load(PROTOTYPE_FILE)
+        if model.embedder != store.embedder:
+            print(f"{PROTOTYPE_FILE} was built from {model.embedder!r} embeddings, store has "
+                  f"{store.embedder!r}: rebuilding")
+            model = None
+
+    t0 = time.perf_counter()
+    if model is None or args.recalibrate:
+        fresh = calibrated(store, names)
+        if model is not None:
+            # keep the existing prototypes, take the new probability map
+            fresh.students = model.students
+        model = fresh
+
+    added, updated, removed = model.sync(store.embeddings, names)
+    train_s = time.perf_counter() - t0
+    print(f"Students: {len(model.students)} | added {len(added)} | updated {len(updated)} | "
+          f"removed {len(removed)} | {train_s:.2f} s")
+    for label, group in (("added", added), ("updated", updated), ("removed", removed)):
+        if group and len(group) <= 20:
+            print(f"  {label}: {', '.join(group)}")
+
+    model.save(PROTOTYPE_FILE)
+    # version bump last: running recognisers hot-reload on the new version
+    manifest = write_manifest("prototype", [PROTOTYPE_FILE], students=int(len(model.students)),
+                              prototypes=int(sum(len(v[0]) for v in model.students.values())),
+                              embedder=store.embedder)
+    print("Saved:", PROTOTYPE_FILE, f"(model version {manifest['version']})")
+
+
+if __name__ == "__main__":
+    main()
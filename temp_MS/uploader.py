@@ -0,0 +1,250 @@
+# uploader.py
+# Non-blocking snapshot uploader for camera clients.
+# - Snapshots are appended to a local SQLite spool first (survives crashes / reboots)
+# - A background thread posts them with a persistent keep-alive HTTP session
+# - Snapshots are posted strictly oldest first: a failed post blocks the whole
+#   queue (one spool-wide exponential backoff) until it succeeds or is rejected
+#   permanently, so the backend never sees an older snapshot after a newer one
+# - Every snapshot carries an Idempotency-Key header so replays are not double-counted
+
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+SPOOL_FILE = "snapshot_spool.db"
+
+REQUEST_TIMEOUT = 8        # seconds per POST (only blocks the uploader thread)
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 300.0
+POLL_SECONDS = 1.0
+
+# statuses that will never succeed on retry (bad payload etc.)
+PERMANENT_FAILURES = {400, 401, 403, 404, 405, 409, 413, 422}
+
+
+class SnapshotSpool:
+    """
+    Append-only spool of pending snapshots. Rows are deleted once the backend
+    accepted them; rows the backend rejects permanently are kept as 'dead'.
+    After a failed post nothing is due until the spool-wide backoff expires;
+    then the same oldest row is tried again.
+    """
+
+    def __init__(self, path: str = SPOOL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._retry_at = 0.0      # nothing is due before this (spool-wide backoff)
+        self._failures = 0        # consecutive failed posts
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idem_key TEXT UNIQUE NOT NULL,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_ts REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_try_ts REAL NOT NULL,  -- unused (spool-wide backoff), kept for existing spool files
+                status TEXT NOT NULL DEFAULT 'pending',
+                last_error TEXT
+            )
+            """
+        )
+
+    def append(self, url: str, payload: dict) -> str:
+        key = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO snapshots (idem_key, url, payload, created_ts, next_try_ts) VALUES (?, ?, ?, ?, ?)",
+                (key, url, json.dumps(payload), now, now),
+            )
+        return key
+
+    def due(self, limit: int = 20):
+        """
+        The oldest pending rows in spool order, or none while backing off.
+        """
+        with self._lock:
+            if time.time() < self._retry_at:
+                return []
+            return self._conn.execute(
+                "SELECT id, idem_key, url, payload, attempts FROM snapshots "
+                "WHERE status = 'pending' ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+    def done(self, row_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM snapshots WHERE id = ?", (row_id,))
+            self._failures = 0
+
+    def retry_later(self, row_id: int, attempts: int, error: str):
+        """
+        Records the failure on the row and pauses the whole spool, so the row
+        stays at the head of the queue.
+        """
+        with self._lock:
+            delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** self._failures))
+            delay *= 0.5 + random.random() / 2.0  # jitter so room PCs don't retry in lockstep
+            self._failures += 1
+            self._retry_at = time.time() + delay
+            self._conn.execute(
+                "UPDATE snapshots SET attempts = ?, last_error = ? WHERE id = ?",
+                (attempts + 1, error[:500], row_id),
+            )
+
+    def dead(self, row_id: int, error: str):
+        with self._lock:
+            self._failures = 0
+            self._conn.execute(
+                "UPDATE snapshots SET status = 'dead', last_error = ? WHERE id = ?",
+                (error[:500], row_id),
+            )
+
+    def replay_now(self):
+        """
+        Ends the backoff: the head of the queue is due immediately.
+        """
+        with self._lock:
+            self._retry_at = 0.0
+            self._failures = 0
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM snapshots WHERE status = 'pending'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SnapshotUploader(threading.Thread):
+    """
+    Background thread draining the spool. submit() only writes to the spool
+    and returns immediately, so the video loop never waits on the network.
+    """
+
+    def __init__(self, spool: SnapshotSpool, timeout: float = REQUEST_TIMEOUT):
+        super().__init__(name="uploader", daemon=True)
+        self.spool = spool
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self._wake = threading.Event()
+        self._stopped = False
+        self._online = True
+
+        # last backend result (read by the render stage / metrics)
+        self.last_status = None
+        self.last_response = None
+        self.last_error = None
+        self.last_ok_ts = None
+        self.sent = 0
+        self.failed = 0
+
+    def submit(self, url: str, payload: dict) -> str:
+        key = self.spool.append(url, payload)
+        self._wake.set()
+        return key
+
+    def queue_depth(self) -> int:
+        return self.spool.pending_count()
+
+    def run(self):
+        while not self._stopped:
+            rows = self.spool.due()
+            if not rows:
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+                continue
+
+            for row_id, key, url, payload, attempts in rows:
+                if self._stopped:
+                    break
+                if not self._post(row_id, key, url, payload, attempts):
+                    # backend unreachable: this row stays at the head, nothing newer is sent before it
+                    break
+
+    def _post(self, row_id, key, url, payload, attempts) -> bool:
+        t0 = time.perf_counter()
+        try:
+            r = self.session.post(
+                url,
+                data=payload,
+                headers={"Content-Type": "application/json", "Idempotency-Key": key},
+                timeout=self.timeout,
+            )
+        except Exception as e:
+            METRICS.observe("post", time.perf_counter() - t0)
+            self._went_offline(f"{type(e).__name__}: {e}")
+            self.spool.retry_later(row_id, attempts, str(e))
+            return False
+
+        METRICS.observe("post", time.perf_counter() - t0)
+        self.last_status = r.status_code
+        print("[BACKEND] status:", r.status_code)
+        print("[BACKEND] body:", r.text[:800])
+
+        if r.ok:
+            self.spool.done(row_id)
+            self.sent += 1
+            self.last_ok_ts = time.time()
+            self.last_error = None
+            try:
+                self.last_response = r.json()
+            except ValueError:
+                self.last_response = None
+            if not self._online:
+                self._online = True
+                print(f"[UPLOAD] Backend reachable again, replaying {self.spool.pending_count()} spooled snapshot(s)")
+                self.spool.replay_now()
+            return True
+
+        self.last_error = f"HTTP {r.status_code}"
+        if r.status_code in PERMANENT_FAILURES:
+            self.failed += 1
+            print(f"[UPLOAD] Snapshot {key} rejected ({r.status_code}), kept in spool as dead")
+            self.spool.dead(row_id, f"HTTP {r.status_code}: {r.text[:200]}")
+            return True
+
+        self._went_offline(self.last_error)
+        self.spool.retry_later(row_id, attempts, self.last_error)
+        return False
+
+    def _went_offline(self, error: str):
+        self.failed += 1
+        self.last_error = error
+        if self._online:
+            self._online = False
+            print(f"[UPLOAD] Backend unreachable ({error}), spooling snapshots to {self.spool.path}")
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Waits up to timeout seconds for the spool to drain. Returns True if empty.
+        """
+        self.spool.replay_now()
+        self._wake.set()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.spool.pending_count() == 0:
+                return True
+            time.sleep(0.2)
+        return self.spool.pending_count() == 0
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()